@@ -34,6 +34,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'corsheaders',  # for handling CORS
     'products',
@@ -146,6 +147,58 @@ AUTH_PASSWORD_VALIDATORS = [
 
 AUTH_USER_MODEL = 'users.User'
 
+# Worker processes serving requests; gunicorn (see Procfile) starts this many
+# unless told otherwise.
+WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', 1))
+
+# Shared cache (e.g. redis://host:6379/0) for all processes. Without it each
+# process gets its own local-memory cache, and whatever is kept in the
+# cache - anonymous carts, the catalog version - isn't seen by other workers
+# (products/checks.py refuses that with more than one worker).
+REDIS_URL = os.environ.get('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        },
+    }
+
+# Product search backend used by product_search / EnhancedProductSearch:
+#   products.search_backends.IndexSearchBackend     in-process token/trigram index
+#   products.search_backends.PostgresSearchBackend  tsvector + pg_trgm (GIN indexed)
+#   products.search_backends.SQLiteFTSSearchBackend FTS5 table for local sqlite databases
+PRODUCT_SEARCH_BACKEND = os.environ.get(
+    'PRODUCT_SEARCH_BACKEND', 'products.search_backends.IndexSearchBackend'
+)
+
+# Search result caches: per-process LRU size, plus an optional shared tier
+# (a CACHES alias) for results computed by other processes. Cached entries are
+# keyed on the catalog version held in the default cache.
+SEARCH_CACHE_SIZE = 1024
+SEARCH_CACHE_SHARED_ALIAS = os.environ.get('SEARCH_CACHE_SHARED_ALIAS') or None
+SEARCH_CACHE_TIMEOUT = 300
+
+# Product detail cache: per-process LRU (entries kept at most
+# PRODUCT_CACHE_LOCAL_TIMEOUT seconds, since invalidation only reaches the
+# local tier of the process that made the change) in front of a shared cache.
+PRODUCT_CACHE_SIZE = 2048
+PRODUCT_CACHE_SHARED_ALIAS = os.environ.get('PRODUCT_CACHE_SHARED_ALIAS', 'default')
+PRODUCT_CACHE_TIMEOUT = 600
+PRODUCT_CACHE_LOCAL_TIMEOUT = 30
+# How long a missing product (404) is remembered, so bursts for it cost one query
+PRODUCT_CACHE_NEGATIVE_TIMEOUT = 5
+
+# Seconds a stock reservation holds stock before release_expired_reservations returns it
+STOCK_RESERVATION_TTL = 15 * 60
+
+# Anonymous carts: 'cache' keeps them in CART_CACHE_ALIAS (which has to be
+# shared by all processes, e.g. Redis; see cart/checks.py) until the visitor
+# logs in or starts checkout; 'db' makes a Cart row on their first change.
+CART_ANONYMOUS_STORAGE = os.environ.get('CART_ANONYMOUS_STORAGE', 'cache' if REDIS_URL else 'db')
+CART_CACHE_ALIAS = os.environ.get('CART_CACHE_ALIAS', 'default')
+CART_CACHE_TIMEOUT = 24 * 60 * 60
+
 # Password Reset Settings
 FRONTEND_URL = 'http://localhost:5173'  # Your React app's URL
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
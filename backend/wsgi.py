@@ -12,3 +12,20 @@ from whitenoise import WhiteNoise
 
 application = get_wsgi_application()
 application = WhiteNoise(application)
+
+# gunicorn doesn't run system checks; refuse to serve with caches that would
+# leave each worker its own copy of shared state (see the apps' checks.py)
+from django.core import checks  # noqa: E402
+from django.core.management.base import SystemCheckError  # noqa: E402
+
+cache_errors = [error for error in checks.run_checks(tags=[checks.Tags.caches]) if error.is_serious()]
+if cache_errors:
+    raise SystemCheckError('\n'.join(str(error) for error in cache_errors))
+
+# Load the product search backend (e.g. the in-memory index) and the suggestion
+# trie before the first request
+from products.search_backends import get_search_backend  # noqa: E402
+from products.suggestions import warm_suggestion_index  # noqa: E402
+
+get_search_backend().warm()
+warm_suggestion_index()
@@ -0,0 +1,124 @@
+"""
+Seeded synthetic catalogs for benchmarking.
+
+``generate_catalog(size, seed)`` fills the (test) database with ``size``
+products plus the categories, colours, sizes, product colours, colour
+images and product sizes that go with them. The same seed always
+produces the same catalog.
+"""
+import random
+
+from django.db import transaction
+
+from products.models import (
+    Category, Color, ProductColor, ProductColorImage, Products, ProductSize, Size,
+)
+
+CATEGORIES = [
+    'Kurta', 'Shalwar Kameez', 'Waistcoat', 'Shirt', 'Trouser',
+    'Polo', 'T-Shirt', 'Sherwani', 'Jacket', 'Unstitched',
+]
+COLORS = [
+    ('Black', '#000000'), ('White', '#FFFFFF'), ('Navy', '#000080'),
+    ('Maroon', '#800000'), ('Olive', '#808000'), ('Beige', '#F5F5DC'),
+    ('Mustard', '#FFDB58'), ('Grey', '#808080'), ('Sky Blue', '#87CEEB'),
+    ('Mint', '#98FF98'), ('Rust', '#B7410E'), ('Charcoal', '#36454F'),
+]
+SIZES = ['XS', 'S', 'M', 'L', 'XL', 'XXL']
+FABRICS = [
+    'cotton', 'linen', 'silk', 'khaddar', 'lawn', 'wash-and-wear', 'karandi',
+    'jacquard', 'chiffon', 'cambric', 'denim', 'velvet', 'wool', 'boski',
+]
+STYLES = [
+    'embroidered', 'printed', 'plain', 'classic', 'slim fit', 'regular fit',
+    'textured', 'striped', 'checked', 'block print', 'festive', 'casual',
+    'formal', 'premium', 'signature', 'limited edition',
+]
+OCCASIONS = ['eid', 'wedding', 'office', 'summer', 'winter', 'weekend', 'festive', 'daily wear']
+DESCRIPTION_TEMPLATES = [
+    'A {style} {fabric} {garment} in {color} for {occasion}.',
+    'Cut from breathable {fabric}, this {garment} has {style} detailing and a relaxed drape.',
+    'Our {style} {garment} pairs soft {fabric} with a tailored silhouette, ideal for {occasion}.',
+    'Finished with {style} accents on the collar and cuffs. Dry clean recommended.',
+    'Lightweight {fabric} that keeps its shape wash after wash.',
+]
+
+CATALOG_SIZES = (1000, 10000, 100000)
+BATCH_SIZE = 2000
+
+
+def _description(rng, garment, fabric, style, color):
+    sentences = rng.sample(DESCRIPTION_TEMPLATES, rng.randint(2, 4))
+    return ' '.join(
+        sentence.format(
+            style=style, fabric=fabric, garment=garment.lower(),
+            color=color.lower(), occasion=rng.choice(OCCASIONS),
+        )
+        for sentence in sentences
+    )
+
+
+@transaction.atomic
+def generate_catalog(size, seed=0):
+    """Create ``size`` products (and their related rows); returns the Products created."""
+    rng = random.Random(seed)
+
+    categories = Category.objects.bulk_create(
+        Category(category=name, slug=f'bench-{name.lower().replace(" ", "-")}')
+        for name in CATEGORIES
+    )
+    colors = Color.objects.bulk_create(Color(name=name, hex_code=hex_code) for name, hex_code in COLORS)
+    sizes = Size.objects.bulk_create(Size(name=name) for name in SIZES)
+
+    products = []
+    for index in range(size):
+        category = rng.choice(categories)
+        fabric = rng.choice(FABRICS)
+        style = rng.choice(STYLES)
+        color = rng.choice(COLORS)[0]
+        original = rng.randrange(1500, 15000, 50)
+        products.append(Products(
+            category=category,
+            name=f'{style.title()} {fabric.title()} {category.category}',
+            slug=f'bench-{seed}-{index}',
+            currentprice=original - rng.randrange(0, original // 2, 50),
+            orignalprice=original,
+            description=_description(rng, category.category, fabric, style, color),
+            is_top_product=rng.random() < 0.05,
+            is_best_seller=rng.random() < 0.05,
+        ))
+
+    created = []
+    for start in range(0, len(products), BATCH_SIZE):
+        batch = Products.objects.bulk_create(products[start:start + BATCH_SIZE])
+        created.extend(batch)
+
+        product_colors, product_sizes = [], []
+        for product in batch:
+            for order, color in enumerate(rng.sample(colors, rng.randint(1, 4))):
+                product_colors.append(ProductColor(product=product, color=color, order=order))
+            for size_obj in rng.sample(sizes, rng.randint(2, 5)):
+                product_sizes.append(ProductSize(product=product, size=size_obj, stock=rng.randint(0, 40)))
+        product_colors = ProductColor.objects.bulk_create(product_colors)
+        ProductSize.objects.bulk_create(product_sizes)
+
+        ProductColorImage.objects.bulk_create(
+            ProductColorImage(
+                product_color=product_color,
+                image=f'product_color_images/bench_{product_color.product_id}_{product_color.color_id}_{order}.webp',
+                is_default=order == 0,
+                order=order,
+            )
+            for product_color in product_colors
+            for order in range(rng.randint(1, 3))
+        )
+
+    return created
+
+
+def vocabulary():
+    """Words a generated catalog is made of, for building query workloads."""
+    words = set()
+    for phrase in CATEGORIES + FABRICS + STYLES + OCCASIONS + [name for name, _ in COLORS]:
+        words.update(phrase.lower().replace('-', ' ').split())
+    return sorted(words)
@@ -0,0 +1,86 @@
+"""
+Micro-benchmark: per-pair fuzzywuzzy scoring vs batched RapidFuzz screening.
+
+    python -m benchmarks.fuzzy_scoring [--sizes 1000 10000 100000] [--repeat 3]
+
+The old path is what EnhancedProductSearch used to do for every product on
+every request: lowercase name and description, then call
+fuzzywuzzy.fuzz.partial_ratio once for each. The new path screens the cached,
+lowercased columns with RapidFuzz and rescores what passes with fuzzywuzzy
+(products.scoring), so both paths find the same matches with the same scores.
+"""
+import argparse
+import random
+import time
+
+from fuzzywuzzy import fuzz as fuzzywuzzy_fuzz
+
+from products.scoring import best_of_columns, prepare
+
+VOCABULARY = (
+    'black white navy maroon olive beige mustard cotton linen silk khaddar '
+    'lawn chiffon kurta shirt shalwar kameez waistcoat trouser summer winter '
+    'embroidered printed plain classic slim regular fit casual formal eid'
+).split()
+
+QUERIES = ['black kurta', 'kurat', 'embroiderd shirt', 'linen', 'slim fit casual']
+THRESHOLD = 70
+
+
+def make_catalog(size, seed=0):
+    rng = random.Random(seed)
+    return [
+        (
+            ' '.join(rng.sample(VOCABULARY, 3)).title(),
+            ' '.join(rng.choices(VOCABULARY, k=rng.randint(15, 40))).capitalize() + '.',
+        )
+        for _ in range(size)
+    ]
+
+
+def old_path(query, catalog):
+    matched = 0
+    for name, description in catalog:
+        name_score = fuzzywuzzy_fuzz.partial_ratio(query.lower(), name.lower())
+        desc_score = fuzzywuzzy_fuzz.partial_ratio(query.lower(), description.lower()) if description else 0
+        if max(name_score, desc_score) >= THRESHOLD:
+            matched += 1
+    return matched
+
+
+def new_path(query, columns):
+    return len(best_of_columns(query, columns, score_cutoff=THRESHOLD))
+
+
+def timed(func, *args, repeat=1):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'products':>10} {'old ms/query':>14} {'new ms/query':>14} {'speedup':>9}")
+    for size in args.sizes:
+        catalog = make_catalog(size)
+        columns = [
+            [prepare(name) for name, _ in catalog],
+            [prepare(description) for _, description in catalog],
+        ]
+        # The old path is slow enough that one run per query is plenty at 100k
+        old_repeat = 1 if size >= 100000 else args.repeat
+        old = sum(timed(old_path, q, catalog, repeat=old_repeat) for q in QUERIES) / len(QUERIES)
+        new = sum(timed(new_path, q, columns, repeat=args.repeat) for q in QUERIES) / len(QUERIES)
+        print(f'{size:>10} {old * 1000:>14.1f} {new * 1000:>14.1f} {old / new:>8.1f}x')
+
+
+if __name__ == '__main__':
+    main()
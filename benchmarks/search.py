@@ -0,0 +1,206 @@
+"""
+Search endpoint benchmark.
+
+    python -m benchmarks.search [--sizes 1000 10000 100000] [--queries 200]
+                                [--seed 0] [--warm-cache] [--output out.json]
+
+For every catalog size this creates a throwaway test database, fills it with
+a seeded synthetic catalog (benchmarks.catalog), and replays a seeded query
+workload (benchmarks.workload) against product_search,
+EnhancedProductSearch and get_search_suggestions through the Django test
+client. For each endpoint it reports p50/p95/p99 latency, SQL queries per
+request and peak Python memory per request. The report is JSON, so two
+commits can be diffed.
+
+Result caches are cleared before every request unless --warm-cache is
+given, so by default the numbers are for computing each result.
+Uses DJANGO_SETTINGS_MODULE (default backend.settings); the configured
+database is never written to, only its test database.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+ENDPOINTS = {
+    'product_search': '/api/products/search/',
+    'enhanced_search': '/api/products/enhanced-search/',
+    'suggestions': '/api/search/suggestions/',
+}
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    rank = max(1, -(-percent * len(ordered) // 100))
+    return ordered[int(rank) - 1]
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def reset_search_state():
+    """Forget every in-process index and cached result."""
+    from products.cache import bump_catalog_version, search_caches
+    from products.search_index import product_index
+    from products.suggestions import suggestion_index
+
+    product_index.clear()
+    suggestion_index.clear()
+    for cache in search_caches.values():
+        cache.clear()
+        cache.reset_stats()
+    bump_catalog_version()
+
+
+def warm_up():
+    """Build the in-process indexes; returns the seconds it took."""
+    from products.search_backends import get_search_backend
+    from products.suggestions import suggestion_index
+
+    start = time.perf_counter()
+    get_search_backend().warm()
+    suggestion_index.ensure_built()
+    return time.perf_counter() - start
+
+
+def measure_endpoint(client, url, workload, warm_cache):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    from products.cache import search_caches
+
+    latencies, query_counts, peaks = [], [], []
+    for _, query in workload:
+        if not warm_cache:
+            for cache in search_caches.values():
+                cache.clear()
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            response = client.get(url, {'q': query})
+            latencies.append((time.perf_counter() - start) * 1000)
+        if response.status_code != 200:
+            raise RuntimeError(f'{url}?q={query!r} returned {response.status_code}')
+        query_counts.append(len(captured.captured_queries))
+
+    # Memory is measured in a separate pass; tracemalloc distorts timings
+    tracemalloc.start()
+    try:
+        for _, query in workload:
+            if not warm_cache:
+                for cache in search_caches.values():
+                    cache.clear()
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            client.get(url, {'q': query})
+            peaks.append((tracemalloc.get_traced_memory()[1] - baseline) / 1024)
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'requests': len(latencies),
+        'latency_ms': {
+            'p50': round(percentile(latencies, 50), 3),
+            'p95': round(percentile(latencies, 95), 3),
+            'p99': round(percentile(latencies, 99), 3),
+            'mean': round(statistics.fmean(latencies), 3),
+            'max': round(max(latencies), 3),
+        },
+        'sql_queries': {
+            'mean': round(statistics.fmean(query_counts), 2),
+            'max': max(query_counts),
+        },
+        'peak_memory_kb': {
+            'p50': round(percentile(peaks, 50), 1),
+            'max': round(max(peaks), 1),
+        },
+    }
+
+
+def run(sizes, query_count, seed, warm_cache):
+    from django.conf import settings
+    from django.core.management import call_command
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import (
+        setup_databases, setup_test_environment, teardown_databases, teardown_test_environment,
+    )
+
+    from .catalog import generate_catalog
+    from .workload import build_workload
+
+    workload = build_workload(query_count, seed)
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'search_backend': settings.PRODUCT_SEARCH_BACKEND,
+            'seed': seed,
+            'queries': query_count,
+            'warm_cache': warm_cache,
+        },
+        'catalogs': {},
+    }
+
+    setup_test_environment()
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        client = Client()
+        for size in sizes:
+            call_command('flush', interactive=False, verbosity=0)
+            start = time.perf_counter()
+            generate_catalog(size, seed)
+            generated = time.perf_counter() - start
+            reset_search_state()
+            result = {
+                'generate_seconds': round(generated, 3),
+                'warm_up_seconds': round(warm_up(), 3),
+                'endpoints': {},
+            }
+            for name, url in ENDPOINTS.items():
+                print(f'  {size} products: {name}', file=sys.stderr)
+                result['endpoints'][name] = measure_endpoint(client, url, workload, warm_cache)
+            report['catalogs'][str(size)] = result
+    finally:
+        teardown_databases(old_config, verbosity=0)
+        teardown_test_environment()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the product search endpoints.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--warm-cache', action='store_true')
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    args = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+    import django
+    django.setup()
+
+    report = run(args.sizes, args.queries, args.seed, args.warm_cache)
+    payload = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as handle:
+            handle.write(payload + '\n')
+    else:
+        print(payload)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""
+Seeded search query workloads.
+
+A workload mixes the kinds of queries the storefront sends: whole words,
+prefixes typed so far, words with a typo, and multi-word phrases.
+"""
+import random
+
+from .catalog import vocabulary
+
+KINDS = ('word', 'prefix', 'typo', 'multi_word')
+LETTERS = 'abcdefghijklmnopqrstuvwxyz'
+
+
+def typo(rng, word):
+    """One random edit: drop, swap, replace or insert a character."""
+    if len(word) < 3:
+        return word + rng.choice(LETTERS)
+    position = rng.randrange(1, len(word) - 1)
+    edit = rng.choice(('drop', 'swap', 'replace', 'insert'))
+    if edit == 'drop':
+        return word[:position] + word[position + 1:]
+    if edit == 'swap':
+        return word[:position - 1] + word[position] + word[position - 1] + word[position + 1:]
+    if edit == 'replace':
+        return word[:position] + rng.choice(LETTERS) + word[position + 1:]
+    return word[:position] + rng.choice(LETTERS) + word[position:]
+
+
+def build_workload(count=200, seed=0):
+    """``count`` ``(kind, query)`` pairs, evenly split across KINDS."""
+    rng = random.Random(seed)
+    words = [word for word in vocabulary() if len(word) >= 3]
+    queries = []
+    for index in range(count):
+        kind = KINDS[index % len(KINDS)]
+        word = rng.choice(words)
+        if kind == 'word':
+            query = word
+        elif kind == 'prefix':
+            query = word[:rng.randint(2, max(2, len(word) - 1))]
+        elif kind == 'typo':
+            query = typo(rng, word)
+        else:
+            query = ' '.join(rng.sample(words, rng.randint(2, 3)))
+        queries.append((kind, query))
+    return queries
@@ -0,0 +1,148 @@
+"""
+Several cart edits in one request.
+
+``apply_operations`` takes a list of operations like::
+
+    {"op": "add", "product_id": 1, "size_id": 2, "color_id": 3, "quantity": 1}
+    {"op": "set", "product_id": 1, "size_id": 2, "color_id": 3, "quantity": 4}
+    {"op": "remove", "product_id": 1, "size_id": 2, "color_id": 3}
+
+with the same meaning as add_to_cart, update_cart_item (a quantity below 1
+removes the line) and remove_cart_item. Every product, size and colour
+referenced is looked up with one ``in_bulk`` each, the operations are played
+against the cart's lines in memory, and the result is written in one
+transaction with one bulk insert, one bulk update and one delete. Either
+every operation applies or none does; a line added by someone else while the
+batch ran makes the insert fail rather than be overwritten.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from products.models import Color, ProductColor, Products, Size
+
+from .models import Cart, CartItem
+
+MAX_OPERATIONS = 100
+OPERATIONS = ('add', 'set', 'remove')
+
+
+class BatchError(Exception):
+    """An operation can't be applied; nothing was written."""
+
+    def __init__(self, index, message, status=400):
+        self.index = index
+        self.status = status
+        super().__init__(message)
+
+
+def _parse(index, operation):
+    if not isinstance(operation, dict) or operation.get('op') not in OPERATIONS:
+        raise BatchError(index, f"op must be one of {', '.join(OPERATIONS)}")
+    try:
+        product_id = int(operation['product_id'])
+        size_id = int(operation['size_id'])
+        color_id = int(operation['color_id']) if operation.get('color_id') else None
+        quantity = int(operation.get('quantity', 1))
+    except KeyError as e:
+        raise BatchError(index, f'{e.args[0]} is required')
+    except (TypeError, ValueError):
+        raise BatchError(index, 'Ids and quantity must be integers')
+    if operation['op'] == 'add' and quantity < 1:
+        raise BatchError(index, 'quantity must be at least 1')
+    return operation['op'], (product_id, size_id, color_id), quantity
+
+
+def _validate(parsed):
+    """Check every referenced product, size and colour exists; returns the products."""
+    product_ids = {key[0] for _, key, _ in parsed}
+    size_ids = {key[1] for _, key, _ in parsed}
+    color_ids = {key[2] for _, key, _ in parsed if key[2] is not None}
+
+    products = Products.objects.only('id', 'currentprice').in_bulk(product_ids)
+    sizes = Size.objects.in_bulk(size_ids)
+    colors = Color.objects.in_bulk(color_ids)
+    product_colors = set(
+        ProductColor.objects.filter(product_id__in=product_ids, color_id__in=color_ids)
+        .values_list('product_id', 'color_id')
+    ) if color_ids else set()
+
+    for index, (op, (product_id, size_id, color_id), _) in enumerate(parsed):
+        if product_id not in products:
+            raise BatchError(index, 'Product not found', status=404)
+        if size_id not in sizes:
+            raise BatchError(index, 'Size not found', status=404)
+        if color_id is not None:
+            if color_id not in colors:
+                raise BatchError(index, 'Color not found', status=404)
+            if op == 'add' and (product_id, color_id) not in product_colors:
+                raise BatchError(index, 'Invalid color for this product')
+    return products
+
+
+def _line_order(line):
+    (product_id, size_id, color_id), _ = line
+    return product_id, size_id, color_id or 0
+
+
+def prepare(operations):
+    """Parse and validate ``operations``; returns them parsed, with the products they reference."""
+    if not isinstance(operations, list) or not operations:
+        raise BatchError(None, 'operations must be a non-empty list')
+    if len(operations) > MAX_OPERATIONS:
+        raise BatchError(None, f'At most {MAX_OPERATIONS} operations per request')
+    parsed = [_parse(index, operation) for index, operation in enumerate(operations)]
+    return parsed, _validate(parsed)
+
+
+def play(parsed, quantities):
+    """Apply parsed operations to ``{(product_id, size_id, color_id): quantity}`` in place."""
+    for index, (op, key, quantity) in enumerate(parsed):
+        if op == 'add':
+            quantities[key] = quantities.get(key, 0) + quantity
+        elif key not in quantities:
+            raise BatchError(index, 'Item not found in cart', status=404)
+        elif op == 'set' and quantity > 0:
+            quantities[key] = quantity
+        else:
+            del quantities[key]
+
+
+def apply_operations(cart, operations):
+    """Apply ``operations`` to ``cart`` all or nothing; raises BatchError."""
+    parsed, products = prepare(operations)
+
+    with transaction.atomic():
+        # Locked so a concurrent add_line can't be overwritten. Lines are locked before the
+        # cart row, as in every other cart write, and in pk order, so writers can't deadlock.
+        existing = {
+            (item.product_id, item.size_id, item.color_id): item
+            for item in CartItem.objects.select_for_update().filter(cart=cart, product_id__in=products).order_by('pk')
+        }
+        quantities = {key: item.quantity for key, item in existing.items()}
+        play(parsed, quantities)
+
+        now = timezone.now()
+        created, updated = [], []
+        for key, quantity in sorted(quantities.items(), key=_line_order):
+            item = existing.get(key)
+            if item is None:
+                product_id, size_id, color_id = key
+                created.append(CartItem(
+                    cart=cart, product_id=product_id, size_id=size_id, color_id=color_id,
+                    quantity=quantity, price=products[product_id].currentprice,
+                ))
+            elif item.quantity != quantity:
+                item.quantity, item.updated_at = quantity, now
+                updated.append(item)
+        removed = [item.pk for key, item in existing.items() if key not in quantities]
+
+        CartItem.objects.bulk_create(created)
+        CartItem.objects.bulk_update(updated, ['quantity', 'updated_at'])
+        # Removed lines come off the totals through the post_delete receiver
+        CartItem.objects.filter(pk__in=removed).delete()
+        # Bulk writes skip CartItem.save, so the rest of the totals change is applied here
+        Cart.add_to_totals(
+            cart.pk, len(created),
+            sum(item.subtotal for item in created)
+            + sum(item.subtotal - item._stored_subtotal for item in updated),
+        )
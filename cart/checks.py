@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core import checks
+
+from products.cache import is_shared_cache
+
+
+@checks.register(checks.Tags.caches)
+def check_cart_cache(app_configs, **kwargs):
+    """Anonymous carts can only live in a cache every worker shares."""
+    if getattr(settings, 'CART_ANONYMOUS_STORAGE', 'db') != 'cache':
+        return []
+    alias = getattr(settings, 'CART_CACHE_ALIAS', 'default')
+    if is_shared_cache(alias):
+        return []
+    return [checks.Error(
+        f"CART_ANONYMOUS_STORAGE is 'cache' but the '{alias}' cache is missing or local to each process, "
+        "so a visitor's cart would depend on which worker served them.",
+        hint="Configure a shared cache (e.g. set REDIS_URL) or set CART_ANONYMOUS_STORAGE to 'db'.",
+        id='cart.E001',
+    )]
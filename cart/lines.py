@@ -0,0 +1,76 @@
+"""
+Adding to a cart line in one statement.
+
+``add_line`` is ``INSERT ... ON CONFLICT ... DO UPDATE SET quantity =
+quantity + EXCLUDED.quantity``: the database either creates the line or adds
+to it atomically, so concurrent adds of the same line neither lose
+increments nor fail on the unique constraint. The conflict target is the
+(cart, product, size, color) unique index, or the partial one on (cart,
+product, size) for lines without a colour. Databases without INSERT ...
+RETURNING fall back to an insert in a savepoint followed by an F()
+increment when the line already exists.
+"""
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Cart, CartItem
+
+UPSERT_SQL = """
+    INSERT INTO {table} (cart_id, product_id, size_id, color_id, quantity, price, created_at, updated_at)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    ON CONFLICT {target} DO UPDATE
+    SET quantity = {table}.quantity + EXCLUDED.quantity, updated_at = EXCLUDED.updated_at
+    RETURNING quantity, price
+"""
+WITH_COLOR = '(cart_id, product_id, size_id, color_id)'
+WITHOUT_COLOR = '(cart_id, product_id, size_id) WHERE color_id IS NULL'
+
+
+def can_upsert():
+    return connection.vendor in ('postgresql', 'sqlite') and connection.features.can_return_columns_from_insert
+
+
+def _upsert(cart_id, product_id, size_id, color_id, quantity, price):
+    now = timezone.now()
+    sql = UPSERT_SQL.format(
+        table=connection.ops.quote_name(CartItem._meta.db_table),
+        target=WITHOUT_COLOR if color_id is None else WITH_COLOR,
+    )
+    price_field, now_field = CartItem._meta.get_field('price'), CartItem._meta.get_field('updated_at')
+    now = now_field.get_db_prep_save(now, connection)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [
+            cart_id, product_id, size_id, color_id, quantity,
+            price_field.get_db_prep_save(price, connection), now, now,
+        ])
+        line_quantity, line_price = cursor.fetchone()
+    # A line that already existed had at least 1, so it now holds more than was added
+    return line_quantity, price_field.to_python(line_price), line_quantity == quantity
+
+
+def _insert_or_increment(cart_id, product_id, size_id, color_id, quantity, price):
+    key = {'cart_id': cart_id, 'product_id': product_id, 'size_id': size_id, 'color_id': color_id}
+    try:
+        with transaction.atomic():
+            CartItem.objects.bulk_create([CartItem(quantity=quantity, price=price, **key)])
+        return quantity, price, True
+    except IntegrityError:
+        CartItem.objects.filter(**key).update(quantity=F('quantity') + quantity, updated_at=timezone.now())
+        line_quantity, line_price = CartItem.objects.filter(**key).values_list('quantity', 'price').get()
+        return line_quantity, line_price, False
+
+
+def add_line(cart_id, product_id, size_id, color_id, quantity, price):
+    """
+    Add ``quantity`` to a cart line, creating it at ``price`` if it isn't there.
+
+    The cart's stored totals move in the same transaction. Returns the line's
+    new quantity and whether it was created.
+    """
+    write = _upsert if can_upsert() else _insert_or_increment
+    with transaction.atomic():
+        line_quantity, line_price, created = write(cart_id, product_id, size_id, color_id, quantity, price)
+        # An existing line keeps the price it was added at
+        Cart.add_to_totals(cart_id, int(created), line_price * quantity)
+    return line_quantity, created
@@ -0,0 +1,28 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from cart.purge import PURGE_BATCH_SIZE, purge_carts
+
+
+class Command(BaseCommand):
+    help = 'Delete anonymous carts whose session expired or is gone, in small id-range batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=PURGE_BATCH_SIZE, help='Cart ids per batch')
+        parser.add_argument('--sleep', type=float, default=0, help='Seconds to wait between batches')
+        parser.add_argument(
+            '--max-age', type=int, default=None,
+            help='Seconds a cart without a session must have gone unchanged before it goes (default: SESSION_COOKIE_AGE)',
+        )
+
+    def handle(self, *args, **options):
+        max_age = timedelta(seconds=options['max_age']) if options['max_age'] is not None else None
+        total_carts = total_items = 0
+        for first_id, last_id, carts, items, seconds in purge_carts(
+            max_age=max_age, batch_size=options['batch_size'], sleep=options['sleep'],
+        ):
+            total_carts += carts
+            total_items += items
+            self.stdout.write(f'ids {first_id}-{last_id}: {carts} carts, {items} items in {seconds * 1000:.0f}ms')
+        self.stdout.write(self.style.SUCCESS(f'Purged {total_carts} carts and {total_items} items'))
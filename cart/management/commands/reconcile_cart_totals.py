@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from cart.totals import RECONCILE_BATCH_SIZE, reconcile_totals
+
+
+class Command(BaseCommand):
+    help = "Recompute the stored item count and total of carts that drifted from their items."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=RECONCILE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        fixed = reconcile_totals(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Reconciled {fixed} carts'))
@@ -1,8 +1,4 @@
-<<<<<<< HEAD
-# Generated by Django 5.2.3 on 2025-06-28 20:49
-=======
 # Generated by Django 5.2.3 on 2025-06-29 08:22
->>>>>>> rollback-initial
 
 from django.db import migrations, models
 
@@ -1,8 +1,4 @@
-<<<<<<< HEAD
-# Generated by Django 5.2.3 on 2025-06-28 20:49
-=======
 # Generated by Django 5.2.3 on 2025-06-29 08:22
->>>>>>> rollback-initial
 
 import django.db.models.deletion
 from django.conf import settings
@@ -32,14 +28,11 @@ class Migration(migrations.Migration):
         ),
         migrations.AddField(
             model_name='cartitem',
-<<<<<<< HEAD
-=======
             name='color',
             field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='products.color'),
         ),
         migrations.AddField(
             model_name='cartitem',
->>>>>>> rollback-initial
             name='product',
             field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='products.products'),
         ),
@@ -50,10 +43,6 @@ class Migration(migrations.Migration):
         ),
         migrations.AlterUniqueTogether(
             name='cartitem',
-<<<<<<< HEAD
-            unique_together={('cart', 'product', 'size')},
-=======
             unique_together={('cart', 'product', 'size', 'color')},
->>>>>>> rollback-initial
         ),
     ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.3 on 2026-10-18 17:41
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_totals(apps, schema_editor):
+    Cart = apps.get_model('cart', 'Cart')
+    CartItem = apps.get_model('cart', 'CartItem')
+    money = models.DecimalField(max_digits=12, decimal_places=2)
+    items = CartItem.objects.filter(cart=OuterRef('pk')).order_by().values('cart')
+    Cart.objects.update(
+        item_count=Coalesce(Subquery(items.annotate(n=Count('pk')).values('n')), 0),
+        total=Coalesce(
+            Subquery(items.annotate(sum=Sum(F('price') * F('quantity'), output_field=money)).values('sum')),
+            Value(Decimal(0)), output_field=money,
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.RunPython(fill_totals, migrations.RunPython.noop),
+    ]
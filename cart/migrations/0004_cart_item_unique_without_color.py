@@ -0,0 +1,50 @@
+# Generated by Django 5.2.3 on 2026-10-18 17:44
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, F, Min, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def merge_duplicate_lines(apps, schema_editor):
+    """Fold colourless lines that the old constraint let through into one line each."""
+    Cart = apps.get_model('cart', 'Cart')
+    CartItem = apps.get_model('cart', 'CartItem')
+    duplicates = (
+        CartItem.objects.filter(color__isnull=True)
+        .values('cart', 'product', 'size')
+        .annotate(lines=Count('pk'), keep=Min('pk'), quantity=Sum('quantity'))
+        .filter(lines__gt=1)
+    )
+    carts = set()
+    for line in duplicates:
+        key = {'cart': line['cart'], 'product': line['product'], 'size': line['size'], 'color__isnull': True}
+        CartItem.objects.filter(pk=line['keep']).update(quantity=line['quantity'])
+        CartItem.objects.filter(**key).exclude(pk=line['keep']).delete()
+        carts.add(line['cart'])
+
+    money = models.DecimalField(max_digits=12, decimal_places=2)
+    items = CartItem.objects.filter(cart=OuterRef('pk')).order_by().values('cart')
+    Cart.objects.filter(pk__in=carts).update(
+        item_count=Coalesce(Subquery(items.annotate(n=Count('pk')).values('n')), 0),
+        total=Coalesce(
+            Subquery(items.annotate(sum=Sum(F('price') * F('quantity'), output_field=money)).values('sum')),
+            Value(Decimal(0)), output_field=money,
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0003_cart_totals'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_lines, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(condition=models.Q(('color__isnull', True)), fields=('cart', 'product', 'size'), name='cart_item_unique_without_color'),
+        ),
+    ]
@@ -1,22 +1,31 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
 from django.conf import settings
+from django.utils import timezone
 from products.models import *  # Your Products model
 
 class Cart(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True)
-    session_key = models.CharField(max_length=40, null=True, blank=True)
+    session_key = models.CharField(max_length=40, null=True, blank=True, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    # Kept up to date by every CartItem write (see add_to_totals), so reading them is free.
+    # reconcile_cart_totals repairs any drift.
+    item_count = models.PositiveIntegerField(default=0)
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
 
     def __str__(self):
         return self.user.username
-    @property
-    def total(self):
-        return sum(item.subtotal for item in self.items.all())
 
-    @property
-    def item_count(self):
-        return self.items.count()
+    @staticmethod
+    def add_to_totals(cart_id, item_count, total):
+        """Shift a cart's stored count and total by a delta, in SQL so concurrent writes add up."""
+        if item_count or total:
+            Cart.objects.filter(pk=cart_id).update(
+                item_count=F('item_count') + item_count,
+                total=F('total') + total,
+                updated_at=timezone.now(),
+            )
     
   
 
@@ -29,8 +38,24 @@ class CartItem(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
-    
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # What this row adds to its cart's total, to work out the change on save
+        if 'quantity' in instance.__dict__ and 'price' in instance.__dict__:
+            instance._stored_subtotal = instance.subtotal
+        return instance
+
+    def save(self, *args, **kwargs):
+        created = self._state.adding
+        stored_subtotal = 0 if created else getattr(self, '_stored_subtotal', None)
+        with transaction.atomic():
+            if stored_subtotal is None:
+                stored_subtotal = CartItem.objects.get(pk=self.pk).subtotal
+            super().save(*args, **kwargs)
+            Cart.add_to_totals(self.cart_id, int(created), self.subtotal - stored_subtotal)
+        self._stored_subtotal = self.subtotal
 
     def __str__(self):
         return self.product.name
@@ -45,4 +70,11 @@ class CartItem(models.Model):
     username.short_description = 'Username'  # Sets the column header in admin
 
     class Meta:
-        unique_together = ('cart', 'product', 'size', 'color')  # Update unique constraint
\ No newline at end of file
+        unique_together = ('cart', 'product', 'size', 'color')  # Update unique constraint
+        constraints = [
+            # NULLs never collide in the unique_together above, so lines without a colour need their own
+            models.UniqueConstraint(
+                fields=['cart', 'product', 'size'], condition=models.Q(color__isnull=True),
+                name='cart_item_unique_without_color',
+            ),
+        ]
\ No newline at end of file
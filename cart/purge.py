@@ -0,0 +1,81 @@
+"""
+Deleting abandoned anonymous carts.
+
+An anonymous Cart is abandoned once its session is gone: it has no session
+key, or - with database-backed sessions - no unexpired django_session row
+has its key. Nobody can reach such a cart again. Sessions roll on every
+request (SESSION_SAVE_EVERY_REQUEST), so a shopper's cart stays however long
+it has gone unchanged. Only carts that also haven't changed for ``max_age``
+go, which leaves alone a cart created in a request whose session row isn't
+written yet. Other session engines can't be checked from the database, so
+there only carts without a session key are purged.
+
+``purge_carts`` walks the cart table in ``id`` ranges of ``batch_size`` and
+deletes the abandoned carts of each range and their items in one short
+transaction, so no lock is held for long, optionally sleeping between
+ranges to leave room for live traffic.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.db import connection, transaction
+from django.db.models import Exists, Max, Min, OuterRef, Q
+from django.utils import timezone
+
+from .models import Cart, CartItem
+
+PURGE_BATCH_SIZE = 1000
+DB_SESSION_ENGINES = ('django.contrib.sessions.backends.db', 'django.contrib.sessions.backends.cached_db')
+
+
+def abandoned_carts(now, max_age):
+    session_gone = Q(session_key__isnull=True)
+    if settings.SESSION_ENGINE in DB_SESSION_ENGINES:
+        live_session = Session.objects.filter(session_key=OuterRef('session_key'), expire_date__gt=now)
+        session_gone |= ~Exists(live_session)
+    return Cart.objects.filter(session_gone, updated_at__lt=now - max_age, user__isnull=True)
+
+
+def delete_rows(model, column, values):
+    """``DELETE ... WHERE column IN values``, without signals or cascades; the row count."""
+    quote = connection.ops.quote_name
+    placeholders = ', '.join(['%s'] * len(values))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {quote(model._meta.db_table)} WHERE {quote(column)} IN ({placeholders})', values)
+        return cursor.rowcount
+
+
+def purge_carts(max_age=None, batch_size=PURGE_BATCH_SIZE, sleep=0, now=None):
+    """
+    Delete abandoned anonymous carts with their items.
+
+    Yields ``(first_id, last_id, carts, items, seconds)`` for each id range
+    that had anything to delete.
+    """
+    now = now or timezone.now()
+    max_age = max_age if max_age is not None else timedelta(seconds=settings.SESSION_COOKIE_AGE)
+    bounds = Cart.objects.filter(user__isnull=True).aggregate(first=Min('pk'), last=Max('pk'))
+    if bounds['first'] is None:
+        return
+
+    for start in range(bounds['first'], bounds['last'] + 1, batch_size):
+        end = start + batch_size - 1
+        began = time.perf_counter()
+        with transaction.atomic():
+            # Locked, so a cart that is written to right now is either kept or waits for this batch
+            pks = list(
+                abandoned_carts(now, max_age).filter(pk__gte=start, pk__lte=end)
+                .select_for_update().values_list('pk', flat=True)
+            )
+            if not pks:
+                continue
+            # Plain deletes: the carts go as well, so their stored totals needn't follow the
+            # items (Cart.delete() would update them once per item through the signal)
+            items = delete_rows(CartItem, CartItem._meta.get_field('cart').column, pks)
+            carts = delete_rows(Cart, Cart._meta.pk.column, pks)
+        yield start, end, carts, items, time.perf_counter() - began
+        if sleep:
+            time.sleep(sleep)
@@ -0,0 +1,21 @@
+from django.contrib.auth.signals import user_logged_in
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .models import Cart, CartItem
+from .storage import CACHE_KEY_SESSION_KEY, CacheCart
+
+
+@receiver(post_delete, sender=CartItem)
+def cart_item_deleted(sender, instance, **kwargs):
+    # Sent inside the delete's transaction, for queryset deletes too
+    Cart.add_to_totals(instance.cart_id, -1, -instance.subtotal)
+
+
+@receiver(user_logged_in)
+def cart_owner_logged_in(sender, request, user, **kwargs):
+    # An anonymous cache cart joins the user's own cart (login keeps the session's data)
+    cart_key = request.session.pop(CACHE_KEY_SESSION_KEY, None) if request is not None else None
+    if cart_key is not None:
+        cart, _ = Cart.objects.get_or_create(user=user)
+        CacheCart(cart_key).persist(cart)
@@ -0,0 +1,81 @@
+"""
+Cart contents and totals in a fixed number of queries.
+
+``cart_snapshot`` is one query for the items and one for the primary image
+of every (product, colour) in the cart, however many items there are. The
+total and item count are stored on the Cart itself (see Cart.add_to_totals),
+so ``cart_totals`` only has to re-read them after a write.
+"""
+from django.db.models import OuterRef, Subquery
+
+from products.lean import MediaURLs
+from products.models import ProductColor, ProductColorImage
+
+from .models import CartItem
+
+ITEM_COLUMNS = (
+    'id', 'product_id', 'product__name', 'price', 'quantity',
+    'size_id', 'size__name', 'color_id', 'color__name',
+)
+
+
+def cart_totals(cart, refresh=False):
+    """``{'total': ..., 'item_count': ...}``; ``refresh`` re-reads them after the cart changed."""
+    if refresh:
+        cart.refresh_from_db(fields=['item_count', 'total'])
+    return {'total': float(cart.total), 'item_count': cart.item_count}
+
+
+def primary_images(product_ids):
+    """
+    ``{(product_id, color_id): image name}`` plus ``{(product_id, None): ...}``.
+
+    A colour's primary image is its first image; a product's (used for items
+    without a colour) is its first colour's first image. Same order as
+    ``colors.first()`` / ``images.first()``, with pk breaking ties.
+    """
+    rows = (
+        ProductColor.objects.filter(product_id__in=product_ids)
+        .order_by('order', 'pk')
+        .annotate(first_image=Subquery(
+            ProductColorImage.objects.filter(product_color=OuterRef('pk'))
+            .order_by('order', 'pk').values('image')[:1]
+        ))
+        .values_list('product_id', 'color_id', 'first_image')
+    )
+    images = {}
+    for product_id, color_id, image in rows:
+        images.setdefault((product_id, color_id), image)
+        images.setdefault((product_id, None), image)
+    return images
+
+
+def item_payloads(rows, request=None):
+    """The cart API's items from ``ITEM_COLUMNS`` tuples, with their primary image URLs."""
+    images = primary_images({row[1] for row in rows}) if rows else {}
+    media = MediaURLs(request)
+
+    items = []
+    for pk, product_id, name, price, quantity, size_id, size_name, color_id, color_name in rows:
+        image = images.get((product_id, color_id))
+        items.append({
+            'id': pk,
+            'product_id': product_id,
+            'name': name,
+            'price': float(price),
+            'quantity': quantity,
+            'size_id': size_id,
+            'size_name': size_name,
+            'color_id': color_id,
+            'color_name': color_name,
+            'image': media.url(image) if image else None,
+        })
+    return items
+
+
+def cart_snapshot(cart, request=None, refresh=False):
+    """The cart's items (with image URLs), total and item count; ``refresh`` as for cart_totals."""
+    rows = list(
+        CartItem.objects.filter(cart=cart).order_by('pk').values_list(*ITEM_COLUMNS)
+    )
+    return {'items': item_payloads(rows, request), **cart_totals(cart, refresh)}
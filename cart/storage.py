@@ -0,0 +1,254 @@
+"""
+Where a visitor's cart lives.
+
+``get_cart_storage(request)`` returns one of two backends with the same
+methods, so the cart views don't care which one they got:
+
+DatabaseCart
+    A Cart row and its CartItems. Used for signed-in users, and for
+    anonymous sessions when CART_ANONYMOUS_STORAGE is 'db', the default unless
+    a shared cache is configured.
+CacheCart
+    For anonymous sessions when CART_ANONYMOUS_STORAGE is 'cache'. The lines
+    are a compact list in CART_CACHE_ALIAS, under a key remembered in the
+    session, so browsing and editing the cart writes nothing to the cart
+    tables (the catalog is still read to validate and display lines). It
+    becomes a Cart only when the visitor signs in, merged into their own
+    cart (see signals.py), or when checkout starts.
+"""
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from products.models import Color, Products, Size
+
+from .batch import apply_operations, play, prepare
+from .lines import add_line
+from .models import Cart, CartItem
+from .snapshot import cart_snapshot, cart_totals, item_payloads
+
+# Session entries: the cache cart's key, and a flag once that cart went to the database
+CACHE_KEY_SESSION_KEY = '_cart_cache_key'
+IN_DB_SESSION_KEY = '_cart_in_db'
+LOCK_TIMEOUT = 5
+
+
+def line_key(product_id, size_id, color_id):
+    return int(product_id), int(size_id), int(color_id) if color_id else None
+
+
+class DatabaseCart:
+    def __init__(self, cart):
+        self.cart = cart
+        # Stored totals are re-read once the cart changed
+        self.changed = False
+
+    def add(self, product_id, size_id, color_id, quantity, price):
+        add_line(self.cart.pk, product_id, size_id, color_id, quantity, price)
+        self.changed = True
+
+    def set_quantity(self, product_id, size_id, color_id, quantity):
+        """Below 1 removes the line; returns False if it isn't in the cart."""
+        try:
+            item = CartItem.objects.get(cart=self.cart, product_id=product_id, size_id=size_id, color_id=color_id)
+        except CartItem.DoesNotExist:
+            return False
+        if quantity < 1:
+            item.delete()
+        else:
+            item.quantity = quantity
+            item.save()
+        self.changed = True
+        return True
+
+    def remove(self, product_id, size_id, color_id):
+        deleted, _ = CartItem.objects.filter(
+            cart=self.cart, product_id=product_id, size_id=size_id, color_id=color_id,
+        ).delete()
+        self.changed = True
+        return deleted > 0
+
+    def apply(self, operations):
+        apply_operations(self.cart, operations)
+        self.changed = True
+
+    def totals(self):
+        return cart_totals(self.cart, refresh=self.changed)
+
+    def snapshot(self, request=None):
+        return cart_snapshot(self.cart, request, refresh=self.changed)
+
+
+class CacheCart:
+    def __init__(self, cart_key):
+        self.cache = caches[getattr(settings, 'CART_CACHE_ALIAS', 'default')]
+        self.key = f'cart:{cart_key}'
+
+    def _lines(self):
+        """``[[product_id, size_id, color_id, quantity, price], ...]`` in the order they were added."""
+        return self.cache.get(self.key) or []
+
+    @contextmanager
+    def _editing(self):
+        """
+        The lines as ``{(product_id, size_id, color_id): [quantity, price]}``,
+        stored back unless the block raises. Edits of one cart take a short
+        cache lock, so double clicks don't lose an update.
+        """
+        lock = f'{self.key}:lock'
+        while not self.cache.add(lock, 1, LOCK_TIMEOUT):
+            time.sleep(0.05)
+        try:
+            lines = {
+                (product_id, size_id, color_id): [quantity, price]
+                for product_id, size_id, color_id, quantity, price in self._lines()
+            }
+            yield lines
+            if lines:
+                self.cache.set(
+                    self.key, [[*key, quantity, price] for key, (quantity, price) in lines.items()],
+                    getattr(settings, 'CART_CACHE_TIMEOUT', 24 * 60 * 60),
+                )
+            else:
+                self.cache.delete(self.key)
+        finally:
+            self.cache.delete(lock)
+
+    def add(self, product_id, size_id, color_id, quantity, price):
+        with self._editing() as lines:
+            line = lines.setdefault(line_key(product_id, size_id, color_id), [0, Decimal(price)])
+            line[0] += quantity
+
+    def set_quantity(self, product_id, size_id, color_id, quantity):
+        """Below 1 removes the line; returns False if it isn't in the cart."""
+        key = line_key(product_id, size_id, color_id)
+        with self._editing() as lines:
+            if key not in lines:
+                return False
+            if quantity < 1:
+                del lines[key]
+            else:
+                lines[key][0] = quantity
+        return True
+
+    def remove(self, product_id, size_id, color_id):
+        with self._editing() as lines:
+            return lines.pop(line_key(product_id, size_id, color_id), None) is not None
+
+    def apply(self, operations):
+        parsed, products = prepare(operations)
+        with self._editing() as lines:
+            quantities = {key: quantity for key, (quantity, _) in lines.items()}
+            play(parsed, quantities)
+            for key in lines.keys() - quantities.keys():
+                del lines[key]
+            for key, quantity in quantities.items():
+                if key in lines:
+                    lines[key][0] = quantity
+                else:
+                    lines[key] = [quantity, Decimal(products[key[0]].currentprice)]
+
+    def totals(self):
+        lines = self._lines()
+        total = sum((quantity * price for _, _, _, quantity, price in lines), Decimal(0))
+        return {'total': float(total), 'item_count': len(lines)}
+
+    def snapshot(self, request=None):
+        lines = self._lines()
+        products = dict(Products.objects.filter(pk__in={line[0] for line in lines}).values_list('id', 'name'))
+        sizes = dict(Size.objects.filter(pk__in={line[1] for line in lines}).values_list('id', 'name'))
+        colors = dict(Color.objects.filter(pk__in={line[2] for line in lines}).values_list('id', 'name'))
+        # Same columns as CartItem rows; lines aren't rows yet, so they have no id
+        rows = [
+            (None, product_id, products[product_id], price, quantity, size_id, sizes.get(size_id), color_id,
+             colors.get(color_id))
+            for product_id, size_id, color_id, quantity, price in lines
+            if product_id in products
+        ]
+        return {'items': item_payloads(rows, request), **self.totals()}
+
+    def persist(self, cart):
+        """Add the lines to ``cart`` (on top of what it already has) and drop the cached copy."""
+        with self._editing() as lines:
+            existing = set(Products.objects.filter(pk__in={key[0] for key in lines}).values_list('pk', flat=True))
+            with transaction.atomic():
+                for (product_id, size_id, color_id), (quantity, price) in lines.items():
+                    if product_id in existing:
+                        add_line(cart.pk, product_id, size_id, color_id, quantity, price)
+            lines.clear()
+
+
+class EmptyCart:
+    """What a visitor without a cart reads; nothing is created until they change it."""
+
+    def totals(self):
+        return {'total': 0.0, 'item_count': 0}
+
+    def snapshot(self, request=None):
+        return {'items': [], **self.totals()}
+
+
+def find_cart(request):
+    """The user's or session's Cart, if there is one; never creates a cart or a session."""
+    if request.user.is_authenticated:
+        return Cart.objects.filter(user=request.user).order_by('pk').first()
+    session_key = request.session.session_key
+    if session_key is None:
+        return None
+    return Cart.objects.filter(session_key=session_key, user=None).order_by('pk').first()
+
+
+def get_or_create_cart(request):
+    """Helper to get or create cart for user/session"""
+    if request.user.is_authenticated:
+        cart, created = Cart.objects.get_or_create(user=request.user)
+    else:
+        if not request.session.session_key:
+            request.session.create()
+        session_key = request.session.session_key
+        cart, created = Cart.objects.get_or_create(session_key=session_key, user=None)
+    return cart
+
+
+def get_cart_storage(request, create=True):
+    """
+    The cart backend for this request's user or session.
+
+    With ``create=False`` (for reads) a visitor who has no cart yet gets an
+    EmptyCart, and neither a session nor a Cart row is made for them.
+    """
+    session = request.session
+    if (
+        request.user.is_authenticated
+        or getattr(settings, 'CART_ANONYMOUS_STORAGE', 'db') != 'cache'
+        or session.get(IN_DB_SESSION_KEY)
+    ):
+        if not create:
+            cart = find_cart(request)
+            return DatabaseCart(cart) if cart else EmptyCart()
+        return DatabaseCart(get_or_create_cart(request))
+    cart_key = session.get(CACHE_KEY_SESSION_KEY)
+    if cart_key is None:
+        if not create:
+            return EmptyCart()
+        if not session.session_key:
+            session.create()
+        # Kept in the session rather than read from session_key, which login changes
+        cart_key = session[CACHE_KEY_SESSION_KEY] = session.session_key
+    return CacheCart(cart_key)
+
+
+def checkout_cart(request, storage):
+    """The Cart row to check out; a cache cart is written to the database first."""
+    if isinstance(storage, DatabaseCart):
+        return storage.cart
+    session = request.session
+    session[IN_DB_SESSION_KEY] = True
+    session.pop(CACHE_KEY_SESSION_KEY, None)
+    cart = get_or_create_cart(request)
+    storage.persist(cart)
+    return cart
@@ -1,3 +1,396 @@
-from django.test import TestCase
+import json
+import sys
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
 
-# Create your tests here.
+from django.core.management import call_command
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
+from django.core.cache import cache as default_cache
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from products.models import Color
+from products.tests import make_catalog
+
+from .checks import check_cart_cache
+from .lines import add_line
+from .models import Cart, CartItem
+from .snapshot import cart_snapshot
+
+
+def fill_cart(cart, products):
+    """One item per product: alternately with its second colour and without a colour."""
+    white = Color.objects.get(name='White')
+    for index, product in enumerate(products):
+        CartItem.objects.create(
+            cart=cart, product=product, size=product.productsize_set.first().size,
+            color=white if index % 2 == 0 else None, quantity=index + 1, price=product.currentprice,
+        )
+
+
+def assert_totals_match_items(test, cart):
+    cart.refresh_from_db()
+    items = list(cart.items.all())
+    test.assertEqual(cart.item_count, len(items))
+    test.assertEqual(cart.total, sum((item.subtotal for item in items), Decimal(0)))
+
+
+def cart_writes(queries):
+    return [
+        query['sql'] for query in queries
+        if 'cart_' in query['sql'] and query['sql'].split()[0] in ('INSERT', 'UPDATE', 'DELETE')
+    ]
+
+
+@override_settings(CART_ANONYMOUS_STORAGE='db')
+class CartSnapshotTests(TestCase):
+    """The cart costs the same number of queries however many items it has."""
+
+    def test_snapshot_queries(self):
+        _, products = make_catalog(8)
+        cart = Cart.objects.create(session_key='snapshot')
+        fill_cart(cart, products[:2])
+        cart.refresh_from_db()
+        with self.assertNumQueries(2):
+            cart_snapshot(cart)
+        fill_cart(cart, products[2:])
+        cart.refresh_from_db()
+        with self.assertNumQueries(2):
+            snapshot = cart_snapshot(cart)
+
+        items = cart.items.order_by('pk')
+        self.assertEqual(snapshot['item_count'], len(items))
+        self.assertEqual(Decimal(str(snapshot['total'])), sum(item.subtotal for item in items))
+        for item, payload in zip(items, snapshot['items']):
+            product_color = (
+                item.product.colors.filter(color=item.color).first() if item.color
+                else item.product.colors.first()
+            )
+            self.assertEqual(payload['image'], product_color.images.first().image.url)
+            self.assertEqual(payload['color_name'], item.color.name if item.color else None)
+
+    def test_cart_endpoint(self):
+        _, products = make_catalog(3)
+        cart = Cart.objects.create(session_key=self.client.session.session_key)
+        fill_cart(cart, products)
+
+        response = self.client.get(reverse('cart-api'))
+        data = response.json()
+        self.assertEqual(data['status'], 'success')
+        self.assertEqual([item['product_id'] for item in data['items']], [product.pk for product in products])
+        self.assertEqual(data['item_count'], 3)
+        self.assertEqual(data['total'], float(sum(item.subtotal for item in cart.items.all())))
+        # The first item has the White colour (see fill_cart)
+        image = products[0].colors.get(color__name='White').images.first().image
+        self.assertEqual(data['items'][0]['image'], response.wsgi_request.build_absolute_uri(image.url))
+
+
+class CartTotalsTests(TestCase):
+    """Cart.item_count / total follow every item write and can be reconciled."""
+
+    def test_item_writes(self):
+        _, products = make_catalog(4)
+        cart = Cart.objects.create(session_key='totals')
+        fill_cart(cart, products)
+        assert_totals_match_items(self, cart)
+
+        item = CartItem.objects.get(cart=cart, product=products[0])
+        item.quantity = 7
+        item.save()
+        assert_totals_match_items(self, cart)
+
+        cart.items.filter(product__in=products[:2]).delete()
+        assert_totals_match_items(self, cart)
+        cart.items.get(product=products[2]).delete()
+        assert_totals_match_items(self, cart)
+
+    def test_reconcile(self):
+        _, products = make_catalog(3)
+        carts = [Cart.objects.create(session_key=f'drift-{index}') for index in range(3)]
+        for cart in carts:
+            fill_cart(cart, products)
+        CartItem.objects.filter(cart=carts[0]).update(quantity=9)
+        Cart.objects.filter(pk=carts[1].pk).update(item_count=0, total=0)
+
+        call_command('reconcile_cart_totals', batch_size=2, stdout=StringIO())
+        for cart in carts:
+            assert_totals_match_items(self, cart)
+
+
+@override_settings(CART_ANONYMOUS_STORAGE='db')
+class CartBatchTests(TestCase):
+    """A batch of cart edits applies all or nothing, at a fixed query cost."""
+
+    def setUp(self):
+        _, self.products = make_catalog(12)
+        self.size = self.products[0].productsize_set.first().size_id
+        self.white = Color.objects.get(name='White').pk
+        self.cart = Cart.objects.create(session_key=self.client.session.session_key)
+
+    def batch(self, operations):
+        return self.client.post(
+            reverse('batch-cart'), json.dumps({'operations': operations}), content_type='application/json',
+        )
+
+    def add(self, product, quantity=1, color=None):
+        return {'op': 'add', 'product_id': product.pk, 'size_id': self.size, 'color_id': color, 'quantity': quantity}
+
+    def test_operations(self):
+        first, second, third = self.products[:3]
+        self.batch([self.add(first, 2), self.add(second), self.add(third, color=self.white)])
+        response = self.batch([
+            self.add(first, 3),
+            {'op': 'set', 'product_id': second.pk, 'size_id': self.size, 'quantity': 5},
+            {'op': 'remove', 'product_id': third.pk, 'size_id': self.size, 'color_id': self.white},
+        ])
+        data = response.json()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(item['product_id'], item['quantity']) for item in data['items']], [(first.pk, 5), (second.pk, 5)])
+        self.assertEqual(data['item_count'], 2)
+        self.assertEqual(data['total'], float(first.currentprice * 5 + second.currentprice * 5))
+        assert_totals_match_items(self, self.cart)
+
+    def test_all_or_nothing(self):
+        self.batch([self.add(self.products[0])])
+        response = self.batch([
+            self.add(self.products[0], 4),
+            {'op': 'set', 'product_id': self.products[1].pk, 'size_id': self.size, 'quantity': 2},
+        ])
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json()['index'], 1)
+        self.assertEqual(list(self.cart.items.values_list('quantity', flat=True)), [1])
+
+        response = self.batch([self.add(self.products[0]), {'op': 'add', 'product_id': 0, 'size_id': self.size}])
+        self.assertEqual((response.status_code, response.json()['index']), (404, 1))
+
+    def test_query_budget(self):
+        def queries(products):
+            with CaptureQueriesContext(connection) as captured:
+                self.batch([self.add(product, color=self.white) for product in products])
+            return len(captured)
+
+        self.assertEqual(queries(self.products[:2]), queries(self.products[2:]))
+
+
+@override_settings(CART_ANONYMOUS_STORAGE='cache')
+class CacheCartTests(TestCase):
+    """Anonymous carts live in the cache until login or checkout."""
+
+    def setUp(self):
+        default_cache.clear()
+        _, self.products = make_catalog(3)
+        self.size = self.products[0].productsize_set.first().size_id
+        self.white = Color.objects.get(name='White').pk
+
+    def post(self, name, data, product=None):
+        url = reverse(name, args=[product.pk]) if product else reverse(name)
+        return self.client.post(url, json.dumps(data), content_type='application/json')
+
+    def test_anonymous_cart_stays_out_of_the_database(self):
+        first, second, third = self.products
+        with CaptureQueriesContext(connection) as captured:
+            self.post('add-to-cart', {'size_id': self.size, 'quantity': 2}, first)
+            self.post('add-to-cart', {'size_id': self.size, 'color_id': self.white}, second)
+            self.post('add-to-cart', {'size_id': self.size}, third)
+            self.post('update-cart-item', {'size_id': self.size, 'color_id': self.white, 'quantity': 4}, second)
+            self.post('remove-cart-item', {'size_id': self.size}, third)
+            self.post('batch-cart', {'operations': [
+                {'op': 'add', 'product_id': first.pk, 'size_id': self.size},
+                {'op': 'add', 'product_id': third.pk, 'size_id': self.size, 'color_id': self.white},
+            ]})
+            data = self.client.get(reverse('cart-api')).json()
+        self.assertEqual(cart_writes(captured), [])
+        self.assertFalse(Cart.objects.exists())
+
+        self.assertEqual(
+            [(item['product_id'], item['color_name'], item['quantity']) for item in data['items']],
+            [(first.pk, None, 3), (second.pk, 'White', 4), (third.pk, 'White', 1)],
+        )
+        self.assertEqual(data['item_count'], 3)
+        self.assertEqual(data['total'], float(first.currentprice * 3 + second.currentprice * 4 + third.currentprice))
+        self.assertTrue(data['items'][1]['image'].endswith(f'{second.slug.split("-")[0]}_1_1_0.webp'))
+
+    def test_login_merges_into_user_cart(self):
+        user = get_user_model().objects.create_user('buyer', password='secret')
+        Cart.objects.create(user=user)
+        CartItem.objects.create(
+            cart=Cart.objects.get(user=user), product=self.products[0], size_id=self.size, quantity=1, price=1000,
+        )
+        self.post('add-to-cart', {'size_id': self.size, 'quantity': 2}, self.products[0])
+        self.post('add-to-cart', {'size_id': self.size}, self.products[1])
+
+        self.client.login(username='buyer', password='secret')
+        cart = Cart.objects.get(user=user)
+        self.assertEqual(
+            list(cart.items.order_by('product_id').values_list('product_id', 'quantity')),
+            [(self.products[0].pk, 3), (self.products[1].pk, 1)],
+        )
+        assert_totals_match_items(self, cart)
+        self.assertEqual(self.client.get(reverse('cart-api')).json()['item_count'], 2)
+
+    def test_checkout_writes_the_cart(self):
+        self.post('add-to-cart', {'size_id': self.size, 'quantity': 2}, self.products[0])
+        response = self.client.post(reverse('reserve-cart'))
+        self.assertEqual(response.json()['reserved'], 1)
+
+        cart = Cart.objects.get(session_key=self.client.session.session_key)
+        self.assertEqual(list(cart.items.values_list('product_id', 'quantity')), [(self.products[0].pk, 2)])
+        # From now on the session's cart is that row
+        self.post('add-to-cart', {'size_id': self.size}, self.products[0])
+        self.assertEqual(self.client.get(reverse('cart-api')).json()['items'][0]['quantity'], 3)
+
+    def test_cache_must_be_shared(self):
+        locmem = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+        shared = {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'cart_cache'}
+        for caches, storage, errors in [
+            ({'default': locmem}, 'cache', ['cart.E001']),
+            ({'default': locmem}, 'db', []),
+            ({'default': shared}, 'cache', []),
+        ]:
+            with self.subTest(caches=caches, storage=storage), \
+                    self.settings(CACHES=caches, CART_ANONYMOUS_STORAGE=storage):
+                self.assertEqual([error.id for error in check_cart_cache(None)], errors)
+
+
+class LazyCartTests(TestCase):
+    """Reading the cart never writes; the cart is made by the first change."""
+
+    def setUp(self):
+        default_cache.clear()
+        _, self.products = make_catalog(1)
+        self.size = self.products[0].productsize_set.first().size_id
+
+    def assertReadOnlyGet(self):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(reverse('cart-api'))
+        writes = [query['sql'] for query in captured if query['sql'].split()[0] in ('INSERT', 'UPDATE', 'DELETE')]
+        self.assertEqual(writes, [])
+        self.assertEqual(response.json(), {'status': 'success', 'items': [], 'total': 0.0, 'item_count': 0})
+        self.assertEqual(list(response.cookies), [])
+
+    def test_first_visit(self):
+        for storage in ('db', 'cache'):
+            with self.subTest(storage=storage), self.settings(CART_ANONYMOUS_STORAGE=storage):
+                self.client.cookies.clear()
+                self.assertReadOnlyGet()
+        self.assertFalse(Cart.objects.exists())
+
+    @override_settings(CART_ANONYMOUS_STORAGE='db')
+    def test_first_change_creates_the_cart(self):
+        self.assertReadOnlyGet()
+        self.client.post(
+            reverse('add-to-cart', args=[self.products[0].pk]), json.dumps({'size_id': self.size}),
+            content_type='application/json',
+        )
+        cart = Cart.objects.get(session_key=self.client.session.session_key)
+        self.assertEqual(cart.item_count, 1)
+        self.assertEqual(self.client.get(reverse('cart-api')).json()['item_count'], 1)
+
+    def test_signed_in_user_without_cart(self):
+        user = get_user_model().objects.create_user('reader', password='secret')
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as captured:
+            data = self.client.get(reverse('cart-api')).json()
+        self.assertEqual(cart_writes(captured), [])
+        self.assertEqual(data['items'], [])
+        self.assertIn('csrf_token', data)
+        self.assertFalse(Cart.objects.exists())
+
+
+@skipUnlessDBFeature('test_db_allows_multiple_connections')
+class AddToCartContentionTests(TransactionTestCase):
+    """Concurrent adds of the same lines never lose an increment."""
+
+    WRITERS = (1, 2, 4, 8)
+    ADDS = 25
+
+    def test_no_lost_updates(self):
+        _, products = make_catalog(2)
+        size = products[0].productsize_set.first().size_id
+        white = Color.objects.get(name='White').pk
+        # Every writer adds to both a coloured and a colourless line of one cart
+        lines = [(products[0], white), (products[1], None)]
+        report = []
+
+        for writers in self.WRITERS:
+            cart = Cart.objects.create(session_key=f'contention-{writers}')
+            errors = []
+
+            def writer():
+                try:
+                    for _ in range(self.ADDS):
+                        for product, color in lines:
+                            add_line(cart.pk, product.pk, size, color, 1, product.currentprice)
+                except Exception as exc:  # surfaced below, threads swallow them
+                    errors.append(exc)
+                finally:
+                    connection.close()
+
+            threads = [threading.Thread(target=writer) for _ in range(writers)]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+
+            self.assertEqual(errors, [])
+            quantities = list(cart.items.order_by('product_id').values_list('quantity', flat=True))
+            self.assertEqual(quantities, [writers * self.ADDS] * len(lines))
+            assert_totals_match_items(self, cart)
+            adds = writers * self.ADDS * len(lines)
+            report.append(f'{writers} writers: {adds} adds in {elapsed:.2f}s ({adds / elapsed:.0f}/s)')
+
+        print('\n' + '\n'.join(report), file=sys.stderr)
+
+
+class PurgeAbandonedCartsTests(TestCase):
+    """Anonymous carts whose session is gone go; live and signed-in carts stay."""
+
+    def test_purge(self):
+        _, products = make_catalog(1)
+        user = get_user_model().objects.create_user('keeper', password='secret')
+        live = self.client.session.session_key
+        old = timezone.now() - timedelta(days=2)
+
+        kept = [
+            Cart.objects.create(user=user),
+            Cart.objects.create(session_key=live),
+            Cart.objects.create(session_key=live),  # unchanged for long, but its session is live
+            Cart.objects.create(session_key='gone'),  # orphaned, but changed just now
+        ]
+        purged = [
+            Cart.objects.create(session_key='gone'),  # orphaned: no such session
+            Cart.objects.create(session_key=None),
+            Cart.objects.create(session_key='expired'),
+        ]
+        Session.objects.create(session_key='expired', session_data='', expire_date=timezone.now() - timedelta(minutes=1))
+        for cart in kept + purged:
+            fill_cart(cart, products)
+        Cart.objects.filter(pk__in=[kept[0].pk, kept[2].pk] + [cart.pk for cart in purged]).update(updated_at=old)
+
+        out = StringIO()
+        call_command('purge_abandoned_carts', batch_size=2, stdout=out)
+        self.assertEqual(set(Cart.objects.values_list('pk', flat=True)), {cart.pk for cart in kept})
+        self.assertEqual(set(CartItem.objects.values_list('cart_id', flat=True)), {cart.pk for cart in kept})
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[-1], 'Purged 3 carts and 3 items')
+        self.assertRegex(lines[0], r'^ids \d+-\d+: \d carts, \d items in \d+ms$')
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.cache')
+    def test_sessions_outside_database(self):
+        # Whether a cache session is live can't be told here, so only keyless carts go
+        old = timezone.now() - timedelta(days=2)
+        kept = Cart.objects.create(session_key='unknown')
+        purged = Cart.objects.create(session_key=None)
+        Cart.objects.update(updated_at=old)
+        call_command('purge_abandoned_carts', stdout=StringIO())
+        self.assertEqual(list(Cart.objects.values_list('pk', flat=True)), [kept.pk])
+        self.assertFalse(Cart.objects.filter(pk=purged.pk).exists())
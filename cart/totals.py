@@ -0,0 +1,51 @@
+"""
+Repair of the item count and total stored on each Cart.
+
+They are maintained incrementally by CartItem writes, so anything that
+bypasses the model (raw SQL, ``update()`` or ``bulk_create`` on items) or
+writes from a stale instance can make them drift. ``reconcile_totals``
+recomputes them from the items, in SQL.
+"""
+from decimal import Decimal
+
+from django.db.models import Count, DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import Cart, CartItem
+
+RECONCILE_BATCH_SIZE = 1000
+
+
+def _item_totals():
+    items = CartItem.objects.filter(cart=OuterRef('pk')).order_by().values('cart')
+    count = Subquery(items.annotate(n=Count('pk')).values('n'))
+    total = Subquery(
+        items.annotate(sum=Sum(F('price') * F('quantity'), output_field=DecimalField(max_digits=12, decimal_places=2)))
+        .values('sum')
+    )
+    return (
+        Coalesce(count, 0),
+        Coalesce(total, Value(Decimal(0)), output_field=DecimalField(max_digits=12, decimal_places=2)),
+    )
+
+
+def reconcile_totals(batch_size=RECONCILE_BATCH_SIZE):
+    """Fix every cart whose stored count or total disagrees with its items; returns how many."""
+    actual_count, actual_total = _item_totals()
+    fixed = 0
+    last_pk = 0
+    while True:
+        pks = list(
+            Cart.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size]
+        )
+        if not pks:
+            return fixed
+        last_pk = pks[-1]
+        drifted = (
+            Cart.objects.filter(pk__in=pks)
+            .annotate(actual_count=actual_count, actual_total=actual_total)
+            .exclude(item_count=F('actual_count'), total=F('actual_total'))
+        )
+        fixed += Cart.objects.filter(pk__in=list(drifted.values_list('pk', flat=True))).update(
+            item_count=actual_count, total=actual_total,
+        )
@@ -6,4 +6,6 @@ urlpatterns = [
     path('api/cart/add/<int:product_id>/', views.add_to_cart, name='add-to-cart'),
     path('api/cart/update/<int:product_id>/', views.update_cart_item, name='update-cart-item'),
     path('api/cart/remove/<int:product_id>/', views.remove_cart_item, name='remove-cart-item'),
+    path('api/cart/batch/', views.batch_cart, name='batch-cart'),
+    path('api/cart/reserve/', views.reserve_cart, name='reserve-cart'),
 ]
\ No newline at end of file
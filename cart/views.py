@@ -3,72 +3,27 @@ from django.views.decorators.http import require_POST, require_GET
 from django.views.decorators.csrf import csrf_exempt
 from django.middleware.csrf import get_token
 import json
-from .models import Cart, CartItem
+from .batch import BatchError
+from .storage import checkout_cart, get_cart_storage
 from products.models import *
-
-def get_or_create_cart(request):
-    """Helper to get or create cart for user/session"""
-    if request.user.is_authenticated:
-        cart, created = Cart.objects.get_or_create(user=request.user)
-    else:
-        if not request.session.session_key:
-            request.session.create()
-        session_key = request.session.session_key
-        cart, created = Cart.objects.get_or_create(session_key=session_key, user=None)
-    return cart
+from products.lean import json_response
+from products.stock import InsufficientStock, reserve
 
 # views.py
 @csrf_exempt
 @require_GET
 def cart_api(request):
-    """Get current cart contents with size info"""
+    """Get current cart contents with size info (read only: no cart or session is created here)"""
     try:
-        cart = get_or_create_cart(request)
-        items = CartItem.objects.filter(cart=cart).select_related('product', 'size', 'color')
-        
-        cart_items = []
-        for item in items:
-            # Get the correct image based on selected color
-            first_image = None
-            try:
-                if item.color:
-                    # Find the ProductColor for this item's product and color
-                    product_color = ProductColor.objects.filter(
-                        product=item.product,
-                        color=item.color
-                    ).first()
-                    
-                    if product_color:
-                        first_image = product_color.images.first()
-                else:
-                    # Fallback to first color's image if no color selected
-                    product_color = item.product.colors.first()
-                    if product_color:
-                        first_image = product_color.images.first()
-                        
-            except Exception as e:
-                print(f"Error getting product image: {e}")
-            
-            cart_items.append({
-                'id': item.id,
-                'product_id': item.product.id,
-                'name': item.product.name,
-                'price': float(item.price),
-                'quantity': item.quantity,
-                'size_id': item.size.id,
-                'size_name': item.size.name,
-                'color_id': item.color.id if item.color else None,
-                'color_name': item.color.name if item.color else None,
-                'image': request.build_absolute_uri(first_image.image.url) if first_image and first_image.image else None,
-            })
+        cart = get_cart_storage(request, create=False)
+        snapshot = cart.snapshot(request)
         
-        return JsonResponse({
-            'status': 'success',
-            'items': cart_items,
-            'total': float(cart.total),
-            'item_count': cart.item_count,
-            'csrf_token': get_token(request)
-        })
+        data = {'status': 'success', **snapshot}
+        # Only signed-in users call the CSRF-protected (SessionAuthentication) endpoints,
+        # so anonymous reads don't set a CSRF cookie
+        if request.user.is_authenticated:
+            data['csrf_token'] = get_token(request)
+        return json_response(data)
     except Exception as e:
         return JsonResponse({
             'status': 'error',
@@ -80,7 +35,7 @@ def cart_api(request):
 @require_POST
 def add_to_cart(request, product_id):
     try:
-        cart = get_or_create_cart(request)
+        cart = get_cart_storage(request)
         data = json.loads(request.body)
         size_id = data.get('size_id')
         color_id = data.get('color_id')  # Add color_id parameter
@@ -101,27 +56,16 @@ def add_to_cart(request, product_id):
                 if not ProductColor.objects.filter(product=product, color=color).exists():
                     return JsonResponse({'status': 'error', 'message': 'Invalid color for this product'}, status=400)
             
-            # Get or create cart item with both size and color
-            item, created = CartItem.objects.get_or_create(
-                cart=cart,
-                product=product,
-                size=size,
-                color=color,  # Add color to the unique together
-                defaults={
-                    'quantity': quantity,
-                    'price': product.currentprice
-                }
-            )
+            if quantity < 1:
+                return JsonResponse({'status': 'error', 'message': 'Quantity must be at least 1'}, status=400)
             
-            if not created:
-                item.quantity += quantity
-                item.save()
+            # Creates the line or adds to it in one statement, so double clicks can't lose an increment
+            cart.add(product.pk, size.pk, color.pk if color else None, quantity, product.currentprice)
                 
             return JsonResponse({
                 'status': 'success',
                 'message': 'Item added to cart',
-                'item_count': cart.item_count,
-                'total': float(cart.total)
+                **cart.totals(),
             })
             
         except Products.DoesNotExist:
@@ -140,68 +84,25 @@ def add_to_cart(request, product_id):
 def update_cart_item(request, product_id):
     """Update cart item quantity"""
     try:
-        cart = get_or_create_cart(request)
+        cart = get_cart_storage(request)
         data = json.loads(request.body)
         quantity = int(data.get('quantity', 1))
         size_id = data.get('size_id')
         color_id = data.get('color_id', None)  # Optional color_id
         
         # Find the specific cart item with product_id, size_id, and color_id
-        try:
-            item = CartItem.objects.get(
-                cart=cart,
-                product_id=product_id,
-                size_id=size_id,
-                color_id=color_id
-            )
-            
-            if quantity < 1:
-                item.delete()
-            else:
-                item.quantity = quantity
-                item.save()
-            
-            return JsonResponse({
-                'status': 'success',
-                'message': 'Cart updated',
-                'total': float(cart.total),
-                'item_count': cart.item_count
-            })
-            
-        except CartItem.DoesNotExist:
+        if not cart.set_quantity(product_id, size_id, color_id, quantity):
             return JsonResponse({
                 'status': 'error',
                 'message': 'Item not found in cart'
             }, status=404)
-        except CartItem.MultipleObjectsReturned:
-            # Handle case where multiple items exist (shouldn't happen with proper constraints)
-            items = CartItem.objects.filter(
-                cart=cart,
-                product_id=product_id,
-                size_id=size_id,
-                color_id=color_id
-            )
-            # Delete all and create a new one with summed quantities
-            total_quantity = sum(item.quantity for item in items)
-            items.delete()
-            
-            if quantity > 0:
-                CartItem.objects.create(
-                    cart=cart,
-                    product_id=product_id,
-                    size_id=size_id,
-                    color_id=color_id,
-                    quantity=total_quantity,
-                    price=items[0].price  # Assuming same price for all
-                )
-            
-            return JsonResponse({
-                'status': 'success',
-                'message': 'Consolidated duplicate items',
-                'total': float(cart.total),
-                'item_count': cart.item_count
-            })
             
+        return JsonResponse({
+            'status': 'success',
+            'message': 'Cart updated',
+            **cart.totals(),
+        })
+        
     except Exception as e:
         return JsonResponse({
             'status': 'error',
@@ -212,20 +113,12 @@ def update_cart_item(request, product_id):
 def remove_cart_item(request, product_id):
     """Remove item from cart"""
     try:
-        cart = get_or_create_cart(request)
+        cart = get_cart_storage(request)
         data = json.loads(request.body)
         size_id = data.get('size_id')
         color_id = data.get('color_id', None)  # Optional color_id
         
-        # Delete all matching items (should be just one due to unique constraint)
-        deleted_count, _ = CartItem.objects.filter(
-            cart=cart,
-            product_id=product_id,
-            size_id=size_id,
-            color_id=color_id
-        ).delete()
-        
-        if deleted_count == 0:
+        if not cart.remove(product_id, size_id, color_id):
             return JsonResponse({
                 'status': 'error',
                 'message': 'Item not found in cart'
@@ -234,10 +127,66 @@ def remove_cart_item(request, product_id):
         return JsonResponse({
             'status': 'success',
             'message': 'Item removed',
-            'total': float(cart.total),
-            'item_count': cart.item_count
+            **cart.totals(),
+        })
+        
+    except Exception as e:
+        return JsonResponse({
+            'status': 'error',
+            'message': str(e)
+        }, status=400)
+@csrf_exempt
+@require_POST
+def batch_cart(request):
+    """Apply several add / set / remove operations at once and return the resulting cart"""
+    try:
+        data = json.loads(request.body)
+        operations = data.get('operations') if isinstance(data, dict) else None
+        cart = get_cart_storage(request)
+        cart.apply(operations)
+        
+        return json_response({
+            'status': 'success',
+            **cart.snapshot(request),
         })
         
+    except json.JSONDecodeError:
+        return JsonResponse({'status': 'error', 'message': 'Invalid JSON'}, status=400)
+    except BatchError as e:
+        return JsonResponse({
+            'status': 'error',
+            'message': str(e),
+            'index': e.index,
+        }, status=e.status)
+    except Exception as e:
+        return JsonResponse({
+            'status': 'error',
+            'message': str(e)
+        }, status=400)
+@csrf_exempt
+@require_POST
+def reserve_cart(request):
+    """Hold stock for every item in the cart (e.g. when checkout starts)"""
+    try:
+        cart = checkout_cart(request, get_cart_storage(request))
+        lines = cart.items.values_list('product_id', 'size_id', 'quantity')
+        reservations = reserve(lines, reference=f'cart:{cart.pk}')
+        
+        return JsonResponse({
+            'status': 'success',
+            'reserved': len(reservations),
+            'expires_at': reservations[0].expires_at if reservations else None,
+        })
+        
+    except InsufficientStock as e:
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Not enough stock',
+            'lines': [
+                {'product_id': product_id, 'size_id': size_id, 'quantity': quantity}
+                for (product_id, size_id), quantity in e.shortages.items()
+            ],
+        }, status=409)
     except Exception as e:
         return JsonResponse({
             'status': 'error',
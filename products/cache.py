@@ -0,0 +1,301 @@
+import hashlib
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.utils import timezone
+
+CATALOG_VERSION_KEY = 'catalog:version'
+CATALOG_MODIFIED_KEY = 'catalog:modified'
+
+# Cache backends whose entries no other process ever sees
+PROCESS_LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def is_shared_cache(alias):
+    """Whether the CACHES ``alias`` is configured and seen by every process."""
+    config = settings.CACHES.get(alias)
+    return config is not None and config['BACKEND'] not in PROCESS_LOCAL_BACKENDS
+
+
+def _initial_version():
+    # Seeded from the clock, so a version lost with the cache is never reused
+    # (ETags are built from it)
+    return int(time.time())
+
+
+def catalog_version():
+    """Current catalog version; every cached catalog payload is keyed on it."""
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        if cache.add(CATALOG_VERSION_KEY, _initial_version(), None):
+            cache.set(CATALOG_MODIFIED_KEY, timezone.now(), None)
+        version = cache.get(CATALOG_VERSION_KEY, 1)
+    return version
+
+
+def catalog_modified():
+    """When the catalog version last changed, or None if that isn't known."""
+    catalog_version()  # initialises both on first use
+    return cache.get(CATALOG_MODIFIED_KEY)
+
+
+def bump_catalog_version():
+    cache.set(CATALOG_MODIFIED_KEY, timezone.now(), None)
+    try:
+        return cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        cache.add(CATALOG_VERSION_KEY, _initial_version(), None)
+        return cache.get(CATALOG_VERSION_KEY, 1)
+
+
+class LRUCache:
+    """Thread-safe, size-bounded in-process LRU; entries may have a timeout in seconds."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                expires, value = self._data[key]
+            except KeyError:
+                return default
+            if expires is not None and expires <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        expires = time.monotonic() + timeout if timeout is not None else None
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class TieredCache:
+    """
+    Per-process LRU in front of an optional shared Django cache.
+
+    Keys are prefixed with the catalog version, so bumping the version
+    invalidates every entry in both tiers at once. Hit counters per tier are
+    kept for sizing the cache (see ``stats``).
+
+    ``local_timeout`` bounds how long a process keeps serving an entry that
+    was deleted elsewhere, for caches invalidated per key rather than by
+    version. ``jitter`` spreads timeouts by up to that fraction either way,
+    so entries filled together don't all expire together. With
+    ``single_flight``, concurrent misses for a key wait for one computation
+    instead of all running it: threads in this process via a per-key lock
+    held by the thread that missed first, other processes via a lease in the
+    shared cache. A computed None (e.g. a product that doesn't exist) is
+    kept for ``negative_timeout`` seconds, if set, so misses for it are
+    coalesced too.
+    """
+
+    _missing = object()
+    # How long a process may hold a shared-cache lease while computing
+    LEASE_TIMEOUT = 10
+    LEASE_POLL_INTERVAL = 0.05
+
+    def __init__(self, prefix, max_size, shared_alias=None, timeout=None,
+                 local_timeout=None, jitter=0, single_flight=False, negative_timeout=None):
+        self.prefix = prefix
+        self.local = LRUCache(max_size)
+        self.shared_alias = shared_alias
+        self.timeout = timeout
+        self.local_timeout = local_timeout
+        self.jitter = jitter
+        self.single_flight = single_flight
+        self.negative_timeout = negative_timeout
+        self._counts = {'local_hits': 0, 'shared_hits': 0, 'misses': 0}
+        self._counts_lock = threading.Lock()
+        self._flights = {}
+        self._flights_lock = threading.Lock()
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias] if self.shared_alias else None
+
+    def _count(self, name):
+        with self._counts_lock:
+            self._counts[name] += 1
+
+    def _jittered(self, timeout):
+        if timeout is None or not self.jitter:
+            return timeout
+        return timeout * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def make_key(self, *parts):
+        # Hashed so free-text parts are safe for any cache backend
+        digest = hashlib.sha1(repr(parts).encode()).hexdigest()
+        return f'{self.prefix}:{catalog_version()}:{digest}'
+
+    def _lookup(self, key):
+        value = self.local.get(key, self._missing)
+        if value is not self._missing:
+            self._count('local_hits')
+            return value
+
+        shared = self.shared
+        if shared is not None:
+            value = shared.get(key, self._missing)
+            if value is not self._missing:
+                self._count('shared_hits')
+                self.local.set(key, value, self._jittered(self.local_timeout))
+                return value
+        return self._missing
+
+    def _store(self, key, value):
+        if value is None:
+            if self.negative_timeout is None:
+                return
+            local_timeout = shared_timeout = self.negative_timeout
+            if self.local_timeout is not None:
+                local_timeout = min(local_timeout, self.local_timeout)
+        else:
+            local_timeout, shared_timeout = self.local_timeout, self.timeout
+        self.local.set(key, value, self._jittered(local_timeout))
+        shared = self.shared
+        if shared is not None:
+            shared.set(key, value, self._jittered(shared_timeout))
+
+    def get_or_set(self, key, compute):
+        """
+        The cached value for ``key``, computing and storing it on a miss.
+
+        A computed None is returned, and only stored for ``negative_timeout``.
+        """
+        value = self._lookup(key)
+        if value is not self._missing:
+            return value
+        if not self.single_flight:
+            self._count('misses')
+            value = compute()
+            self._store(key, value)
+            return value
+
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                # This thread leads: the others wait until it lets go
+                flight = self._flights[key] = threading.Lock()
+                flight.acquire()
+                leader = True
+            else:
+                leader = False
+        if not leader:
+            with flight:
+                pass
+            # Filled by the leader, unless it failed or the value isn't kept
+            value = self._lookup(key)
+            if value is not self._missing:
+                return value
+            self._count('misses')
+            return compute()
+
+        try:
+            # Filled by another thread between the lookup and taking the lead
+            value = self._lookup(key)
+            if value is not self._missing:
+                return value
+            self._count('misses')
+            value = self._compute_once(key, compute)
+            self._store(key, value)
+            return value
+        finally:
+            with self._flights_lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            flight.release()
+
+    def _compute_once(self, key, compute):
+        shared = self.shared
+        if shared is None:
+            return compute()
+        lease = f'{key}:lease'
+        deadline = time.monotonic() + self.LEASE_TIMEOUT
+        # Another process is computing it: wait for its result, within reason
+        while not shared.add(lease, 1, self.LEASE_TIMEOUT):
+            if time.monotonic() >= deadline:
+                return compute()
+            time.sleep(self.LEASE_POLL_INTERVAL)
+            value = shared.get(key, self._missing)
+            if value is not self._missing:
+                return value
+        try:
+            return compute()
+        finally:
+            shared.delete(lease)
+
+    def delete(self, key):
+        """Drop ``key`` from both tiers (other processes' LRUs keep it up to ``local_timeout``)."""
+        self.local.delete(key)
+        shared = self.shared
+        if shared is not None:
+            shared.delete(key)
+
+    def stats(self):
+        with self._counts_lock:
+            counts = dict(self._counts)
+        lookups = sum(counts.values())
+        hits = counts['local_hits'] + counts['shared_hits']
+        return {
+            **counts,
+            'lookups': lookups,
+            'hit_ratio': hits / lookups if lookups else 0.0,
+            'local_hit_ratio': counts['local_hits'] / lookups if lookups else 0.0,
+            'local_size': len(self.local),
+            'local_max_size': self.local.max_size,
+        }
+
+    def reset_stats(self):
+        with self._counts_lock:
+            for name in self._counts:
+                self._counts[name] = 0
+
+    def clear(self):
+        self.local.clear()
+
+
+def normalize_query(query):
+    """Casefolded and whitespace-collapsed, as used in search cache keys."""
+    return ' '.join(query.casefold().split())
+
+
+def _search_cache(endpoint):
+    return TieredCache(
+        f'search:{endpoint}',
+        max_size=getattr(settings, 'SEARCH_CACHE_SIZE', 1024),
+        shared_alias=getattr(settings, 'SEARCH_CACHE_SHARED_ALIAS', None),
+        timeout=getattr(settings, 'SEARCH_CACHE_TIMEOUT', 300),
+    )
+
+
+# One cache per search endpoint, so hit ratios can be read separately
+search_caches = {
+    endpoint: _search_cache(endpoint)
+    for endpoint in ('product_search', 'enhanced_search', 'suggestions')
+}
@@ -0,0 +1,47 @@
+from django.conf import settings
+from django.db.models import Count, Max, Min, Q
+
+from .cache import TieredCache
+from .models import Category
+
+category_cache = TieredCache(
+    'categories',
+    max_size=8,
+    shared_alias=getattr(settings, 'SEARCH_CACHE_SHARED_ALIAS', None),
+    timeout=getattr(settings, 'SEARCH_CACHE_TIMEOUT', 300),
+)
+
+
+def _summaries():
+    # Sizes join in one row per product size, hence the distinct counts
+    in_stock = Q(products__productsize__is_active=True, products__productsize__stock__gt=0)
+    rows = (
+        Category.objects
+        .annotate(
+            product_count=Count('products', distinct=True),
+            min_price=Min('products__currentprice'),
+            max_price=Max('products__currentprice'),
+            in_stock_count=Count('products', filter=in_stock, distinct=True),
+        )
+        .order_by('pk')
+        .values_list('id', 'category', 'slug', 'product_count', 'min_price', 'max_price', 'in_stock_count')
+    )
+    return [
+        {
+            'id': pk, 'category': category, 'slug': slug,
+            'product_count': product_count, 'min_price': min_price, 'max_price': max_price,
+            'in_stock_count': in_stock_count,
+        }
+        for pk, category, slug, product_count, min_price, max_price, in_stock_count in rows
+    ]
+
+
+def category_summaries():
+    """
+    Every category with its product count, currentprice range and count of
+    products with a size in stock, from one aggregate query.
+
+    Cached whole against the catalog version, which every product, size and
+    category change bumps (see signals.py).
+    """
+    return category_cache.get_or_set(category_cache.make_key('summaries'), _summaries)
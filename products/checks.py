@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core import checks
+
+from .cache import is_shared_cache
+
+
+@checks.register(checks.Tags.caches)
+def check_catalog_cache(app_configs, **kwargs):
+    """
+    With several workers the default cache has to be shared: it holds the
+    catalog version, which is how one worker's catalog writes reach the
+    others' caches, ETags and search structures (see mirror.py).
+    """
+    if getattr(settings, 'WEB_CONCURRENCY', 1) <= 1 or is_shared_cache('default'):
+        return []
+    return [checks.Error(
+        f"WEB_CONCURRENCY is {settings.WEB_CONCURRENCY} but the default cache is local to each process, "
+        "so catalog changes would only be seen by the worker that made them.",
+        hint='Configure a shared default cache (e.g. set REDIS_URL) or run a single worker.',
+        id='products.E001',
+    )]
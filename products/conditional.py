@@ -0,0 +1,46 @@
+"""
+ETag / Last-Modified validators for the catalog endpoints.
+
+Used through ``django.views.decorators.http.condition``, which answers
+If-None-Match / If-Modified-Since with a 304 before the view runs. Listings
+are validated against the catalog version, which lives in the cache, so a
+304 costs no query at all. A product is validated against the ETag and
+Last-Modified kept with its cached detail entry (see detail_cache.py).
+"""
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+
+from .cache import catalog_modified, catalog_version
+from .detail_cache import product_detail
+
+
+def catalog_etag(request, *args, **kwargs):
+    return f'catalog-{catalog_version()}'
+
+
+def catalog_last_modified(request, *args, **kwargs):
+    return catalog_modified()
+
+
+def product_entry(request, pk):
+    """The product's cached DetailEntry, looked up once per request."""
+    if not hasattr(request, '_product_entry'):
+        request._product_entry = product_detail(pk)
+    return request._product_entry
+
+
+def product_etag(request, pk):
+    entry = product_entry(request, pk)
+    return entry.etag if entry else None
+
+
+def product_last_modified(request, pk):
+    entry = product_entry(request, pk)
+    return entry.last_modified if entry else None
+
+
+# For the get() of APIViews
+catalog_conditional = method_decorator(
+    condition(etag_func=catalog_etag, last_modified_func=catalog_last_modified), name='get')
+product_conditional = method_decorator(
+    condition(etag_func=product_etag, last_modified_func=product_last_modified), name='get')
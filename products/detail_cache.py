@@ -0,0 +1,71 @@
+"""
+Read-through cache of product detail responses.
+
+An entry is a product's stored document plus the ETag and Last-Modified
+built from it, so a cached product page (or its 304) needs no query. It
+lives in a size-bounded per-process LRU in front of a shared Django cache.
+Concurrent misses for one product are coalesced into a single rebuild,
+timeouts are jittered (see TieredCache), and a product that doesn't exist
+is remembered as missing for PRODUCT_CACHE_NEGATIVE_TIMEOUT seconds. Entries are keyed by product
+rather than catalog version, so signals delete them when the product or
+anything in its payload changes; other processes' LRUs notice within
+PRODUCT_CACHE_LOCAL_TIMEOUT.
+"""
+from typing import NamedTuple
+
+from django.conf import settings
+
+from .cache import TieredCache
+from .documents import rebuild_documents
+from .models import Products
+
+product_cache = TieredCache(
+    'product',
+    max_size=getattr(settings, 'PRODUCT_CACHE_SIZE', 2048),
+    shared_alias=getattr(settings, 'PRODUCT_CACHE_SHARED_ALIAS', None),
+    timeout=getattr(settings, 'PRODUCT_CACHE_TIMEOUT', 600),
+    local_timeout=getattr(settings, 'PRODUCT_CACHE_LOCAL_TIMEOUT', 30),
+    jitter=0.1,
+    single_flight=True,
+    # A product that doesn't exist (yet); creating it deletes the entry
+    negative_timeout=getattr(settings, 'PRODUCT_CACHE_NEGATIVE_TIMEOUT', 5),
+)
+
+
+class DetailEntry(NamedTuple):
+    etag: str
+    last_modified: object
+    body: str
+
+
+def product_key(pk):
+    return f'product:{pk}'
+
+
+def _load(pk):
+    row = (
+        Products.objects.filter(pk=pk)
+        .values_list('updated_at', 'document__updated_at', 'document__detail')
+        .first()
+    )
+    if row is None:
+        return None
+    updated, rendered, body = row
+    if body is None:
+        document = rebuild_documents([pk]).get(pk)
+        if document is None:
+            return None
+        rendered, body = document.updated_at, document.detail
+    # Changes with the product and with its re-rendered document
+    etag = f'product-{pk}-{int(updated.timestamp() * 1000000)}-{int(rendered.timestamp() * 1000000)}'
+    return DetailEntry(etag, max(updated, rendered), body)
+
+
+def product_detail(pk):
+    """The DetailEntry for a product, or None if it doesn't exist."""
+    return product_cache.get_or_set(product_key(pk), lambda: _load(pk))
+
+
+def invalidate_products(pks):
+    for pk in pks:
+        product_cache.delete(product_key(pk))
@@ -0,0 +1,117 @@
+"""
+Materialized product documents.
+
+Each product's ProductSerializer payload, and its card projection, is
+rendered to JSON once and stored in ProductDocument. The catalog endpoints
+splice the stored JSON into their responses instead of running the
+serializers per request. Documents are re-rendered by signals when a
+product or anything in its payload changes (see signals.py), and in bulk
+by ``manage.py rebuild_product_documents``.
+
+Image URLs are stored as the serializers render them without a request;
+``absolutize`` makes them absolute for a given request the same way
+``ProductColorImageSerializer`` does.
+"""
+import json
+import re
+
+from django.http import HttpResponse
+
+from .models import ProductDocument, Products
+from .serializers import CARD_FIELDS, ProductSerializer, SparseProductSerializer
+
+VARIANTS = ('detail', 'card')
+REBUILD_BATCH_SIZE = 500
+
+_IMAGE_URL = re.compile(r'"image_url":"((?:[^"\\]|\\.)*)"')
+
+
+def _dumps(data):
+    # Same output as DRF's JSONRenderer
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+
+def _card_image(product):
+    # First image of the first colour, as with_card_image() picks it
+    for product_color in product.colors.all():
+        for image in product_color.images.all():
+            return image.image.name
+    return None
+
+
+def render_document(product):
+    """Unsaved ProductDocument for a product loaded with ``with_catalog()``."""
+    product.card_image = _card_image(product)
+    return ProductDocument(
+        product=product,
+        detail=_dumps(ProductSerializer(product).data),
+        card=_dumps(SparseProductSerializer(product, fields=CARD_FIELDS).data),
+    )
+
+
+def rebuild_documents(pks=None, batch_size=REBUILD_BATCH_SIZE):
+    """
+    Re-render and store the documents of ``pks`` (every product if None).
+
+    Returns ``{pk: ProductDocument}`` for the products that still exist;
+    each batch costs the four catalog queries plus one upsert.
+    """
+    if pks is None:
+        ids = list(Products.objects.order_by('pk').values_list('pk', flat=True))
+    else:
+        ids = sorted(pks)
+
+    documents = {}
+    for start in range(0, len(ids), batch_size):
+        batch = Products.objects.with_catalog().filter(pk__in=ids[start:start + batch_size])
+        rendered = [render_document(product) for product in batch]
+        ProductDocument.objects.bulk_create(
+            rendered,
+            update_conflicts=True,
+            unique_fields=['product'],
+            update_fields=['detail', 'card', 'updated_at'],
+        )
+        documents.update((document.product_id, document) for document in rendered)
+    return documents
+
+
+def fill_missing(rows, variant):
+    """
+    ``rows`` of (pk, document or None) -> documents, rendering any not built yet.
+    """
+    missing = [pk for pk, document in rows if document is None]
+    built = rebuild_documents(missing) if missing else {}
+    return [
+        document if document is not None else getattr(built[pk], variant)
+        for pk, document in rows
+        if document is not None or pk in built
+    ]
+
+
+def json_array(documents):
+    return '[' + ','.join(documents) + ']'
+
+
+def absolutize(body, request):
+    """Make the image URLs in ``body`` absolute for ``request``."""
+    if request is None:
+        return body
+    urls = {}
+
+    def replace(match):
+        url = match.group(1)
+        if url not in urls:
+            absolute = request.build_absolute_uri(json.loads(f'"{url}"'))
+            urls[url] = f'"image_url":{_dumps(absolute)}'
+        return urls[url]
+
+    return _IMAGE_URL.sub(replace, body)
+
+
+def document_response(body, request=None, status=200):
+    """A JSON response of pre-rendered ``body``, with absolute image URLs for ``request``."""
+    return HttpResponse(
+        absolutize(body, request).encode(),
+        content_type='application/json',
+        status=status,
+    )
@@ -0,0 +1,174 @@
+from django.conf import settings
+from django.db.models import Count, Q
+
+from .cache import TieredCache
+from .models import Category, Color, Products, Size
+
+# (key, min inclusive, max exclusive or None)
+PRICE_BANDS = (
+    ('0-1000', 0, 1000),
+    ('1000-2500', 1000, 2500),
+    ('2500-5000', 2500, 5000),
+    ('5000+', 5000, None),
+)
+PRICE_BAND_KEYS = {key for key, _, _ in PRICE_BANDS}
+
+facet_cache = TieredCache(
+    'facets',
+    max_size=getattr(settings, 'FACET_CACHE_SIZE', 256),
+    shared_alias=getattr(settings, 'SEARCH_CACHE_SHARED_ALIAS', None),
+    timeout=getattr(settings, 'SEARCH_CACHE_TIMEOUT', 300),
+)
+
+
+def _ids(value):
+    """'1,2,3' -> [1, 2, 3]; ValueError on anything else."""
+    return [int(part) for part in value.split(',') if part.strip()] if value else []
+
+
+def _price_q(band_keys):
+    q = Q()
+    for key, low, high in PRICE_BANDS:
+        if key in band_keys:
+            band = Q(currentprice__gte=low)
+            if high is not None:
+                band &= Q(currentprice__lt=high)
+            q |= band
+    return q
+
+
+class FacetedQuery:
+    """
+    A product listing filtered by facets, with counts for every facet value.
+
+    Counts are disjunctive: each facet's counts apply every other active
+    filter but not its own, so selecting "M" still shows how many products
+    come in "L". All counts, and the filtered total, come from a single
+    aggregate query of conditional ``Count``s over the ProductSize,
+    ProductColor and Category joins.
+    """
+
+    def __init__(self, categories=(), sizes=(), colors=(), prices=(),
+                 is_top=False, is_best=False, pks=None):
+        self.categories = list(categories)
+        self.sizes = list(sizes)
+        self.colors = list(colors)
+        self.prices = [key for key in prices if key in PRICE_BAND_KEYS]
+        self.is_top = is_top
+        self.is_best = is_best
+        # Restricts everything to these products (e.g. search matches)
+        self.pks = pks
+
+    @classmethod
+    def from_params(cls, params, pks=None):
+        """Build from query parameters; ValueError on malformed ids."""
+        return cls(
+            categories=_ids(params.get('category')),
+            sizes=_ids(params.get('size')),
+            colors=_ids(params.get('color')),
+            prices=[key for key in params.get('price', '').split(',') if key],
+            is_top=bool(params.get('is_top')),
+            is_best=bool(params.get('is_best')),
+            pks=pks,
+        )
+
+    def _conditions(self):
+        conditions = {}
+        if self.categories:
+            conditions['category'] = Q(category_id__in=self.categories)
+        if self.sizes:
+            conditions['size'] = Q(productsize__size_id__in=self.sizes, productsize__is_active=True)
+        if self.colors:
+            conditions['color'] = Q(colors__color_id__in=self.colors, colors__is_active=True)
+        if self.prices:
+            conditions['price'] = _price_q(self.prices)
+        if self.is_top:
+            conditions['is_top_product'] = Q(is_top_product=True)
+        if self.is_best:
+            conditions['is_best_seller'] = Q(is_best_seller=True)
+        return conditions
+
+    def _filter(self, exclude=None):
+        q = Q()
+        for name, condition in self._conditions().items():
+            if name != exclude:
+                q &= condition
+        return q
+
+    def base_queryset(self):
+        queryset = Products.objects.all()
+        if self.pks is not None:
+            queryset = queryset.filter(pk__in=self.pks)
+        return queryset
+
+    def queryset(self):
+        """The filtered products (may need ``.distinct()`` for size/colour filters)."""
+        queryset = self.base_queryset().filter(self._filter())
+        if self.sizes or self.colors:
+            queryset = queryset.distinct()
+        return queryset
+
+    def _is_cacheable(self):
+        # Plain (optionally category-scoped) listings are hot and depend only on the catalog
+        return self.pks is None and set(self._conditions()) <= {'category'}
+
+    def facet_counts(self):
+        """``(total, facets)`` from one aggregate query."""
+        if self._is_cacheable():
+            key = facet_cache.make_key(sorted(self.categories))
+            return facet_cache.get_or_set(key, self._facet_counts)
+        return self._facet_counts()
+
+    @staticmethod
+    def _dimensions():
+        return (
+            list(Category.objects.values_list('id', 'category')),
+            list(Size.objects.filter(is_active=True).values_list('id', 'name')),
+            list(Color.objects.values_list('id', 'name', 'hex_code')),
+        )
+
+    def _facet_counts(self):
+        # The facet values themselves only change with the catalog
+        categories, sizes, colors = facet_cache.get_or_set(
+            facet_cache.make_key('dimensions'), self._dimensions)
+
+        def count(condition, facet):
+            return Count('pk', distinct=True, filter=condition & self._filter(exclude=facet))
+
+        aggregates = {'total': Count('pk', distinct=True, filter=self._filter())}
+        for category_id, _ in categories:
+            aggregates[f'category_{category_id}'] = count(Q(category_id=category_id), 'category')
+        for size_id, _ in sizes:
+            aggregates[f'size_{size_id}'] = count(
+                Q(productsize__size_id=size_id, productsize__is_active=True), 'size')
+        for color_id, _, _ in colors:
+            aggregates[f'color_{color_id}'] = count(
+                Q(colors__color_id=color_id, colors__is_active=True), 'color')
+        for index, (key, _, _) in enumerate(PRICE_BANDS):
+            aggregates[f'price_{index}'] = count(_price_q([key]), 'price')
+        aggregates['top_products'] = count(Q(is_top_product=True), 'is_top_product')
+        aggregates['best_sellers'] = count(Q(is_best_seller=True), 'is_best_seller')
+
+        counts = self.base_queryset().aggregate(**aggregates)
+
+        facets = {
+            'category': [
+                {'id': category_id, 'name': name, 'count': counts[f'category_{category_id}']}
+                for category_id, name in categories
+            ],
+            'size': [
+                {'id': size_id, 'name': name, 'count': counts[f'size_{size_id}']}
+                for size_id, name in sizes
+            ],
+            'color': [
+                {'id': color_id, 'name': name, 'hex_code': hex_code, 'count': counts[f'color_{color_id}']}
+                for color_id, name, hex_code in colors
+            ],
+            'price': [
+                {'key': key, 'min': low, 'max': high, 'count': counts[f'price_{index}']}
+                for index, (key, low, high) in enumerate(PRICE_BANDS)
+            ],
+            'is_top_product': counts['top_products'],
+            'is_best_seller': counts['best_sellers'],
+        }
+        return counts['total'], facets
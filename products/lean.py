@@ -0,0 +1,138 @@
+"""
+Serializer-free payload builders for the hot catalog endpoints.
+
+These produce exactly what ProductSerializer and CategorySerializer produce
+(tests check parity), but from ``values_list`` tuples rather than model
+instances and per-field serializer machinery. Image URLs are made absolute
+with a prefix worked out once per request, and responses are encoded with
+orjson when it is installed.
+"""
+import json
+from collections import defaultdict
+
+from django.core.files.storage import FileSystemStorage
+from django.http import HttpResponse
+from django.utils.encoding import filepath_to_uri
+
+from .models import Category, ProductColor, ProductColorImage, Products, ProductSize
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+PRODUCT_COLUMNS = (
+    'id', 'name', 'currentprice', 'orignalprice', 'description', 'is_top_product', 'is_best_seller',
+)
+
+
+def dumps(data):
+    """Compact UTF-8 JSON bytes, as DRF's JSONRenderer writes them."""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def json_response(data, status=200):
+    return HttpResponse(dumps(data), content_type='application/json', status=status)
+
+
+class MediaURLs:
+    """
+    ``request.build_absolute_uri(image.url)`` for ProductColorImage files.
+
+    For filesystem storage a URL is just the base URL plus the quoted name,
+    so the absolute prefix is computed once and each image is a string
+    concatenation. Other storages are asked per image.
+    """
+
+    def __init__(self, request=None):
+        self.request = request
+        self.storage = ProductColorImage._meta.get_field('image').storage
+        self.prefix = None
+        if isinstance(self.storage, FileSystemStorage):
+            marker = self.storage.url('_')
+            self.prefix = (request.build_absolute_uri(marker) if request else marker)[:-1]
+
+    def url(self, name):
+        if self.prefix is not None:
+            return self.prefix + filepath_to_uri(name).lstrip('/')
+        url = self.storage.url(name)
+        return self.request.build_absolute_uri(url) if self.request else url
+
+
+def product_payloads(pks, request=None):
+    """
+    ``ProductSerializer(many=True)`` output for ``pks``, in that order.
+
+    Missing products are skipped. Costs four queries however many products
+    there are, and no model instances are created.
+    """
+    pks = list(pks)
+    media = MediaURLs(request)
+
+    colors, images = defaultdict(list), {}
+    color_rows = (
+        ProductColor.objects.filter(product_id__in=pks)
+        .order_by('order', 'pk')
+        .values_list('id', 'product_id', 'color_id', 'color__name', 'color__hex_code', 'is_active')
+    )
+    for product_color_id, product_id, color_id, name, hex_code, is_active in color_rows:
+        images[product_color_id] = []
+        colors[product_id].append({
+            'color': {'id': color_id, 'name': name, 'hex_code': hex_code},
+            'is_active': is_active,
+            'images': images[product_color_id],
+        })
+
+    image_rows = (
+        ProductColorImage.objects.filter(product_color__product_id__in=pks)
+        .order_by('order', 'pk')
+        .values_list('id', 'product_color_id', 'image', 'is_default', 'order')
+    )
+    for image_id, product_color_id, image, is_default, order in image_rows:
+        images[product_color_id].append({
+            'id': image_id,
+            'image_url': media.url(image) if image else None,
+            'is_default': is_default,
+            'order': order,
+        })
+
+    sizes = defaultdict(list)
+    size_rows = (
+        ProductSize.objects.filter(product_id__in=pks)
+        .order_by('pk')
+        .values_list('product_id', 'size_id', 'size__name', 'stock', 'is_active')
+    )
+    for product_id, size_id, name, stock, is_active in size_rows:
+        sizes[product_id].append({
+            'size': {'id': size_id, 'name': name},
+            'stock': stock,
+            'is_active': is_active,
+        })
+
+    products = {}
+    for pk, name, currentprice, orignalprice, description, is_top, is_best in (
+        Products.objects.filter(pk__in=pks).values_list(*PRODUCT_COLUMNS)
+    ):
+        products[pk] = {
+            'id': pk,
+            'name': name,
+            'currentprice': currentprice,
+            'orignalprice': orignalprice,
+            'description': description,
+            'colors': colors[pk],
+            'sizes': sizes[pk],
+            'is_top_product': is_top,
+            'is_best_seller': is_best,
+        }
+    return [products[pk] for pk in pks if pk in products]
+
+
+def category_payloads(queryset=None):
+    """``CategorySerializer(many=True)`` output."""
+    queryset = Category.objects.all() if queryset is None else queryset
+    return [
+        {'id': pk, 'category': category, 'slug': slug}
+        for pk, category, slug in queryset.values_list('id', 'category', 'slug')
+    ]
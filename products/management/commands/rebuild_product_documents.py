@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from products.documents import REBUILD_BATCH_SIZE, rebuild_documents
+
+
+class Command(BaseCommand):
+    help = 'Re-render the stored JSON documents served by the product endpoints.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('ids', nargs='*', type=int, help='Product ids (default: every product)')
+        parser.add_argument('--batch-size', type=int, default=REBUILD_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        documents = rebuild_documents(options['ids'] or None, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {len(documents)} product documents in {time.perf_counter() - start:.1f}s'
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from products.stock import RELEASE_BATCH_SIZE, release_expired
+
+
+class Command(BaseCommand):
+    help = 'Return the stock of expired reservations. Safe to run from cron on several hosts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=RELEASE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        released = release_expired(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Released {released} expired reservations'))
@@ -0,0 +1,96 @@
+import django.contrib.postgres.search
+from django.db import migrations
+
+POSTGRES_INSTALL = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    """
+    CREATE OR REPLACE FUNCTION products_products_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('simple', coalesce(NEW.name, '')), 'A') ||
+            setweight(to_tsvector('simple', coalesce(NEW.description, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER products_products_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name, description ON products_products
+    FOR EACH ROW EXECUTE FUNCTION products_products_search_vector_update()
+    """,
+    'UPDATE products_products SET name = name',
+    'CREATE INDEX products_search_vector_gin ON products_products USING gin (search_vector)',
+    'CREATE INDEX products_name_trgm ON products_products USING gin (name gin_trgm_ops)',
+    'CREATE INDEX products_description_trgm ON products_products USING gin (description gin_trgm_ops)',
+]
+
+POSTGRES_UNINSTALL = [
+    'DROP INDEX IF EXISTS products_description_trgm',
+    'DROP INDEX IF EXISTS products_name_trgm',
+    'DROP INDEX IF EXISTS products_search_vector_gin',
+    'DROP TRIGGER IF EXISTS products_products_search_vector_trigger ON products_products',
+    'DROP FUNCTION IF EXISTS products_products_search_vector_update()',
+]
+
+SQLITE_INSTALL = [
+    """
+    CREATE VIRTUAL TABLE products_products_fts USING fts5(
+        name, description,
+        content='products_products', content_rowid='id', tokenize='trigram'
+    )
+    """,
+    """
+    CREATE TRIGGER products_products_fts_ai AFTER INSERT ON products_products BEGIN
+        INSERT INTO products_products_fts(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER products_products_fts_ad AFTER DELETE ON products_products BEGIN
+        INSERT INTO products_products_fts(products_products_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER products_products_fts_au AFTER UPDATE ON products_products BEGIN
+        INSERT INTO products_products_fts(products_products_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO products_products_fts(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END
+    """,
+    "INSERT INTO products_products_fts(products_products_fts) VALUES ('rebuild')",
+]
+
+SQLITE_UNINSTALL = [
+    'DROP TRIGGER IF EXISTS products_products_fts_au',
+    'DROP TRIGGER IF EXISTS products_products_fts_ad',
+    'DROP TRIGGER IF EXISTS products_products_fts_ai',
+    'DROP TABLE IF EXISTS products_products_fts',
+]
+
+
+def _run(statements_by_vendor):
+    def run(apps, schema_editor):
+        for statement in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='products',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(
+            _run({'postgresql': POSTGRES_INSTALL, 'sqlite': SQLITE_INSTALL}),
+            _run({'postgresql': POSTGRES_UNINSTALL, 'sqlite': SQLITE_UNINSTALL}),
+        ),
+    ]
@@ -0,0 +1,66 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+# Adding a NOT NULL column makes SQLite rebuild products_products, which drops
+# the FTS5 triggers from 0002; they are put back (and the index rebuilt) after
+# the rebuild, in either direction.
+SQLITE_FTS_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS products_products_fts_ai AFTER INSERT ON products_products BEGIN
+        INSERT INTO products_products_fts(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS products_products_fts_ad AFTER DELETE ON products_products BEGIN
+        INSERT INTO products_products_fts(products_products_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS products_products_fts_au AFTER UPDATE ON products_products BEGIN
+        INSERT INTO products_products_fts(products_products_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO products_products_fts(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END
+    """,
+    "INSERT INTO products_products_fts(products_products_fts) VALUES ('rebuild')",
+]
+
+
+def restore_fts_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for statement in SQLITE_FTS_TRIGGERS:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_productdocument'),
+    ]
+
+    operations = [
+        # Unapplied last, after the column is dropped again
+        migrations.RunPython(migrations.RunPython.noop, restore_fts_triggers),
+        migrations.AddField(
+            model_name='category',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='productcolor',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='products',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(restore_fts_triggers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.3 on 2026-10-18 17:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_catalog_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('reference', models.CharField(db_index=True, max_length=100)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('product_size', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='products.productsize')),
+            ],
+        ),
+    ]
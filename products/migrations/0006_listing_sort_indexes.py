@@ -0,0 +1,26 @@
+# Generated by Django 5.2.3 on 2026-10-18 17:38
+
+import django.db.models.expressions
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_stockreservation'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='products',
+            index=models.Index(fields=['currentprice', 'id'], name='products_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='products',
+            index=models.Index(fields=['category', 'currentprice', 'id'], name='products_category_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='products',
+            index=models.Index(django.db.models.expressions.CombinedExpression(models.F('orignalprice'), '-', models.F('currentprice')), models.F('id'), name='products_discount_idx'),
+        ),
+    ]
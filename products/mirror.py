@@ -0,0 +1,93 @@
+"""
+Per-process structures built from every product's name and description.
+
+The search index and the suggestion trie live in each worker's memory.
+signals.py keeps them current for the writes their own process makes;
+writes made by other processes only show up as a new catalog version in
+the shared default cache (see products/checks.py). So on every use a
+structure compares that version with the one it last synced at, and when
+it moved, re-reads the products updated since its last sync and drops the
+deleted ones.
+"""
+import threading
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .cache import catalog_version
+
+# How far before the last sync changes are re-read, so a product saved
+# before it but committed after isn't missed
+SYNC_OVERLAP = timedelta(minutes=5)
+
+
+class CatalogMirror:
+    """
+    Base for the in-memory product structures.
+
+    Subclasses hold the data and implement ``_reset`` (drop everything),
+    ``_add``/``_remove`` (one product) and ``_pks`` (products held).
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._built = False
+        self._version = None       # catalog version the data is current for
+        self._synced_at = None     # when the products it was read from were read
+
+    def build(self):
+        from .models import Products
+
+        rows = Products.objects.values_list('pk', 'name', 'description')
+        with self._lock:
+            version, started = catalog_version(), timezone.now()
+            self._reset()
+            for pk, name, description in rows.iterator():
+                self._add(pk, name, description)
+            self._built = True
+            self._version, self._synced_at = version, started
+
+    def sync(self):
+        """Catch up with the products changed (anywhere) since the last build or sync."""
+        from .models import Products
+
+        with self._lock:
+            version, started = catalog_version(), timezone.now()
+            changed = Products.objects.filter(
+                updated_at__gte=self._synced_at - SYNC_OVERLAP,
+            ).values_list('pk', 'name', 'description')
+            for pk in self._pks() - set(Products.objects.values_list('pk', flat=True)):
+                self._remove(pk)
+            for pk, name, description in changed:
+                self._remove(pk)
+                self._add(pk, name, description)
+            self._version, self._synced_at = version, started
+
+    def ensure_built(self):
+        """Build on first use, and sync whenever the catalog version moved since."""
+        version = catalog_version()
+        if self._built and version == self._version:
+            return
+        with self._lock:
+            if not self._built:
+                self.build()
+            elif version != self._version:
+                self.sync()
+
+    def update(self, pk, name, description):
+        with self._lock:
+            if not self._built:
+                return
+            self._remove(pk)
+            self._add(pk, name, description)
+
+    def remove(self, pk):
+        with self._lock:
+            if self._built:
+                self._remove(pk)
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+            self._built = False
+            self._version = self._synced_at = None
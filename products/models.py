@@ -1,4 +1,5 @@
 from django.db import models
+from django.contrib.postgres.search import SearchVectorField
 
 class Size(models.Model):
     name = models.CharField(max_length=50)
@@ -10,6 +11,7 @@ class Size(models.Model):
 class Category(models.Model):
     category = models.CharField(max_length=250)
     slug = models.SlugField(unique=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
     
     def __str__(self):
         return self.category
@@ -21,6 +23,43 @@ class Color(models.Model):
     def __str__(self):
         return self.name
 
+class ProductQuerySet(models.QuerySet):
+    def with_catalog(self, colors=True, sizes=True):
+        """
+        Prefetch everything ProductSerializer reads, in order.
+
+        Colours (with their Color), colour images and sizes (with their Size)
+        come in one query each, so any number of products costs four queries.
+        ``colors``/``sizes`` skip the prefetches a sparse listing doesn't need.
+        """
+        lookups = []
+        if colors:
+            lookups += [
+                models.Prefetch(
+                    'colors',
+                    queryset=ProductColor.objects.select_related('color').order_by('order', 'pk'),
+                ),
+                models.Prefetch(
+                    'colors__images',
+                    queryset=ProductColorImage.objects.order_by('order', 'pk'),
+                ),
+            ]
+        if sizes:
+            lookups.append(models.Prefetch(
+                'productsize_set',
+                queryset=ProductSize.objects.select_related('size').order_by('pk'),
+            ))
+        return self.prefetch_related(*lookups)
+
+    def with_card_image(self):
+        """Annotate ``card_image``: the first image of the first colour, as a storage name."""
+        return self.annotate(card_image=models.Subquery(
+            ProductColorImage.objects
+            .filter(product_color__product=models.OuterRef('pk'))
+            .order_by('product_color__order', 'product_color__pk', 'order', 'pk')
+            .values('image')[:1]
+        ))
+
 class Products(models.Model):
     category = models.ForeignKey(Category, on_delete=models.CASCADE)
     name = models.CharField(max_length=250)
@@ -31,6 +70,24 @@ class Products(models.Model):
     is_top_product = models.BooleanField(default=False)
     is_best_seller = models.BooleanField(default=False)
     sizes = models.ManyToManyField(Size, through='ProductSize')
+    # Kept current by a database trigger on PostgreSQL (see migration 0002)
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Also touched when its colours, images or sizes change (see signals.py)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    objects = ProductQuerySet.as_manager()
+    
+    class Meta:
+        # One per listing sort (products/pagination.py), each ending in id
+        # for the keyset tie-break, so sorted pages are index scans
+        indexes = [
+            models.Index(fields=['currentprice', 'id'], name='products_price_idx'),
+            models.Index(fields=['category', 'currentprice', 'id'], name='products_category_price_idx'),
+            models.Index(
+                models.F('orignalprice') - models.F('currentprice'), models.F('id'),
+                name='products_discount_idx',
+            ),
+        ]
     
     def __str__(self):
         return self.name
@@ -40,6 +97,7 @@ class ProductColor(models.Model):
     color = models.ForeignKey(Color, on_delete=models.CASCADE)
     is_active = models.BooleanField(default=True)
     order = models.PositiveIntegerField(default=0)  # नया फील्ड जोड़ें
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         unique_together = ('product', 'color')
@@ -67,4 +125,35 @@ class ProductSize(models.Model):
     is_active = models.BooleanField(default=True)
 
     class Meta:
-        unique_together = ('product', 'size')
\ No newline at end of file
+        unique_together = ('product', 'size')
+
+class ProductDocument(models.Model):
+    """
+    A product's API payloads, pre-rendered to JSON (see products/documents.py).
+    
+    ``detail`` is the ProductSerializer output and ``card`` the listing-tile
+    projection; image URLs are stored relative.
+    """
+    product = models.OneToOneField(Products, on_delete=models.CASCADE, primary_key=True, related_name='document')
+    detail = models.TextField()
+    card = models.TextField()
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Document for product {self.product_id}"
+
+class StockReservation(models.Model):
+    """
+    Stock taken off a ProductSize and held for a buyer until ``expires_at``
+    (see products/stock.py). Released reservations put their stock back;
+    committed ones were sold.
+    """
+    product_size = models.ForeignKey(ProductSize, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    # Who holds it, e.g. "cart:12"
+    reference = models.CharField(max_length=100, db_index=True)
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.quantity} x {self.product_size_id} for {self.reference}"
@@ -0,0 +1,95 @@
+import base64
+import binascii
+import json
+
+from django.db.models import F, Q
+
+# sort parameter -> (field or annotation, descending); ties are broken on pk
+# in the same direction. Each has a matching index (see Products.Meta).
+LISTING_SORTS = {
+    'id': ('pk', False),
+    'newest': ('pk', True),
+    'price': ('currentprice', False),
+    '-price': ('currentprice', True),
+    'discount': ('discount', True),
+}
+DEFAULT_SORT = 'id'
+
+# Sort keys that are expressions rather than columns
+SORT_ANNOTATIONS = {
+    'discount': F('orignalprice') - F('currentprice'),
+}
+
+
+def _encode(values):
+    payload = json.dumps(values, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def _decode(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (TypeError, ValueError, binascii.Error) as exc:
+        raise ValueError('Invalid cursor') from exc
+    if not isinstance(values, list):
+        raise ValueError('Invalid cursor')
+    return values
+
+
+def _after(field, descending, values):
+    """Rows strictly after ``values`` in (field, pk) order, as a Q."""
+    lookup = 'lt' if descending else 'gt'
+    if field == 'pk':
+        (pk,) = values
+        return Q(**{f'pk__{lookup}': pk})
+    value, pk = values
+    return Q(**{f'{field}__{lookup}': value}) | Q(**{field: value, f'pk__{lookup}': pk})
+
+
+def _keys(sort):
+    if sort not in LISTING_SORTS:
+        raise ValueError(f'Unknown sort {sort!r}')
+    field, descending = LISTING_SORTS[sort]
+    return field, descending, ('pk',) if field == 'pk' else (field, 'pk')
+
+
+def cursor_columns(sort):
+    """Model columns a queryset needs loaded for ``keyset_page`` to build cursors."""
+    field, _, _ = _keys(sort)
+    return set() if field == 'pk' or field in SORT_ANNOTATIONS else {field}
+
+
+def sort_queryset(queryset, sort):
+    """``queryset`` in the order of a LISTING_SORTS entry; ValueError for an unknown sort."""
+    field, descending, keys = _keys(sort)
+    if field in SORT_ANNOTATIONS:
+        queryset = queryset.annotate(**{field: SORT_ANNOTATIONS[field]})
+    return queryset.order_by(*(f'-{key}' if descending else key for key in keys))
+
+
+def keyset_page(queryset, sort, limit, cursor=None):
+    """
+    One page of ``queryset`` ordered by (sort field, pk), starting after ``cursor``.
+
+    Returns ``(rows, next_cursor)``; ``next_cursor`` is None on the last page.
+    The page is found with a range condition on the ordering columns rather
+    than an OFFSET, so page 1000 costs the same as page 1. ``ValueError`` for
+    an unknown sort or a cursor that is malformed or from another sort.
+    """
+    field, descending, keys = _keys(sort)
+    queryset = sort_queryset(queryset, sort)
+
+    if cursor:
+        values = _decode(cursor)
+        # The sort is part of the cursor so it can't be replayed against another ordering
+        if len(values) != len(keys) + 1 or values[0] != sort:
+            raise ValueError('Invalid cursor')
+        queryset = queryset.filter(_after(field, descending, values[1:]))
+
+    rows = list(queryset[:limit + 1])
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, _encode([sort, *(getattr(last, key) for key in keys)])
@@ -0,0 +1,103 @@
+"""
+Fuzzy scoring of a query against whole columns of prepared strings.
+
+Scores are fuzzywuzzy's ``partial_ratio``, which search has always ranked
+and thresholded by. RapidFuzz's ``partial_ratio`` tries every alignment
+fuzzywuzzy does (and more), so it never scores a string lower; it screens
+the whole column in C first, and fuzzywuzzy only rescores what passes.
+The RapidFuzz scores also bound the real ones, so callers after the best
+few can rescore best-first and stop early.
+"""
+import math
+
+import numpy
+from fuzzywuzzy import fuzz as fuzzywuzzy_fuzz
+from rapidfuzz import fuzz, process
+
+# Columns at least this long are screened with cdist across all cores
+PARALLEL_THRESHOLD = 20000
+# fuzzywuzzy rounds its scores to ints, and the two libraries' floats can differ in the last bits
+ROUNDING_SLACK = 0.5 + 1e-6
+
+
+def prepare(text):
+    """The preprocessed form every scored string is cached in."""
+    return (text or '').lower()
+
+
+def score_bound(screened):
+    """The highest score ``rescore`` can give a choice RapidFuzz scored ``screened``."""
+    return math.floor(screened + ROUNDING_SLACK)
+
+
+def screen_column(query, choices, score_cutoff=0):
+    """
+    ``{index: bound}`` for the choices that may score at least
+    ``score_cutoff``, ``bound`` being the most ``rescore`` can give them.
+    """
+    if not choices:
+        return {}
+    cutoff = max(score_cutoff - ROUNDING_SLACK, 0)
+    if len(choices) >= PARALLEL_THRESHOLD:
+        row = process.cdist(
+            [query], choices,
+            scorer=fuzz.partial_ratio, score_cutoff=cutoff,
+            dtype=numpy.float32, workers=-1,
+        )[0]
+        return {int(index): score_bound(row[index]) for index in numpy.flatnonzero(row >= cutoff)}
+
+    matches = process.extract(
+        query, choices,
+        scorer=fuzz.partial_ratio, score_cutoff=cutoff, limit=None,
+    )
+    return {index: score_bound(score) for _, score, index in matches}
+
+
+def screen_bounds(query, choices, score_cutoff=0):
+    """
+    ``screen_column`` for a whole column as a numpy array: the most ``rescore``
+    can give each choice, or 0 where it can't reach ``score_cutoff``.
+    """
+    if not choices:
+        return numpy.zeros(0, dtype=numpy.int16)
+    row = process.cdist(
+        [query], choices,
+        scorer=fuzz.partial_ratio, score_cutoff=max(score_cutoff - ROUNDING_SLACK, 0),
+        dtype=numpy.float32, workers=-1 if len(choices) >= PARALLEL_THRESHOLD else 1,
+    )[0]
+    bounds = numpy.zeros(len(choices), dtype=numpy.int16)
+    # cdist leaves 0 below the cutoff; only the rest need bounding
+    passed = numpy.flatnonzero(row)
+    bounds[passed] = numpy.floor(row[passed].astype(numpy.float64) + ROUNDING_SLACK)
+    return bounds
+
+
+def rescore(query, choice):
+    """The score search ranks and thresholds by: fuzzywuzzy's partial_ratio."""
+    return fuzzywuzzy_fuzz.partial_ratio(query, choice)
+
+
+def score_column(query, choices, score_cutoff=0):
+    """
+    Score ``query`` against a whole column of prepared strings.
+
+    Returns ``{index: score}`` for every choice scoring at least
+    ``score_cutoff``, with exactly the scores fuzzywuzzy gives.
+    """
+    query = prepare(query)
+    scores = {}
+    for index in screen_column(query, choices, score_cutoff):
+        score = rescore(query, choices[index])
+        if score >= score_cutoff:
+            scores[index] = score
+    return scores
+
+
+def best_of_columns(query, columns, score_cutoff=0):
+    """Per-row maximum of ``score_column`` over several aligned columns."""
+    best = {}
+    for column in columns:
+        for index, score in score_column(query, column, score_cutoff).items():
+            if score > best.get(index, -1):
+                best[index] = score
+    return best
@@ -0,0 +1,203 @@
+import base64
+import binascii
+import json
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.db.models.functions import Greatest
+from django.utils.module_loading import import_string
+
+from .models import Products
+from .search_index import EXACT, FUZZY, PARTIAL, SearchHit, product_index, tokenize, trigrams
+
+DEFAULT_SEARCH_BACKEND = 'products.search_backends.IndexSearchBackend'
+
+
+class BaseSearchBackend:
+    """
+    A search backend turns a query into a ranked page of ``SearchHit``.
+
+    Hits are ordered by ``SearchHit.sort_key``: tier (exact > partial
+    substring > fuzzy), then the backend's relevance score, then id.
+    Pages are taken with ``offset`` or, for cursor pagination, after the
+    last hit of the previous page (``after``). ``fuzzy=False`` restricts
+    the result to exact and partial matches, i.e. what ``icontains`` finds.
+    ``count`` may overcount the fuzzy tier where scoring every match would
+    cost more than the total is worth (see ProductSearchIndex.count).
+    """
+
+    def search(self, query, limit, fuzzy=True, offset=0, after=None):
+        raise NotImplementedError
+
+    def count(self, query, fuzzy=True):
+        raise NotImplementedError
+
+    def warm(self):
+        pass
+
+
+class IndexSearchBackend(BaseSearchBackend):
+    """In-process token/trigram index (see search_index.py)."""
+
+    def search(self, query, limit, fuzzy=True, offset=0, after=None):
+        return product_index.search(query, limit=limit, fuzzy=fuzzy, offset=offset, after=after)
+
+    def count(self, query, fuzzy=True):
+        return product_index.count(query, fuzzy=fuzzy)
+
+    def warm(self):
+        from .search_index import warm_search_index
+        warm_search_index()
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """
+    Full-text search on the stored ``Products.search_vector`` column.
+
+    Requires the GIN indexes and pg_trgm extension installed by migration
+    0002: ``icontains`` is served by the trigram indexes, word matches by the
+    tsvector index, and ``%>`` word similarity gives typo tolerance.
+    """
+
+    config = 'simple'
+
+    def _queryset(self, query, fuzzy):
+        from django.contrib.postgres.search import (
+            SearchQuery, SearchRank, TrigramWordSimilarity,
+        )
+
+        words = tokenize(query)
+        tsquery = None
+        if words:
+            tsquery = SearchQuery(
+                ' & '.join(f'{word}:*' for word in words),
+                search_type='raw',
+                config=self.config,
+            )
+
+        match = Q(name__icontains=query) | Q(description__icontains=query)
+        if fuzzy:
+            # Word (prefix) and typo matches beyond the substring ones; fuzzy tier
+            if tsquery is not None:
+                match |= Q(search_vector=tsquery)
+            match |= Q(name__trigram_word_similar=query) | Q(description__trigram_word_similar=query)
+
+        rank = Greatest(
+            TrigramWordSimilarity(query, 'name'),
+            TrigramWordSimilarity(query, 'description'),
+        )
+        if tsquery is not None:
+            rank = rank + SearchRank(F('search_vector'), tsquery)
+
+        return Products.objects.filter(match), rank
+
+    def search(self, query, limit, fuzzy=True, offset=0, after=None):
+        queryset, rank = self._queryset(query, fuzzy)
+        queryset = queryset.annotate(
+            tier=Case(
+                When(Q(name__iexact=query) | Q(description__iexact=query), then=Value(EXACT)),
+                When(Q(name__icontains=query) | Q(description__icontains=query), then=Value(PARTIAL)),
+                default=Value(FUZZY),
+                output_field=IntegerField(),
+            ),
+            rank=rank,
+        )
+        if after is not None:
+            queryset = queryset.filter(
+                Q(tier__gt=after.tier)
+                | Q(tier=after.tier, rank__lt=after.score)
+                | Q(tier=after.tier, rank=after.score, pk__gt=after.pk)
+            )
+        rows = queryset.order_by('tier', '-rank', 'pk').values_list('pk', 'tier', 'rank')
+        return [SearchHit(*row) for row in rows[offset:offset + limit]]
+
+    def count(self, query, fuzzy=True):
+        queryset, _ = self._queryset(query, fuzzy)
+        return queryset.count()
+
+
+class SQLiteFTSSearchBackend(BaseSearchBackend):
+    """
+    SQLite FTS5 search over the ``products_products_fts`` table.
+
+    The table uses the trigram tokenizer, so a quoted phrase is a
+    case-insensitive substring match and an OR of the query's trigrams
+    ranks typo'd queries by how much of the text they share. Scores are
+    bm25 with the name weighted above the description.
+    """
+
+    table = 'products_products_fts'
+    name_weight = 10.0
+    description_weight = 1.0
+
+    def _hits_sql(self, query, fuzzy):
+        """SQL selecting ``(rowid, tier, score)`` for every hit, and its params."""
+        table = self.table
+        tier = f'CASE WHEN lower(name) = %s OR lower(description) = %s THEN {EXACT} ELSE {PARTIAL} END'
+        bm25 = f'-bm25({table}, {self.name_weight}, {self.description_weight})'
+
+        if len(query) < 3:
+            # Too short for a trigram MATCH; LIKE still works, just unindexed
+            pattern = '%' + query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            substring_where = "(name LIKE %s ESCAPE '\\' OR description LIKE %s ESCAPE '\\')"
+            substring_params = [pattern, pattern]
+            substring = f'SELECT rowid, {tier} AS tier, 0.0 AS score FROM {table} WHERE {substring_where}'
+        else:
+            substring_where = f'{table} MATCH %s'
+            substring_params = ['"' + query.replace('"', '""') + '"']
+            substring = f'SELECT rowid, {tier} AS tier, {bm25} AS score FROM {table} WHERE {substring_where}'
+        sql, params = substring, [query, query, *substring_params]
+
+        grams = set()
+        for word in tokenize(query):
+            grams |= trigrams(word)
+        if fuzzy and grams:
+            expression = ' OR '.join('"' + gram.replace('"', '""') + '"' for gram in sorted(grams))
+            sql += (
+                f' UNION ALL SELECT rowid, {FUZZY} AS tier, {bm25} AS score FROM {table} '
+                f'WHERE {table} MATCH %s AND rowid NOT IN (SELECT rowid FROM {table} WHERE {substring_where})'
+            )
+            params += [expression, *substring_params]
+        return sql, params
+
+    def search(self, query, limit, fuzzy=True, offset=0, after=None):
+        query = query.lower()
+        sql, params = self._hits_sql(query, fuzzy)
+        where = ''
+        if after is not None:
+            where = 'WHERE (tier, -score, rowid) > (%s, %s, %s)'
+            params += [after.tier, -after.score, after.pk]
+        sql = f'SELECT rowid, tier, score FROM ({sql}) {where} ORDER BY tier, score DESC, rowid LIMIT %s OFFSET %s'
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [*params, limit, offset])
+            return [SearchHit(*row) for row in cursor.fetchall()]
+
+    def count(self, query, fuzzy=True):
+        sql, params = self._hits_sql(query.lower(), fuzzy)
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT count(*) FROM ({sql})', params)
+            return cursor.fetchone()[0]
+
+
+def encode_cursor(hit):
+    """Opaque cursor pointing just past ``hit``."""
+    payload = json.dumps([hit.tier, hit.score, hit.pk], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """The ``SearchHit`` a cursor was made from; ``ValueError`` if it is malformed."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        tier, score, pk = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return SearchHit(int(pk), int(tier), float(score))
+    except (TypeError, ValueError, binascii.Error) as exc:
+        raise ValueError('Invalid cursor') from exc
+
+
+@lru_cache(maxsize=None)
+def get_search_backend():
+    path = getattr(settings, 'PRODUCT_SEARCH_BACKEND', DEFAULT_SEARCH_BACKEND)
+    return import_string(path)()
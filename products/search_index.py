@@ -0,0 +1,300 @@
+import heapq
+import re
+from collections import defaultdict
+from operator import attrgetter
+from typing import NamedTuple
+
+import numpy
+
+from .mirror import CatalogMirror
+from .scoring import prepare, rescore, screen_bounds
+
+TOKEN_RE = re.compile(r'\w+')
+
+FUZZY_THRESHOLD = 70
+MAX_RESULTS = 20
+
+# Match tiers, in ranking order
+EXACT, PARTIAL, FUZZY = 0, 1, 2
+
+
+class SearchHit(NamedTuple):
+    pk: int
+    tier: int
+    score: float
+
+    @property
+    def sort_key(self):
+        return (self.tier, -self.score, self.pk)
+
+
+hit_key = attrgetter('sort_key')
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+def trigrams(token):
+    return {token[i:i + 3] for i in range(len(token) - 2)}
+
+
+class ProductSearchIndex(CatalogMirror):
+    """
+    In-memory inverted index over Products.name and description.
+
+    Tokens map to product ids, and character trigrams map to tokens, so a
+    substring query only ever touches the products that share vocabulary
+    with it. The lowercased name/description of every product is kept as
+    well, so candidates can be verified without going back to the DB, and
+    the fuzzy tier screens them as whole columns (see scoring.py).
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._docs = {}                       # pk -> (name, description), lowercased
+        self._doc_tokens = {}                 # pk -> set of tokens
+        self._postings = defaultdict(set)     # token -> set of pk
+        self._trigrams = defaultdict(set)     # trigram -> set of tokens
+        self._columns = None                  # (pks, names, descriptions), rebuilt after a change
+
+    # Maintenance (building and syncing: see CatalogMirror)
+
+    def _reset(self):
+        self._docs.clear()
+        self._doc_tokens.clear()
+        self._postings.clear()
+        self._trigrams.clear()
+        self._columns = None
+
+    def _pks(self):
+        return self._docs.keys()
+
+    def _add(self, pk, name, description):
+        name = prepare(name)
+        description = prepare(description)
+        tokens = set(tokenize(name)) | set(tokenize(description))
+        self._docs[pk] = (name, description)
+        self._doc_tokens[pk] = tokens
+        self._columns = None
+        for token in tokens:
+            posting = self._postings[token]
+            if not posting:
+                for gram in trigrams(token):
+                    self._trigrams[gram].add(token)
+            posting.add(pk)
+
+    def _remove(self, pk):
+        self._docs.pop(pk, None)
+        self._columns = None
+        for token in self._doc_tokens.pop(pk, ()):
+            posting = self._postings.get(token)
+            if posting is None:
+                continue
+            posting.discard(pk)
+            if not posting:
+                del self._postings[token]
+                for gram in trigrams(token):
+                    tokens = self._trigrams.get(gram)
+                    if tokens is not None:
+                        tokens.discard(token)
+                        if not tokens:
+                            del self._trigrams[gram]
+
+    # Lookups
+
+    def _tokens_containing(self, fragment):
+        """Vocabulary tokens that contain ``fragment`` as a substring."""
+        if len(fragment) < 3:
+            return [t for t in self._postings if fragment in t]
+        grams = trigrams(fragment)
+        tokens = None
+        for gram in grams:
+            found = self._trigrams.get(gram)
+            if not found:
+                return []
+            tokens = set(found) if tokens is None else tokens & found
+        return [t for t in tokens if fragment in t]
+
+    def _substring_candidates(self, query):
+        """
+        Superset of the products whose name or description contains ``query``.
+
+        Every word of the query has to appear inside some token of a matching
+        product, so intersecting the postings of those tokens is safe.
+        """
+        words = tokenize(query)
+        if not words:
+            return set(self._docs)
+        candidates = None
+        for word in sorted(set(words), key=len, reverse=True):
+            pks = set()
+            for token in self._tokens_containing(word):
+                pks |= self._postings[token]
+            candidates = pks if candidates is None else candidates & pks
+            if not candidates:
+                break
+        return candidates
+
+    def _column_cache(self):
+        """
+        ``(pks, names, descriptions, pk_array)`` as aligned lists (and the pks
+        as a numpy array), kept until the index changes.
+        """
+        if self._columns is None:
+            pks = list(self._docs)
+            self._columns = (
+                pks,
+                [self._docs[pk][0] for pk in pks],
+                [self._docs[pk][1] for pk in pks],
+                numpy.array(pks, dtype=numpy.int64),
+            )
+        return self._columns
+
+    def _substring_hits(self, query):
+        for pk in self._substring_candidates(query):
+            name, description = self._docs[pk]
+            if name == query or description == query:
+                yield SearchHit(pk, EXACT, 100)
+            elif query in name or query in description:
+                yield SearchHit(pk, PARTIAL, 100)
+
+    def _fuzzy_bounds(self, query):
+        """
+        The highest score each product in the column cache can have as a fuzzy
+        hit, as a numpy array (0 where it can't reach the threshold).
+        """
+        # Every product is screened: a product can be within the threshold
+        # without sharing a trigram with the query
+        _, names, descriptions, _ = self._column_cache()
+        return numpy.maximum(
+            screen_bounds(query, names, FUZZY_THRESHOLD),
+            screen_bounds(query, descriptions, FUZZY_THRESHOLD),
+        )
+
+    def _ranked_candidates(self, query, batch):
+        """
+        ``(bound, index)`` of every possible fuzzy hit, highest bound first
+        (then by pk). Picked ``batch`` (doubling) at a time with a partial
+        sort, so no more than one batch is ranked and held at once.
+        """
+        bounds = self._fuzzy_bounds(query)
+        pk_array = self._column_cache()[3]
+        candidates = numpy.flatnonzero(bounds >= FUZZY_THRESHOLD)
+        if not len(candidates):
+            return
+        # (-bound, pk) packed into one sortable (and unique) integer per candidate
+        span = int(pk_array.max()) + 1
+        keys = (100 - bounds[candidates].astype(numpy.int64)) * span + pk_array[candidates]
+        while len(keys):
+            if len(keys) > batch:
+                picked = numpy.argpartition(keys, batch - 1)[:batch]
+                chunk_keys, chunk = keys[picked], candidates[picked]
+                rest = keys > chunk_keys.max()
+                keys, candidates = keys[rest], candidates[rest]
+            else:
+                chunk_keys, chunk = keys, candidates
+                keys = keys[:0]
+            order = numpy.argsort(chunk_keys)
+            for key, index in zip(chunk_keys[order].tolist(), chunk[order].tolist()):
+                yield 100 - key // span, index
+            batch *= 2
+
+    def _fuzzy_hit(self, index, query):
+        """The fuzzy hit at ``index`` of the column cache, or None."""
+        pks, names, descriptions, _ = self._column_cache()
+        name, description = names[index], descriptions[index]
+        # Substring matches are in the exact/partial tiers already
+        if query in name or query in description:
+            return None
+        score = max(rescore(query, name), rescore(query, description))
+        if score < FUZZY_THRESHOLD:
+            return None
+        return SearchHit(pks[index], FUZZY, score)
+
+    def _top_fuzzy_hits(self, query, count, after=None):
+        """
+        The best ``count`` fuzzy hits (ranking after ``after``), best first.
+
+        Candidates are rescored in ranking order of their bound, so rescoring
+        stops once no candidate left can beat the worst hit kept.
+        """
+        pks = self._column_cache()[0]
+        kept = []  # (score, -pk, hit), worst hit first
+        for bound, index in self._ranked_candidates(query, batch=count):
+            if len(kept) == count:
+                worst_score, worst_pk = kept[0][0], -kept[0][1]
+                if bound < worst_score:
+                    break
+                if bound == worst_score and pks[index] > worst_pk:
+                    continue
+            hit = self._fuzzy_hit(index, query)
+            if hit is None or (after is not None and hit.sort_key <= after.sort_key):
+                continue
+            entry = (hit.score, -hit.pk, hit)
+            if len(kept) < count:
+                heapq.heappush(kept, entry)
+            elif entry > kept[0]:
+                heapq.heapreplace(kept, entry)
+        return sorted((hit for _, _, hit in kept), key=hit_key)
+
+    def search(self, query, limit=MAX_RESULTS, fuzzy=True, offset=0, after=None):
+        """
+        Return one page of ``SearchHit`` for ``query``.
+
+        Hits are ranked exact > partial (substring) > fuzzy, then by relevance
+        score, then by primary key. The page is the ``limit`` hits after
+        ``offset`` or, for cursor pagination, after the hit ``after``. It is
+        picked with a bounded heap, so at most ``offset + limit`` hits are held
+        at a time. The fuzzy tier is only scored when the exact and partial
+        tiers cannot fill the page, and then only as far as the page needs.
+        With ``fuzzy=False`` only exact and partial matches are returned.
+        """
+        self.ensure_built()
+        query = query.lower()
+        window = offset + limit
+
+        def after_cursor(hits):
+            if after is None:
+                return hits
+            after_key = after.sort_key
+            return (hit for hit in hits if hit.sort_key > after_key)
+
+        with self._lock:
+            top = heapq.nsmallest(window, after_cursor(self._substring_hits(query)), key=hit_key)
+            if fuzzy and len(top) < window:
+                # Every fuzzy hit ranks below every exact/partial hit
+                top += self._top_fuzzy_hits(query, window - len(top), after)
+        return top[offset:]
+
+    def count(self, query, fuzzy=True):
+        """
+        Total number of hits for ``query``, without materializing them.
+
+        The fuzzy tier is counted from the screen alone, without rescoring: a
+        substring match always screens at 100, so the screened candidates are
+        every exact/partial hit plus the possible fuzzy ones. RapidFuzz tries
+        more alignments than the rescore, so for typo queries this is an upper
+        bound, not the exact number of hits ``search`` pages through.
+        """
+        self.ensure_built()
+        query = query.lower()
+        with self._lock:
+            total = sum(1 for _ in self._substring_hits(query))
+            if fuzzy:
+                screened = int(numpy.count_nonzero(self._fuzzy_bounds(query) >= FUZZY_THRESHOLD))
+                total = max(total, screened)
+        return total
+
+
+product_index = ProductSearchIndex()
+
+
+def warm_search_index():
+    """Build the index at process start; fall back to a lazy build on failure."""
+    from django.db import DatabaseError
+
+    try:
+        product_index.build()
+    except DatabaseError:
+        pass
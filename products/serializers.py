@@ -55,5 +55,36 @@ class ProductSerializer(serializers.ModelSerializer):
                  'colors', 'sizes', 'is_top_product', 'is_best_seller']
     
     def get_colors(self, obj):
-        colors = obj.colors.all().order_by('order')
-        return ProductColorSerializer(colors, many=True, context=self.context).data
\ No newline at end of file
+        # Already ordered by 'order'; calling order_by() here would bypass
+        # the prefetch from Products.objects.with_catalog()
+        colors = obj.colors.all()
+        return ProductColorSerializer(colors, many=True, context=self.context).data
+
+# The product-tile projection of SparseProductSerializer
+CARD_FIELDS = ['id', 'name', 'currentprice', 'orignalprice', 'image_url']
+
+class SparseProductSerializer(ProductSerializer):
+    """
+    ProductSerializer cut down to the requested ``fields``; the nested
+    ``colors``/``sizes`` trees are only included when named in ``expand``.
+    
+    ``image_url`` is the card image, read from ``with_card_image()``.
+    """
+    image_url = serializers.SerializerMethodField()
+    
+    class Meta(ProductSerializer.Meta):
+        fields = ProductSerializer.Meta.fields + ['image_url']
+    
+    def __init__(self, *args, fields=(), expand=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        wanted = set(fields) | set(expand)
+        for name in list(self.fields):
+            if name not in wanted:
+                self.fields.pop(name)
+    
+    def get_image_url(self, obj):
+        if not obj.card_image:
+            return None
+        url = ProductColorImage._meta.get_field('image').storage.url(obj.card_image)
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
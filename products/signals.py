@@ -0,0 +1,107 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .cache import bump_catalog_version
+from .detail_cache import invalidate_products
+from .documents import rebuild_documents
+from .models import Category, Color, Products, ProductColor, ProductColorImage, ProductSize, Size
+from .search_index import product_index
+from .suggestions import suggestion_index
+
+
+@receiver(post_save, sender=Products)
+def index_product(sender, instance, **kwargs):
+    pk, name, description = instance.pk, instance.name, instance.description
+
+    def refresh():
+        product_index.update(pk, name, description)
+        suggestion_index.update(pk, name, description)
+
+    transaction.on_commit(refresh)
+
+
+@receiver(post_delete, sender=Products)
+def unindex_product(sender, instance, **kwargs):
+    pk = instance.pk
+
+    def refresh():
+        product_index.remove(pk)
+        suggestion_index.remove(pk)
+        invalidate_products([pk])
+
+    transaction.on_commit(refresh)
+
+
+def rebuild_documents_on_commit(pks):
+    pks = set(pks)
+
+    def refresh():
+        rebuild_documents(pks)
+        # Only once the new documents are stored, or a miss could cache the old one
+        invalidate_products(pks)
+
+    if pks:
+        transaction.on_commit(refresh)
+
+
+def products_changed(pks):
+    """Something in these products' payloads changed: touch them and re-render their documents."""
+    pks = set(pks)
+    if pks:
+        # updated_at is what the product detail ETag/Last-Modified are built from
+        Products.objects.filter(pk__in=pks).update(updated_at=timezone.now())
+        rebuild_documents_on_commit(pks)
+
+
+@receiver(post_save, sender=Products)
+def product_saved(sender, instance, **kwargs):
+    rebuild_documents_on_commit([instance.pk])
+
+
+@receiver(post_save, sender=ProductColor)
+@receiver(post_delete, sender=ProductColor)
+@receiver(post_save, sender=ProductSize)
+@receiver(post_delete, sender=ProductSize)
+def product_part_changed(sender, instance, **kwargs):
+    products_changed([instance.product_id])
+
+
+@receiver(post_save, sender=ProductColorImage)
+@receiver(post_delete, sender=ProductColorImage)
+def product_image_changed(sender, instance, **kwargs):
+    # Looked up now: the colour may be deleted along with the image
+    products_changed(
+        ProductColor.objects.filter(pk=instance.product_color_id).values_list('product_id', flat=True))
+
+
+@receiver(post_save, sender=Color)
+def color_saved(sender, instance, **kwargs):
+    products_changed(
+        ProductColor.objects.filter(color=instance).values_list('product_id', flat=True))
+
+
+@receiver(post_save, sender=Size)
+def size_saved(sender, instance, **kwargs):
+    products_changed(
+        ProductSize.objects.filter(size=instance).values_list('product_id', flat=True))
+
+
+@receiver(post_save, sender=Products)
+@receiver(post_delete, sender=Products)
+@receiver(post_save, sender=ProductColor)
+@receiver(post_delete, sender=ProductColor)
+@receiver(post_save, sender=ProductColorImage)
+@receiver(post_delete, sender=ProductColorImage)
+@receiver(post_save, sender=ProductSize)
+@receiver(post_delete, sender=ProductSize)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Size)
+@receiver(post_delete, sender=Size)
+@receiver(post_save, sender=Color)
+@receiver(post_delete, sender=Color)
+def catalog_changed(sender, **kwargs):
+    # Invalidates every payload cached against the previous catalog version
+    transaction.on_commit(bump_catalog_version)
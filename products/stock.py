@@ -0,0 +1,169 @@
+"""
+Stock reservations on ProductSize.
+
+Stock is taken with a conditional ``UPDATE ... SET stock = stock - n WHERE
+stock >= n``, so the database decides atomically whether there is enough
+and no row is read and locked first. Concurrent buyers of one size only
+queue behind each other for that single statement. ``reserve`` does that
+for every line of an order in one transaction: either all lines are held
+or none. Each held line becomes a StockReservation that ``release_expired``
+hands back once it expires, unless ``commit`` turned it into a sale first.
+
+Stock is part of the product payloads and category summaries, and the
+conditional updates send no signals, so every transaction that moves stock
+refreshes its products and bumps the catalog version once it commits.
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .cache import bump_catalog_version
+from .models import ProductSize, StockReservation
+from .signals import products_changed
+
+RESERVATION_TTL = timedelta(seconds=getattr(settings, 'STOCK_RESERVATION_TTL', 15 * 60))
+RELEASE_BATCH_SIZE = 500
+
+
+class InsufficientStock(Exception):
+    """
+    Raised by ``reserve`` when some lines can't be held.
+
+    ``shortages`` maps (product_id, size_id) to the quantity asked for.
+    """
+
+    def __init__(self, shortages):
+        self.shortages = shortages
+        super().__init__(f'Not enough stock for {len(shortages)} line(s)')
+
+
+def take(product_size_id, quantity):
+    """Take ``quantity`` off one ProductSize if it has that much; returns whether it did."""
+    return ProductSize.objects.filter(
+        pk=product_size_id, is_active=True, stock__gte=quantity,
+    ).update(stock=F('stock') - quantity) == 1
+
+
+def _put_back(quantities):
+    """``{product_size_id: quantity}`` back into stock."""
+    for product_size_id, quantity in sorted(quantities.items()):
+        ProductSize.objects.filter(pk=product_size_id).update(stock=F('stock') + quantity)
+
+
+def _stock_changed(product_size_ids):
+    """Refresh the payloads of these sizes' products once the stock change commits."""
+    product_size_ids = set(product_size_ids)
+
+    def refresh():
+        products_changed(
+            ProductSize.objects.filter(pk__in=product_size_ids).values_list('product_id', flat=True))
+        bump_catalog_version()
+
+    if product_size_ids:
+        transaction.on_commit(refresh)
+
+
+def reserve(lines, reference, ttl=RESERVATION_TTL):
+    """
+    Hold every ``(product_id, size_id, quantity)`` line for ``reference``.
+
+    All or nothing: if any line is short, nothing is held and
+    ``InsufficientStock`` lists every short line. Reservations ``reference``
+    already had are released in the same transaction, so re-reserving a
+    changed cart doesn't hold stock twice, and a re-reserve that fails
+    keeps the old hold. Returns the new StockReservations.
+    """
+    wanted = Counter()
+    for product_id, size_id, quantity in lines:
+        if quantity > 0:
+            wanted[product_id, size_id] += quantity
+    return _reserve(wanted, reference, ttl)
+
+
+@transaction.atomic
+def _reserve(wanted, reference, ttl):
+    held, released = _lock(StockReservation.objects.filter(reference=reference))
+    product_sizes = {}
+    if wanted:
+        match = Q()
+        for product_id, size_id in wanted:
+            match |= Q(product_id=product_id, size_id=size_id)
+        product_sizes = {
+            pk: (product_id, size_id)
+            for pk, product_id, size_id in ProductSize.objects.filter(match).values_list('pk', 'product_id', 'size_id')
+        }
+
+    shortages = {}
+    # One pass in primary key order, each row's old hold put back just before
+    # its new one is taken, so two reservations can't deadlock
+    for product_size_id in sorted(product_sizes.keys() | released.keys()):
+        if product_size_id in released:
+            _put_back({product_size_id: released[product_size_id]})
+        key = product_sizes.get(product_size_id)
+        if key is not None and not take(product_size_id, wanted[key]):
+            shortages[key] = wanted[key]
+    for key in wanted.keys() - set(product_sizes.values()):
+        shortages[key] = wanted[key]
+    if shortages:
+        # Rolls back whatever was taken or put back
+        raise InsufficientStock(shortages)
+
+    StockReservation.objects.filter(pk__in=held).delete()
+    _stock_changed(product_sizes.keys() | released.keys())
+    expires_at = timezone.now() + ttl
+    return StockReservation.objects.bulk_create(
+        StockReservation(
+            product_size_id=product_size_id, quantity=wanted[key],
+            reference=reference, expires_at=expires_at,
+        )
+        for product_size_id, key in product_sizes.items()
+    )
+
+
+def _lock(queryset):
+    """Lock the reservations in ``queryset``: their pks and ``{product_size_id: quantity}``."""
+    # Rows another worker is already releasing are left to it
+    rows = list(queryset.select_for_update(skip_locked=True).values_list('pk', 'product_size_id', 'quantity'))
+    quantities = Counter()
+    for _, product_size_id, quantity in rows:
+        quantities[product_size_id] += quantity
+    return [pk for pk, _, _ in rows], quantities
+
+
+def _release(queryset):
+    """Delete the reservations in ``queryset`` and return their stock; returns how many."""
+    with transaction.atomic():
+        pks, quantities = _lock(queryset)
+        if not pks:
+            return 0
+        StockReservation.objects.filter(pk__in=pks).delete()
+        _put_back(quantities)
+        _stock_changed(quantities)
+    return len(pks)
+
+
+def release(reference):
+    """Give back everything held for ``reference`` (e.g. an abandoned checkout)."""
+    return _release(StockReservation.objects.filter(reference=reference))
+
+
+def commit(reference):
+    """The order went through: ``reference``'s reservations become sales; returns how many."""
+    deleted, _ = StockReservation.objects.filter(reference=reference).delete()
+    return deleted
+
+
+def release_expired(now=None, batch_size=RELEASE_BATCH_SIZE):
+    """Give back every reservation that has expired, in batches; returns how many."""
+    now = now or timezone.now()
+    released = 0
+    while True:
+        pks = StockReservation.objects.filter(expires_at__lte=now).order_by('pk').values_list('pk', flat=True)
+        count = _release(StockReservation.objects.filter(pk__in=list(pks[:batch_size]), expires_at__lte=now))
+        if not count:
+            return released
+        released += count
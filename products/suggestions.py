@@ -0,0 +1,208 @@
+from collections import Counter
+
+from .mirror import CatalogMirror
+from .scoring import score_column
+from .search_index import tokenize
+
+MAX_SUGGESTIONS = 10
+MIN_FUZZY_LENGTH = 3
+
+
+def normalize(text):
+    return ' '.join(text.lower().split())
+
+
+class _Node:
+    __slots__ = ('children', 'terms', 'top')
+
+    def __init__(self):
+        self.children = {}
+        self.terms = set()   # term keys stored exactly at this node
+        self.top = None      # cached best term keys in this subtree
+
+
+class SuggestionIndex(CatalogMirror):
+    """
+    Autocomplete vocabulary over product names and description words.
+
+    Terms are deduplicated case-insensitively and weighted by how many
+    products use them. Names are also reachable from each of their words
+    ("Black Kurta" is found from "kur"), description words only from their
+    own start. Every trie node caches its best terms, so a lookup is a walk
+    down the trie plus a merge of a few short lists.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._root = _Node()
+        self._terms = {}          # key -> [display, weight, is_name]
+        self._contributions = {}  # product pk -> Counter of (key, display, is_name)
+
+    # Maintenance (building and syncing: see CatalogMirror)
+
+    def _reset(self):
+        self._root = _Node()
+        self._terms = {}
+        self._contributions = {}
+
+    def _pks(self):
+        return self._contributions.keys()
+
+    @staticmethod
+    def _product_terms(name, description):
+        terms = Counter()
+        name = ' '.join((name or '').split())
+        if name:
+            terms[(name.lower(), name, True)] += 1
+        for word in set(tokenize(description or '')):
+            terms[(word, word, False)] += 1
+        return terms
+
+    def _keys(self, key, is_name):
+        if not is_name:
+            return [key]
+        words = key.split(' ')
+        return [' '.join(words[i:]) for i in range(len(words))]
+
+    def _path(self, key, create=False):
+        node = self._root
+        path = [node]
+        for char in key:
+            child = node.children.get(char)
+            if child is None:
+                if not create:
+                    return None
+                child = node.children[char] = _Node()
+            node = child
+            path.append(node)
+        return path
+
+    def _touch(self, key, is_name, store=None):
+        for path_key in self._keys(key, is_name):
+            path = self._path(path_key, create=True)
+            for node in path:
+                node.top = None
+            if store is True:
+                path[-1].terms.add(key)
+            elif store is False:
+                path[-1].terms.discard(key)
+
+    def _add(self, pk, name, description):
+        terms = self._product_terms(name, description)
+        self._contributions[pk] = terms
+        for (key, display, is_name), count in terms.items():
+            entry = self._terms.get(key)
+            if entry is None:
+                self._terms[key] = [display, count, is_name]
+                self._touch(key, is_name, store=True)
+            else:
+                entry[1] += count
+                if is_name and not entry[2]:
+                    # A product name wins over a description word with the same text
+                    self._touch(key, False, store=False)
+                    entry[0], entry[2] = display, True
+                    self._touch(key, True, store=True)
+                else:
+                    self._touch(key, entry[2])
+
+    def _remove(self, pk):
+        for (key, _, _), count in self._contributions.pop(pk, Counter()).items():
+            entry = self._terms.get(key)
+            if entry is None:
+                continue
+            entry[1] -= count
+            if entry[1] <= 0:
+                del self._terms[key]
+                self._touch(key, entry[2], store=False)
+            else:
+                self._touch(key, entry[2])
+
+    # Lookups
+
+    def _rank(self, key):
+        display, weight, is_name = self._terms[key]
+        return (-weight, not is_name, key)
+
+    def _top(self, node):
+        if node.top is None:
+            found = set()
+            stack = [node]
+            while stack:
+                current = stack.pop()
+                found |= current.terms
+                stack.extend(current.children.values())
+            node.top = sorted(found, key=self._rank)[:MAX_SUGGESTIONS]
+        return node.top
+
+    def _near_nodes(self, query, max_distance=1):
+        """
+        Trie nodes whose path is within ``max_distance`` edits of ``query``.
+
+        The first character is taken as typed: it keeps the walk to one
+        branch of the trie and typos there are rare.
+        """
+        first = self._root.children.get(query[0])
+        if first is None:
+            return []
+
+        found = []
+        stack = [(first, list(range(len(query))))]
+        query = query[1:]
+        while stack:
+            node, previous = stack.pop()
+            for char, child in node.children.items():
+                row = [previous[0] + 1]
+                for i, query_char in enumerate(query, 1):
+                    row.append(min(
+                        row[i - 1] + 1,
+                        previous[i] + 1,
+                        previous[i - 1] + (query_char != char),
+                    ))
+                if row[-1] <= max_distance:
+                    found.append((row[-1], child))
+                elif min(row) <= max_distance:
+                    stack.append((child, row))
+        return found
+
+    def suggest(self, query, limit=5):
+        """Ranked display strings for terms starting with (or within one edit of) ``query``."""
+        self.ensure_built()
+        query = normalize(query)
+        limit = min(limit, MAX_SUGGESTIONS)
+        if not query:
+            return []
+
+        with self._lock:
+            results, seen = [], set()
+
+            path = self._path(query)
+            if path is not None:
+                for key in self._top(path[-1]):
+                    seen.add(key)
+                    results.append(key)
+
+            if len(results) < limit and len(query) >= MIN_FUZZY_LENGTH:
+                near = set()
+                for distance, node in self._near_nodes(query):
+                    if distance:
+                        near.update(k for k in self._top(node) if k not in seen)
+                # Closest spelling first, then the usual frequency ranking
+                near = list(near)
+                scores = score_column(query, near)
+                order = sorted(range(len(near)), key=lambda i: (-scores.get(i, 0), self._rank(near[i])))
+                results.extend(near[i] for i in order)
+
+            return [self._terms[key][0] for key in results[:limit]]
+
+
+suggestion_index = SuggestionIndex()
+
+
+def warm_suggestion_index():
+    """Build the trie at process start; fall back to a lazy build on failure."""
+    from django.db import DatabaseError
+
+    try:
+        suggestion_index.build()
+    except DatabaseError:
+        pass
@@ -1,3 +1,1309 @@
-from django.test import TestCase
+import json
+import random
+import sys
+import threading
+import time
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache as default_cache, caches
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.utils import timezone
+from django.utils.http import http_date
+from django.urls import reverse
+from fuzzywuzzy import fuzz
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from benchmarks.catalog import generate_catalog
+
+from .cache import TieredCache, bump_catalog_version, search_caches
+from .categories import category_cache
+from .checks import check_catalog_cache
+from .detail_cache import product_cache, product_detail, product_key
+from .documents import rebuild_documents
+from .facets import PRICE_BANDS, FacetedQuery, facet_cache
+from .models import Category, Color, ProductColor, ProductColorImage, Products, ProductSize, Size, StockReservation
+from .scoring import score_column
+from .search_backends import (
+    BaseSearchBackend, IndexSearchBackend, PostgresSearchBackend, SQLiteFTSSearchBackend, get_search_backend,
+)
+from .search_index import EXACT, FUZZY, FUZZY_THRESHOLD, PARTIAL, SearchHit, product_index
+from .lean import MediaURLs, category_payloads, product_payloads
+from .pagination import LISTING_SORTS, _encode, sort_queryset
+from .stock import RESERVATION_TTL, InsufficientStock, release, release_expired, reserve
+from .serializers import CARD_FIELDS, CategorySerializer, ProductSerializer, SparseProductSerializer
+from .suggestions import suggestion_index
+from .views import MAX_BATCH_SIZE
+
+
+def make_catalog(count, category=None):
+    """``count`` products, each with two colours (two images each) and two sizes."""
+    category = category or Category.objects.create(category='Kurta', slug='kurta')
+    prefix = category.slug
+    colors = [Color.objects.create(name=name) for name in ('Black', 'White')]
+    sizes = [Size.objects.create(name=name) for name in ('M', 'L')]
+    products = []
+    for index in range(count):
+        product = Products.objects.create(
+            category=category, name=f'Black Kurta {index}', slug=f'{prefix}-black-kurta-{index}',
+            currentprice=1000 + index, orignalprice=2000, description='Cotton kurta',
+        )
+        for order, color in enumerate(colors):
+            product_color = ProductColor.objects.create(product=product, color=color, order=order)
+            for image_order in range(2):
+                ProductColorImage.objects.create(
+                    product_color=product_color, image=f'product_color_images/{prefix}_{index}_{order}_{image_order}.webp',
+                    order=image_order,
+                )
+        for size in sizes:
+            ProductSize.objects.create(product=product, size=size, stock=5)
+        products.append(product)
+    return category, products
+
+
+# Names and descriptions; for "kurta": fuzzy (75), partial, none, fuzzy (80), exact, partial, exact
+RANKING_CATALOG = [
+    ('Kuta', 'Long tunic'),
+    ('Black Kurta', 'Cotton'),
+    ('Denim Jeans', 'Straight fit'),
+    ('Kurti', 'Short tunic'),
+    ('Silk Kurta', 'Kurta'),
+    ('Cotton Shirt', 'Goes with any kurta.'),
+    ('Kurta', 'Plain'),
+]
+
+
+def make_ranking_catalog():
+    category = Category.objects.create(category='Ranking', slug='ranking')
+    return [
+        Products.objects.create(
+            category=category, name=name, slug=f'ranking-{index}',
+            currentprice=1000, orignalprice=1000, description=description,
+        )
+        for index, (name, description) in enumerate(RANKING_CATALOG)
+    ]
+
+
+def old_ranking(query, products):
+    """
+    What EnhancedProductSearch returned before the index: exact, partial and
+    fuzzy matches, each in id order, the first 20 sorted by score.
+    """
+    query = query.lower()
+    exact = [p for p in products if query in (p.name.lower(), p.description.lower())]
+    partial = [
+        p for p in products
+        if p not in exact and (query in p.name.lower() or query in p.description.lower())
+    ]
+    fuzzy = [
+        p for p in products
+        if p not in exact and p not in partial and old_fuzzy_score(query, p) >= FUZZY_THRESHOLD
+    ]
+    return sorted((exact + partial + fuzzy)[:20], key=lambda p: old_fuzzy_score(query, p), reverse=True)
+
+
+def old_fuzzy_score(query, product):
+    """EnhancedProductSearch's score before the index: fuzzywuzzy, one product at a time."""
+    name_score = fuzz.partial_ratio(query.lower(), product.name.lower())
+    desc_score = fuzz.partial_ratio(query.lower(), product.description.lower()) if product.description else 0
+    return max(name_score, desc_score)
+
+
+def rendered(data):
+    """Serializer output as it reaches the client."""
+    return json.loads(JSONRenderer().render(data))
+
+
+class StubSearchBackend(BaseSearchBackend):
+    """Every product, highest id first, whatever the query."""
+
+    def search(self, query, limit, fuzzy=True, offset=0, after=None):
+        pks = Products.objects.order_by('-pk').values_list('pk', flat=True)[offset:offset + limit]
+        return [SearchHit(pk, FUZZY, 0) for pk in pks]
+
+    def count(self, query, fuzzy=True):
+        return Products.objects.count()
+
+
+class CatalogQueryBudgetTests(TestCase):
+    """Serializing products costs the same number of queries for any page size."""
+
+    # products, colours + Color, colour images, sizes + Size
+    CATALOG_QUERIES = 4
+
+    def setUp(self):
+        product_index.clear()
+        suggestion_index.clear()
+        for cache in search_caches.values():
+            cache.clear()
+        product_cache.clear()
+        default_cache.clear()
+
+    def test_render_documents(self):
+        _, products = make_catalog(3)
+        with self.assertNumQueries(self.CATALOG_QUERIES + 1):
+            rebuild_documents([product.pk for product in products])
+
+        category = Category.objects.create(category='Shirt', slug='shirt')
+        _, products = make_catalog(12, category=category)
+        with self.assertNumQueries(self.CATALOG_QUERIES + 1):
+            rebuild_documents([product.pk for product in products])
+
+    def test_product_list(self):
+        make_catalog(3)
+        # Documents not rendered yet are rendered (and stored) on the way
+        with self.assertNumQueries(1 + self.CATALOG_QUERIES + 1):
+            response = self.client.get(reverse('product-list'))
+        self.assertEqual(len(response.json()), 3)
+
+        category = Category.objects.create(category='Shirt', slug='shirt')
+        make_catalog(12, category=category)
+        rebuild_documents()
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('product-list'))
+        self.assertEqual(len(response.json()), 15)
+
+    def test_product_detail(self):
+        _, products = make_catalog(1)
+        # Rendered and stored on the way
+        with self.assertNumQueries(1 + self.CATALOG_QUERIES + 1):
+            self.client.get(reverse('product-detail', args=[products[0].pk]))
+        # Then served from the detail cache
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('product-detail', args=[products[0].pk]))
+        colors = response.json()['colors']
+        self.assertEqual([c['color']['name'] for c in colors], ['Black', 'White'])
+        self.assertEqual([i['order'] for i in colors[0]['images']], [0, 1])
+
+    def test_category_products(self):
+        category, _ = make_catalog(10)
+        rebuild_documents()
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('category-products', args=[category.pk]))
+        self.assertEqual(len(response.json()), 10)
+
+    def test_search(self):
+        make_catalog(8)
+        product_index.build()
+        with self.assertNumQueries(self.CATALOG_QUERIES):
+            response = self.client.get(reverse('product-search'), {'q': 'kurta'})
+        self.assertEqual(len(response.json()['results']), 8)
+        with self.assertNumQueries(self.CATALOG_QUERIES):
+            response = self.client.get(reverse('enhanced-product-search'), {'q': 'kurta'})
+        self.assertEqual(response.json()['count'], 8)
+
+
+class ProductDocumentTests(TestCase):
+    """Stored documents are served exactly as the serializers would render them."""
+
+    def test_documents_match_serializers(self):
+        _, products = make_catalog(4)
+        # One colour without images
+        ProductColorImage.objects.filter(product_color__product=products[1]).delete()
+        request = RequestFactory().get('/api/products/')
+        context = {'request': Request(request)}
+        rebuild_documents()
+
+        queryset = Products.objects.with_catalog().order_by('pk')
+        expected = ProductSerializer(queryset, many=True, context=context).data
+        response = self.client.get(reverse('product-list'))
+        self.assertEqual(response.json(), json.loads(JSONRenderer().render(expected)))
+
+        expected = SparseProductSerializer(
+            queryset.with_card_image(), many=True, fields=CARD_FIELDS, context=context).data
+        response = self.client.get(reverse('product-list'), {'fields': 'card', 'limit': 100})
+        self.assertEqual(response.json()['results'], json.loads(JSONRenderer().render(expected)))
+        self.assertIsNone(response.json()['results'][1]['image_url'])
+
+    def test_missing_product(self):
+        response = self.client.get(reverse('product-detail', args=[404]))
+        self.assertEqual(response.status_code, 404)
+
+
+class ProductBatchTests(TestCase):
+    """The batch endpoint returns stored documents in the order asked for."""
+
+    def setUp(self):
+        _, self.products = make_catalog(5)
+        rebuild_documents()
+
+    def get(self, ids, **params):
+        return self.client.get(reverse('product-batch'), {'ids': ids, **params})
+
+    def test_order_and_missing(self):
+        pks = [product.pk for product in self.products]
+        absent = max(pks) + 100
+        # Duplicates collapse to the first mention
+        response = self.get(f'{pks[3]},{absent},{pks[0]},{pks[3]},{pks[2]}')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual([product['id'] for product in data['results']], [pks[3], pks[0], pks[2]])
+        self.assertEqual(data['count'], 3)
+        self.assertEqual(data['missing'], [absent])
+        detail = self.client.get(reverse('product-detail', args=[pks[3]])).json()
+        self.assertEqual(data['results'][0], detail)
+
+    def test_card_fields(self):
+        pks = [product.pk for product in self.products]
+        data = self.get(f'{pks[1]},{pks[4]}', fields='card').json()
+        cards = self.client.get(reverse('product-list'), {'fields': 'card', 'limit': 100}).json()['results']
+        by_pk = {card['id']: card for card in cards}
+        self.assertEqual(data['results'], [by_pk[pks[1]], by_pk[pks[4]]])
+
+    def test_bad_requests(self):
+        too_many = ','.join(str(pk) for pk in range(1, MAX_BATCH_SIZE + 2))
+        for params in ({'ids': ''}, {'ids': '1,x'}, {'ids': too_many}, {'ids': '1', 'fields': 'name'}):
+            with self.subTest(params=params):
+                response = self.client.get(reverse('product-batch'), params)
+                self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.get(','.join(str(pk) for pk in range(1, MAX_BATCH_SIZE + 1))).status_code, 200)
+
+    def test_query_count(self):
+        # One query for the stored documents, however many ids
+        pks = ','.join(str(product.pk) for product in self.products)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get(pks).json()['count'], 5)
+        with self.assertNumQueries(1):
+            self.get(pks, fields='card')
+
+
+class ConditionalRequestTests(TestCase):
+    """Catalog and product endpoints answer revalidations with a 304, until something changes."""
+
+    def setUp(self):
+        for cache in (product_cache, category_cache, default_cache):
+            cache.clear()
+        self.category, self.products = make_catalog(2)
+        rebuild_documents()
+        self.urls = [
+            reverse('product-list'),
+            reverse('category-list'),
+            reverse('category-products', args=[self.category.pk]),
+        ]
+
+    def assertNotModified(self, url, **headers):
+        # Answered from the validators alone
+        with self.assertNumQueries(0):
+            response = self.client.get(url, headers=headers)
+        self.assertEqual(response.status_code, 304)
+
+    def assertRevalidates(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotModified(url, if_none_match=response['ETag'])
+        self.assertNotModified(url, if_modified_since=response['Last-Modified'])
+        stale = http_date(timezone.now().timestamp() - 3600)
+        self.assertEqual(self.client.get(url, headers={'if_modified_since': stale}).status_code, 200)
+        self.assertEqual(self.client.get(url, headers={'if_none_match': '"catalog-0"'}).status_code, 200)
+        return response
+
+    def test_catalog_endpoints(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                etag = self.assertRevalidates(url)['ETag']
+                bump_catalog_version()
+                response = self.client.get(url, headers={'if_none_match': etag})
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response['ETag'], etag)
+
+    def test_product_detail(self):
+        url = reverse('product-detail', args=[self.products[0].pk])
+        etag = self.assertRevalidates(url)['ETag']
+        lists = {list_url: self.client.get(list_url)['ETag'] for list_url in self.urls}
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.products[0].name = 'Maroon Kurta'
+            self.products[0].save()
+
+        response = self.client.get(url, headers={'if_none_match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['name'], 'Maroon Kurta')
+        self.assertNotModified(url, if_none_match=response['ETag'])
+        # The edit also moves the catalog on
+        for list_url, list_etag in lists.items():
+            with self.subTest(url=list_url):
+                self.assertEqual(self.client.get(list_url, headers={'if_none_match': list_etag}).status_code, 200)
+        # Other products keep theirs
+        other = reverse('product-detail', args=[self.products[1].pk])
+        self.assertNotModified(other, if_none_match=self.client.get(other)['ETag'])
+
+    def test_missing_product(self):
+        response = self.client.get(reverse('product-detail', args=[404]), headers={'if_none_match': '*'})
+        self.assertEqual(response.status_code, 404)
+
+
+class TieredCacheTests(TestCase):
+    """Single-flight misses, jittered timeouts and invalidation of both tiers."""
+
+    THREADS = 8
+
+    def setUp(self):
+        product_cache.clear()
+        default_cache.clear()
+
+    def make_cache(self, **options):
+        return TieredCache('test', max_size=100, shared_alias='default', timeout=100, local_timeout=10, **options)
+
+    def concurrently(self, cache, key, compute):
+        results, errors = [], []
+        start = threading.Barrier(self.THREADS)
+
+        def run():
+            try:
+                start.wait()
+                results.append(cache.get_or_set(key, compute))
+            except Exception as exc:  # surfaced below, threads swallow them
+                errors.append(exc)
+
+        threads = [threading.Thread(target=run) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        return results
+
+    def test_single_flight(self):
+        cache = self.make_cache(single_flight=True)
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.05)
+            return 'value'
+
+        for generation in range(1, 4):
+            self.assertEqual(self.concurrently(cache, 'key', compute), ['value'] * self.THREADS)
+            self.assertEqual(len(calls), generation)
+            # Every flight is gone once its threads are done
+            self.assertEqual(cache._flights, {})
+            cache.delete('key')
+
+    def test_negative_results(self):
+        cache = self.make_cache(single_flight=True, negative_timeout=0.2)
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.05)
+            return None
+
+        self.assertEqual(self.concurrently(cache, 'missing', compute), [None] * self.THREADS)
+        self.assertEqual(len(calls), 1)
+        self.assertIsNone(cache.get_or_set('missing', compute))
+        self.assertEqual(len(calls), 1)
+        time.sleep(0.25)
+        self.assertIsNone(cache.get_or_set('missing', compute))
+        self.assertEqual(len(calls), 2)
+
+        # Without a negative timeout None isn't kept
+        cache = self.make_cache()
+        cache.get_or_set('other', compute)
+        cache.get_or_set('other', compute)
+        self.assertEqual(len(calls), 4)
+
+    def test_jittered_timeouts(self):
+        cache = self.make_cache(jitter=0.1)
+        shared = caches['default']
+        with mock.patch.object(cache.local, 'set', wraps=cache.local.set) as local_set, \
+                mock.patch.object(shared, 'set', wraps=shared.set) as shared_set:
+            for index in range(200):
+                cache.get_or_set(f'key-{index}', lambda: 'value')
+        local = [call.args[2] for call in local_set.call_args_list]
+        shared = [call.args[2] for call in shared_set.call_args_list]
+        self.assertEqual((len(local), len(shared)), (200, 200))
+        self.assertTrue(all(9 <= timeout <= 11 for timeout in local))
+        self.assertTrue(all(90 <= timeout <= 110 for timeout in shared))
+        # Actually spread, both ways
+        self.assertLess(min(shared), 98)
+        self.assertGreater(max(shared), 102)
+
+    def test_signals_clear_both_tiers(self):
+        _, (product,) = make_catalog(1)
+        rebuild_documents()
+        key = product_key(product.pk)
+        entry = product_detail(product.pk)
+        self.assertEqual(product_cache.local.get(key), entry)
+        self.assertEqual(caches['default'].get(key), entry)
+
+        for change in ('name', 'size'):
+            with self.subTest(change=change), self.captureOnCommitCallbacks(execute=True):
+                if change == 'name':
+                    product.name = 'Maroon Kurta'
+                    product.save()
+                else:
+                    product_size = ProductSize.objects.filter(product=product).first()
+                    product_size.stock = 0
+                    product_size.save()
+            self.assertIsNone(product_cache.local.get(key))
+            self.assertIsNone(caches['default'].get(key))
+            entry = product_detail(product.pk)
+            self.assertIn('Maroon Kurta', entry.body)
+
+        # A missing product is remembered as such until it's created
+        missing = product.pk + 1
+        with self.assertNumQueries(1):
+            self.assertIsNone(product_detail(missing))
+        with self.assertNumQueries(0):
+            self.assertIsNone(product_detail(missing))
+        with self.captureOnCommitCallbacks(execute=True):
+            Products.objects.create(
+                pk=missing, category=product.category, name='Silk Kurta', slug='silk-kurta',
+                currentprice=1000, orignalprice=1000, description='',
+            )
+        self.assertIn('Silk Kurta', product_detail(missing).body)
+
+
+class KeysetPaginationTests(TestCase):
+    """Walking next_cursor visits every product once, in each sort's order."""
+
+    SORT_KEYS = {
+        'id': lambda product: product.pk,
+        'newest': lambda product: -product.pk,
+        'price': lambda product: (product.currentprice, product.pk),
+        '-price': lambda product: (-product.currentprice, -product.pk),
+        'discount': lambda product: (product.currentprice - product.orignalprice, -product.pk),
+    }
+
+    def setUp(self):
+        default_cache.clear()
+        self.category, products = make_catalog(3)
+        rng = random.Random(5)
+        # Few distinct prices, so most pages end inside a run of ties
+        for index in range(22):
+            products.append(Products.objects.create(
+                category=self.category, name=f'Kurta {index}', slug=f'keyset-{index}',
+                currentprice=rng.choice([900, 1000, 1200]), orignalprice=rng.choice([1200, 1500]),
+                description='Cotton kurta',
+            ))
+        self.products = products
+        rebuild_documents()
+
+    def walk(self, url, **params):
+        pks, cursor, pages = [], None, 0
+        while True:
+            query = {**params, 'limit': 4}
+            if cursor:
+                query['cursor'] = cursor
+            response = self.client.get(url, query)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            self.assertLessEqual(data['count'], 4)
+            self.assertEqual(data['count'], len(data['results']))
+            pks += [product['id'] for product in data['results']]
+            pages += 1
+            cursor = data['next_cursor']
+            if cursor is None:
+                return pks, data
+            self.assertLess(pages, 20)
+
+    def test_every_sort(self):
+        self.assertEqual(set(self.SORT_KEYS), set(LISTING_SORTS))
+        url = reverse('product-list')
+        for sort, key in self.SORT_KEYS.items():
+            expected = [product.pk for product in sorted(self.products, key=key)]
+            for params in ({}, {'fields': 'card'}, {'fields': 'id,name', 'expand': 'sizes'}):
+                with self.subTest(sort=sort, **params):
+                    pks, _ = self.walk(url, sort=sort, **params)
+                    self.assertEqual(pks, expected)
+
+    def test_filters_and_category(self):
+        expected = [
+            product.pk for product in sorted(self.products, key=self.SORT_KEYS['-price'])
+            if product.currentprice >= 1000
+        ]
+        pks, _ = self.walk(reverse('product-list'), sort='-price', min_price=1000)
+        self.assertEqual(pks, expected)
+        pks, _ = self.walk(reverse('category-products', args=[self.category.pk]), sort='price')
+        self.assertEqual(pks, [product.pk for product in sorted(self.products, key=self.SORT_KEYS['price'])])
+
+    def test_expand(self):
+        url = reverse('product-list')
+        product = self.products[0]
+        data = self.client.get(url, {'limit': 1, 'fields': 'id,name', 'expand': 'sizes'}).json()
+        self.assertEqual(data['results'], [{
+            'id': product.pk, 'name': product.name,
+            'sizes': [
+                {'size': {'id': size.pk, 'name': size.name}, 'stock': 5, 'is_active': True}
+                for size in Size.objects.filter(productsize__product=product).order_by('productsize__pk')
+            ],
+        }])
+        data = self.client.get(url, {'limit': 1, 'fields': 'id', 'expand': 'colors,sizes'}).json()
+        self.assertEqual(set(data['results'][0]), {'id', 'colors', 'sizes'})
+        self.assertEqual(len(data['results'][0]['colors']), 2)
+        self.assertEqual(set(self.client.get(url, {'limit': 1, 'fields': 'id,name'}).json()['results'][0]), {'id', 'name'})
+        self.assertEqual(self.client.get(url, {'limit': 1, 'expand': 'reviews'}).status_code, 400)
+
+    def test_malformed_cursor(self):
+        url = reverse('product-list')
+        first = self.client.get(url, {'sort': 'price', 'limit': 2}).json()['next_cursor']
+        for cursor in (
+            'not a cursor!', _encode({'sort': 'price'}), _encode(['price', 1000]),
+            _encode(['newest', 1000, 3]), _encode(['bogus', 1]),
+        ):
+            with self.subTest(cursor=cursor):
+                response = self.client.get(url, {'sort': 'price', 'limit': 2, 'cursor': cursor})
+                self.assertEqual(response.status_code, 400)
+        # A cursor only works with the sort it came from
+        response = self.client.get(url, {'sort': '-price', 'limit': 2, 'cursor': first})
+        self.assertEqual(response.status_code, 400)
+
+
+class LeanPayloadTests(TestCase):
+    """The serializer-free builders match the DRF serializers exactly."""
+
+    def setUp(self):
+        generate_catalog(60, seed=3)
+        # Names that need quoting in URLs
+        product_color = ProductColor.objects.first()
+        ProductColorImage.objects.create(product_color=product_color, image='product_color_images/kurta blue é.webp', order=9)
+        ProductColorImage.objects.create(product_color=product_color, image='', order=10)
+        self.request = Request(RequestFactory().get('/api/products/search/'))
+
+    def test_products(self):
+        products = list(Products.objects.with_catalog().order_by('-currentprice', 'pk'))
+        pks = [product.pk for product in products]
+        for request in (self.request, None):
+            context = {'request': request} if request else {}
+            expected = rendered(ProductSerializer(products, many=True, context=context).data)
+            self.assertEqual(rendered(product_payloads(pks, request)), expected)
+
+    def test_products_keep_order_and_skip_missing(self):
+        pks = list(Products.objects.order_by('pk').values_list('pk', flat=True)[:5])
+        payloads = product_payloads([pks[3], 999999, pks[0]])
+        self.assertEqual([payload['id'] for payload in payloads], [pks[3], pks[0]])
+
+    def test_image_urls(self):
+        media = MediaURLs(self.request)
+        for image in ProductColorImage.objects.exclude(image=''):
+            self.assertEqual(media.url(image.image.name), self.request.build_absolute_uri(image.image.url))
+
+    def test_categories(self):
+        expected = rendered(CategorySerializer(Category.objects.all(), many=True).data)
+        self.assertEqual(category_payloads(), expected)
+
+    def test_category_summaries(self):
+        category_cache.clear()
+        response = self.client.get(reverse('category-list'))
+        for summary in response.json():
+            products = Products.objects.filter(category_id=summary['id'])
+            prices = list(products.values_list('currentprice', flat=True))
+            in_stock = products.filter(productsize__is_active=True, productsize__stock__gt=0).distinct()
+            self.assertEqual(summary['product_count'], len(prices))
+            self.assertEqual(summary['min_price'], min(prices, default=None))
+            self.assertEqual(summary['max_price'], max(prices, default=None))
+            self.assertEqual(summary['in_stock_count'], in_stock.count())
+
+
+@skipUnlessDBFeature('test_db_allows_multiple_connections')
+class StockContentionTests(TransactionTestCase):
+    """Concurrent buyers racing for the same sizes never take more than there is."""
+
+    BUYERS = 12
+    ATTEMPTS = 20
+    STOCK = 50
+
+    def test_no_oversell(self):
+        _, products = make_catalog(2)
+        product_sizes = list(ProductSize.objects.filter(product__in=products).order_by('pk'))
+        ProductSize.objects.update(stock=self.STOCK)
+        # Every order wants one of each size of the first product and two of the second's
+        lines = [
+            (product_size.product_id, product_size.size_id, 1 if product_size.product_id == products[0].pk else 2)
+            for product_size in product_sizes
+        ]
+        held, refused, errors = [], [], []
+
+        def buyer(number):
+            try:
+                for attempt in range(self.ATTEMPTS):
+                    try:
+                        reserve(lines, reference=f'buyer:{number}:{attempt}')
+                        held.append(number)
+                    except InsufficientStock:
+                        refused.append(number)
+            except Exception as exc:  # surfaced below, threads swallow them
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buyer, args=(number,)) for number in range(self.BUYERS)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(errors, [])
+        attempts = self.BUYERS * self.ATTEMPTS
+        self.assertEqual(len(held) + len(refused), attempts)
+        # The second product's sizes (2 per order) run out after STOCK // 2 orders
+        self.assertEqual(len(held), self.STOCK // 2)
+        for product_size in product_sizes:
+            product_size.refresh_from_db()
+            reserved = sum(product_size.reservations.values_list('quantity', flat=True))
+            self.assertGreaterEqual(product_size.stock, 0)
+            self.assertEqual(product_size.stock + reserved, self.STOCK)
+
+        print(f'\n{attempts} reservations by {self.BUYERS} threads in {elapsed:.2f}s '
+              f'({attempts / elapsed:.0f}/s), {len(held)} held', file=sys.stderr)
+
+        # Expired reservations come back
+        self.assertEqual(release_expired(now=timezone.now() + RESERVATION_TTL), len(held) * len(lines))
+        self.assertEqual(set(ProductSize.objects.values_list('stock', flat=True)), {self.STOCK})
+
+
+class ReserveTests(TestCase):
+    """Re-reserving replaces a reference's hold in one transaction."""
+
+    def setUp(self):
+        _, (self.product,) = make_catalog(1)
+        self.sizes = list(ProductSize.objects.filter(product=self.product).order_by('pk'))
+        self.lines = [(self.product.pk, product_size.size_id, 3) for product_size in self.sizes]
+
+    def stock(self):
+        return [product_size.stock for product_size in ProductSize.objects.filter(product=self.product).order_by('pk')]
+
+    def test_rereserve_replaces_hold(self):
+        reserve(self.lines, reference='order:1')
+        self.assertEqual(self.stock(), [2, 2])
+        # Holding 3 already, 5 of the first size is still possible
+        reservations = reserve([(self.product.pk, self.sizes[0].size_id, 5)], reference='order:1')
+        self.assertEqual([(r.product_size_id, r.quantity) for r in reservations], [(self.sizes[0].pk, 5)])
+        self.assertEqual(self.stock(), [0, 5])
+        self.assertEqual(reserve([], reference='order:1'), [])
+        self.assertEqual(self.stock(), [5, 5])
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_failed_rereserve_keeps_hold(self):
+        reserve(self.lines, reference='order:1')
+        with self.assertRaises(InsufficientStock) as raised:
+            reserve([(self.product.pk, size_id, quantity * 2) for product_id, size_id, quantity in self.lines],
+                    reference='order:1')
+        self.assertEqual(set(raised.exception.shortages.values()), {6})
+        self.assertEqual(self.stock(), [2, 2])
+        self.assertEqual(
+            sorted(StockReservation.objects.filter(reference='order:1').values_list('product_size_id', 'quantity')),
+            [(product_size.pk, 3) for product_size in self.sizes],
+        )
+
+
+class StockRefreshTests(TestCase):
+    """Reserving and releasing stock refreshes every payload that shows it."""
+
+    def setUp(self):
+        for cache in (product_cache, category_cache, default_cache):
+            cache.clear()
+        _, (self.product,) = make_catalog(1)
+        rebuild_documents()
+        self.lines = [
+            (self.product.pk, size_id, 5)
+            for size_id in ProductSize.objects.filter(product=self.product).values_list('size_id', flat=True)
+        ]
+
+    def snapshot(self):
+        detail = self.client.get(reverse('product-detail', args=[self.product.pk]))
+        listing = self.client.get(reverse('product-list'))
+        categories = self.client.get(reverse('category-list'))
+        return {
+            'detail': detail['ETag'],
+            'list': listing['ETag'],
+            'stock': [size['stock'] for size in detail.json()['sizes']],
+            'listed_stock': [size['stock'] for size in listing.json()[0]['sizes']],
+            'in_stock_count': categories.json()[0]['in_stock_count'],
+        }
+
+    def assertRefreshed(self, before, stock):
+        after = self.snapshot()
+        self.assertNotEqual(after['detail'], before['detail'])
+        self.assertNotEqual(after['list'], before['list'])
+        self.assertEqual(after['stock'], [stock, stock])
+        self.assertEqual(after['listed_stock'], [stock, stock])
+        self.assertEqual(after['in_stock_count'], int(stock > 0))
+        # The old validators no longer match
+        response = self.client.get(
+            reverse('product-detail', args=[self.product.pk]), HTTP_IF_NONE_MATCH=before['detail'])
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(reverse('product-list'), HTTP_IF_NONE_MATCH=before['list'])
+        self.assertEqual(response.status_code, 200)
+        return after
+
+    def test_reserve_and_release(self):
+        before = self.snapshot()
+        self.assertEqual(before['stock'], [5, 5])
+        with self.captureOnCommitCallbacks(execute=True):
+            reserve(self.lines, reference='order:1')
+        before = self.assertRefreshed(before, 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            release('order:1')
+        self.assertRefreshed(before, 5)
+
+    def test_release_expired(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            reserve(self.lines, reference='order:1')
+        before = self.snapshot()
+        with self.captureOnCommitCallbacks(execute=True):
+            release_expired(now=timezone.now() + RESERVATION_TTL)
+        self.assertRefreshed(before, 5)
+
+    def test_failed_reservation_changes_nothing(self):
+        before = self.snapshot()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(InsufficientStock):
+                reserve([(self.product.pk, size_id, 6) for _, size_id, _ in self.lines], reference='order:1')
+        self.assertEqual(callbacks, [])
+        self.assertEqual(self.snapshot(), before)
+
+
+class ListingIndexTests(TestCase):
+    """Every listing sort and price range is an index scan, not a sort of the table."""
+
+    def setUp(self):
+        self.category, _ = make_catalog(3)
+
+    def plan(self, queryset):
+        if connection.vendor == 'postgresql':
+            # Tables this small would otherwise always be read sequentially, and
+            # an index that doesn't give the order would tie with one that does
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute('SET LOCAL enable_sort = off')
+        return queryset.explain()
+
+    def assertUsesIndex(self, queryset, index):
+        plan = self.plan(queryset)
+        self.assertIn(index, plan)
+        self.assertNotIn('TEMP B-TREE', plan)  # SQLite's sort step
+        self.assertNotIn('Sort Key', plan)
+
+    def test_sorts(self):
+        products = Products.objects.all()
+        for sort, index in [
+            ('price', 'products_price_idx'),
+            ('-price', 'products_price_idx'),
+            ('discount', 'products_discount_idx'),
+        ]:
+            with self.subTest(sort=sort):
+                self.assertUsesIndex(sort_queryset(products, sort)[:20], index)
+
+    def test_category_price(self):
+        products = Products.objects.filter(category=self.category)
+        self.assertUsesIndex(sort_queryset(products, 'price')[:20], 'products_category_price_idx')
+
+    def test_price_range(self):
+        products = Products.objects.filter(currentprice__gte=1000, currentprice__lte=1001)
+        self.assertUsesIndex(sort_queryset(products, 'price')[:20], 'products_price_idx')
+
+    def test_endpoint(self):
+        response = self.client.get(reverse('product-list'), {
+            'sort': 'discount', 'min_price': 1001, 'max_price': 1002, 'fields': 'id,currentprice',
+        })
+        # Biggest discount first
+        self.assertEqual([product['currentprice'] for product in response.json()], [1001, 1002])
+
+
+class FacetCountTests(TestCase):
+    """Facet counts and the filtered total match counting the products one by one."""
+
+    def setUp(self):
+        facet_cache.clear()
+        default_cache.clear()
+        rng = random.Random(7)
+        self.categories = [
+            Category.objects.create(category=name, slug=name.lower()) for name in ('Kurta', 'Saree', 'Lehenga')]
+        self.sizes = [Size.objects.create(name=name) for name in ('S', 'M', 'L')]
+        self.colors = [Color.objects.create(name=name) for name in ('Black', 'White', 'Red')]
+        # pk -> the attributes the facets filter on, active links only
+        self.catalog = {}
+        for index in range(40):
+            product = Products.objects.create(
+                category=rng.choice(self.categories), name=f'Product {index}', slug=f'product-{index}',
+                currentprice=rng.choice([500, 1000, 2499, 2500, 4999, 7000]), orignalprice=8000,
+                description='', is_top_product=rng.random() < 0.3, is_best_seller=rng.random() < 0.3,
+            )
+            sizes, colors = set(), set()
+            for size in rng.sample(self.sizes, rng.randint(0, 3)):
+                active = rng.random() < 0.8
+                ProductSize.objects.create(product=product, size=size, is_active=active)
+                if active:
+                    sizes.add(size.pk)
+            for color in rng.sample(self.colors, rng.randint(0, 3)):
+                active = rng.random() < 0.8
+                ProductColor.objects.create(product=product, color=color, is_active=active)
+                if active:
+                    colors.add(color.pk)
+            self.catalog[product.pk] = {
+                'category': product.category_id, 'size': sizes, 'color': colors,
+                'price': next(key for key, low, high in PRICE_BANDS
+                              if product.currentprice >= low and (high is None or product.currentprice < high)),
+                'is_top_product': product.is_top_product, 'is_best_seller': product.is_best_seller,
+            }
+
+    def expected(self, filters, pks=None):
+        """``(total, facets)`` the slow way, in the shape facet_counts returns."""
+        def matches(attributes, exclude=None):
+            for facet, values in filters.items():
+                if facet == exclude or not values:
+                    continue
+                if facet in ('is_top_product', 'is_best_seller'):
+                    if not attributes[facet]:
+                        return False
+                elif facet in ('size', 'color'):
+                    if not attributes[facet] & set(values):
+                        return False
+                elif attributes[facet] not in values:
+                    return False
+            return True
+
+        products = [attributes for pk, attributes in self.catalog.items() if pks is None or pk in pks]
+
+        def count(facet, test):
+            return sum(1 for attributes in products if matches(attributes, exclude=facet) and test(attributes))
+
+        total = sum(1 for attributes in products if matches(attributes))
+        facets = {
+            'category': [count('category', lambda a, pk=c.pk: a['category'] == pk) for c in self.categories],
+            'size': [count('size', lambda a, pk=s.pk: pk in a['size']) for s in self.sizes],
+            'color': [count('color', lambda a, pk=c.pk: pk in a['color']) for c in self.colors],
+            'price': [count('price', lambda a, key=key: a['price'] == key) for key, _, _ in PRICE_BANDS],
+            'is_top_product': count('is_top_product', lambda a: a['is_top_product']),
+            'is_best_seller': count('is_best_seller', lambda a: a['is_best_seller']),
+        }
+        return total, facets
+
+    def counts(self, faceted):
+        total, facets = faceted.facet_counts()
+        return total, {
+            'category': [value['count'] for value in facets['category']],
+            'size': [value['count'] for value in facets['size']],
+            'color': [value['count'] for value in facets['color']],
+            'price': [value['count'] for value in facets['price']],
+            'is_top_product': facets['is_top_product'],
+            'is_best_seller': facets['is_best_seller'],
+        }
+
+    def filter_sets(self):
+        category, size, color = self.categories[0].pk, self.sizes[1].pk, self.colors[0].pk
+        return [
+            {},
+            {'category': [category]},
+            {'size': [size]},
+            {'size': [size, self.sizes[2].pk], 'color': [color]},
+            {'category': [category, self.categories[1].pk], 'price': ['1000-2500', '5000+']},
+            {'color': [color], 'price': ['2500-5000'], 'is_top_product': True},
+            {'category': [category], 'size': [size], 'color': [color], 'is_best_seller': True},
+        ]
+
+    def faceted(self, filters, pks=None):
+        return FacetedQuery(
+            categories=filters.get('category', ()), sizes=filters.get('size', ()),
+            colors=filters.get('color', ()), prices=filters.get('price', ()),
+            is_top=filters.get('is_top_product', False), is_best=filters.get('is_best_seller', False),
+            pks=pks,
+        )
+
+    def test_counts(self):
+        for filters in self.filter_sets():
+            with self.subTest(filters=filters):
+                faceted = self.faceted(filters)
+                self.assertEqual(self.counts(faceted), self.expected(filters))
+                # The total is the size of the filtered listing
+                self.assertEqual(faceted.queryset().count(), self.expected(filters)[0])
+
+    def test_counts_within_pks(self):
+        pks = set(sorted(self.catalog)[::3])
+        for filters in self.filter_sets():
+            with self.subTest(filters=filters):
+                self.assertEqual(self.counts(self.faceted(filters, pks=pks)), self.expected(filters, pks=pks))
+
+    def test_endpoint(self):
+        filters = {'size': [self.sizes[1].pk], 'color': [self.colors[0].pk], 'price': ['1000-2500', '5000+']}
+        total, facets = self.expected(filters)
+        response = self.client.get(reverse('product-facets'), {
+            'size': str(self.sizes[1].pk), 'color': str(self.colors[0].pk),
+            'price': '1000-2500,5000+', 'limit': 5, 'offset': 1,
+        })
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['total'], total)
+        self.assertFalse(data['truncated'])
+        self.assertEqual([value['count'] for value in data['facets']['size']], facets['size'])
+        self.assertEqual([value['count'] for value in data['facets']['color']], facets['color'])
+        self.assertEqual([value['count'] for value in data['facets']['price']], facets['price'])
+        expected_pks = sorted(
+            pk for pk, attributes in self.catalog.items()
+            if self.sizes[1].pk in attributes['size'] and self.colors[0].pk in attributes['color']
+            and attributes['price'] in ('1000-2500', '5000+')
+        )
+        self.assertEqual(len(expected_pks), total)
+        self.assertEqual([product['id'] for product in data['results']], expected_pks[1:6])
+
+    def test_malformed_ids(self):
+        response = self.client.get(reverse('product-facets'), {'size': '1,x'})
+        self.assertEqual(response.status_code, 400)
+
+
+class SearchRankingTests(TestCase):
+    """Search ranks exact > partial > fuzzy, in the order EnhancedProductSearch always had."""
+
+    def setUp(self):
+        product_index.clear()
+        for cache in search_caches.values():
+            cache.clear()
+        default_cache.clear()
+        self.products = make_ranking_catalog()
+
+    def test_tiers(self):
+        hits = product_index.search('kurta')
+        by_name = {product.pk: product.name for product in self.products}
+        self.assertEqual(
+            [(by_name[hit.pk], hit.tier) for hit in hits],
+            [('Silk Kurta', EXACT), ('Kurta', EXACT), ('Black Kurta', PARTIAL), ('Cotton Shirt', PARTIAL),
+             ('Kurti', FUZZY), ('Kuta', FUZZY)],
+        )
+        self.assertEqual([hit.pk for hit in product_index.search('kurta', fuzzy=False)], [hit.pk for hit in hits[:4]])
+
+    def test_endpoint_matches_old_ranking(self):
+        for query in ('kurta', 'KURTA', 'Kurta', 'tunic', 'cotton', 'krta', 'jeans'):
+            with self.subTest(query=query):
+                response = self.client.get(reverse('enhanced-product-search'), {'q': query})
+                self.assertEqual(
+                    [product['id'] for product in response.json()['results']],
+                    [product.pk for product in old_ranking(query, self.products)],
+                )
+
+
+class SearchBackendTests(TestCase):
+    """PRODUCT_SEARCH_BACKEND picks the backend the search endpoints use."""
+
+    def setUp(self):
+        get_search_backend.cache_clear()
+        self.addCleanup(get_search_backend.cache_clear)
+        product_index.clear()
+        for cache in search_caches.values():
+            cache.clear()
+        default_cache.clear()
+
+    def test_selection(self):
+        for path, backend in [
+            ('products.search_backends.IndexSearchBackend', IndexSearchBackend),
+            ('products.search_backends.PostgresSearchBackend', PostgresSearchBackend),
+            ('products.search_backends.SQLiteFTSSearchBackend', SQLiteFTSSearchBackend),
+        ]:
+            with self.subTest(backend=path), self.settings(PRODUCT_SEARCH_BACKEND=path):
+                get_search_backend.cache_clear()
+                self.assertIsInstance(get_search_backend(), backend)
+
+        get_search_backend.cache_clear()
+        with self.settings():
+            del settings.PRODUCT_SEARCH_BACKEND
+            self.assertIsInstance(get_search_backend(), IndexSearchBackend)
+
+    @override_settings(PRODUCT_SEARCH_BACKEND='products.tests.StubSearchBackend')
+    def test_endpoints_use_backend(self):
+        _, products = make_catalog(3)
+        expected = [product.pk for product in reversed(products)]
+        response = self.client.get(reverse('enhanced-product-search'), {'q': 'anything', 'total': 1})
+        self.assertEqual([product['id'] for product in response.json()['results']], expected)
+        self.assertEqual(response.json()['total'], 3)
+        response = self.client.get(reverse('product-search'), {'q': 'anything'})
+        self.assertEqual([product['id'] for product in response.json()['results']], expected)
+
+    @override_settings(PRODUCT_SEARCH_BACKEND='products.tests.StubSearchBackend')
+    def test_facets_truncated(self):
+        _, products = make_catalog(3)
+        for cap, pks, truncated in [(3, products, False), (2, products[1:], True)]:
+            with self.subTest(cap=cap), mock.patch('products.views.MAX_FACET_HITS', cap):
+                data = self.client.get(reverse('product-facets'), {'q': 'anything'}).json()
+                self.assertEqual(data['truncated'], truncated)
+                # Counted over the best `cap` matches only
+                self.assertEqual(data['total'], cap)
+                self.assertEqual([product['id'] for product in data['results']], [p.pk for p in reversed(pks)])
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite FTS5 backend')
+    def test_sqlite_fts_tiers(self):
+        products = make_ranking_catalog()
+        backend = SQLiteFTSSearchBackend()
+        for query in ('kurta', 'tunic', 'cotton', 'jeans'):
+            with self.subTest(query=query):
+                # Relevance within a tier is bm25 here, so compare tiers
+                hits = backend.search(query, limit=20, fuzzy=False)
+                self.assertEqual(
+                    sorted((hit.tier, hit.pk) for hit in hits),
+                    sorted((hit.tier, hit.pk) for hit in product_index.search(query, fuzzy=False)),
+                )
+                self.assertEqual(backend.count(query, fuzzy=False), len(hits))
+        # A typo only matches in the fuzzy tier
+        hits = backend.search('kurtta', limit=20)
+        self.assertEqual({hit.tier for hit in hits}, {FUZZY})
+        self.assertIn(products[6].pk, [hit.pk for hit in hits])
+        self.assertEqual(backend.search('kurtta', limit=20, fuzzy=False), [])
+
+    @skipUnless(connection.vendor == 'postgresql', 'PostgreSQL backend')
+    def test_postgres_fuzzy_flag(self):
+        backend = PostgresSearchBackend()
+        # Without fuzzy only substring matches count, as with icontains
+        strict = str(backend._queryset('black kurta', fuzzy=False)[0].query)
+        self.assertNotIn('@@', strict)
+        self.assertNotIn('%>', strict)
+        fuzzy = str(backend._queryset('black kurta', fuzzy=True)[0].query)
+        self.assertIn('@@', fuzzy)
+        self.assertIn('%>', fuzzy)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'SQLite FTS5 triggers')
+class SQLiteFTSMigrationTests(TransactionTestCase):
+    """ORM writes reach the FTS5 index on a schema built by the real migrations."""
+
+    TRIGGERS = {'products_products_fts_ai', 'products_products_fts_ad', 'products_products_fts_au'}
+
+    def triggers(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'products_products'")
+            return {name for name, in cursor.fetchall()}
+
+    def matches(self, query):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT rowid FROM products_products_fts WHERE products_products_fts MATCH %s', [query])
+            return [pk for pk, in cursor.fetchall()]
+
+    def migrate(self, *targets):
+        MigrationExecutor(connection).migrate(list(targets))
+
+    def test_triggers_survive_migrations(self):
+        self.assertEqual(self.triggers(), self.TRIGGERS)
+        # Back past 0004's table rebuild and forward again
+        leaves = MigrationExecutor(connection).loader.graph.leaf_nodes('products')
+        self.migrate(('products', '0003_productdocument'))
+        self.assertEqual(self.triggers(), self.TRIGGERS)
+        self.migrate(*leaves)
+        self.assertEqual(self.triggers(), self.TRIGGERS)
+
+        category = Category.objects.create(category='Sherwani', slug='sherwani')
+        product = Products.objects.create(
+            category=category, name='Silk Sherwani', slug='silk-sherwani',
+            currentprice=5000, orignalprice=5000, description='Wedding wear',
+        )
+        self.assertEqual(self.matches('sherwani'), [product.pk])
+        product.name = 'Silk Achkan'
+        product.save()
+        self.assertEqual(self.matches('sherwani'), [])
+        self.assertEqual(self.matches('achkan'), [product.pk])
+        product.delete()
+        self.assertEqual(self.matches('achkan'), [])
+
+
+class SuggestionTests(TestCase):
+    """Suggestions complete word prefixes of names and descriptions and forgive one typo."""
+
+    CATALOG = [
+        ('Black Kurta', 'Cotton kurta'),
+        ('Black Kurta', 'Linen kurta'),
+        ('Black Shirt', 'Linen shirt'),
+        ('Blue Kurta', 'Khaddar kurta'),
+        ('Kurta Pajama', 'Festive set'),
+    ]
+
+    def setUp(self):
+        suggestion_index.clear()
+        search_caches['suggestions'].clear()
+        default_cache.clear()
+        category = Category.objects.create(category='Kurta', slug='kurta')
+        for index, (name, description) in enumerate(self.CATALOG):
+            Products.objects.create(
+                category=category, name=name, slug=f'suggest-{index}',
+                currentprice=1000, orignalprice=1000, description=description,
+            )
+
+    def suggest(self, query):
+        return self.client.get(reverse('search-suggestions'), {'q': query}).json()['suggestions']
+
+    def test_prefixes(self):
+        # Most used first; names are found from any of their words
+        self.assertEqual(suggestion_index.suggest('black k', limit=1), ['Black Kurta'])
+        self.assertEqual(self.suggest('Kur'), ['kurta', 'Black Kurta', 'Blue Kurta', 'Kurta Pajama'])
+        self.assertEqual(self.suggest('pajama'), ['Kurta Pajama'])
+        # Description words only from their own start
+        self.assertEqual(self.suggest('lin'), ['linen'])
+        self.assertEqual(self.suggest('nen'), [])
+        self.assertEqual(self.suggest('k'), [])
+
+    def test_typos(self):
+        self.assertEqual(self.suggest('blsck'), ['Black Kurta', 'Black Shirt'])
+        self.assertEqual(self.suggest('pjama'), ['Kurta Pajama'])
+        self.assertEqual(self.suggest('khadar'), ['khaddar'])
+        # Prefix matches come before near ones
+        self.assertEqual(self.suggest('bla'), ['Black Kurta', 'Black Shirt', 'Blue Kurta'])
+        # The first letter is taken as typed, and short queries aren't corrected
+        self.assertEqual(self.suggest('vlack'), [])
+        self.assertEqual(self.suggest('ln'), [])
+
+    def test_follows_product_changes(self):
+        suggestion_index.build()
+        product = Products.objects.get(name='Blue Kurta')
+        suggestion_index.update(product.pk, 'Navy Waistcoat', product.description)
+        self.assertEqual(suggestion_index.suggest('navy'), ['Navy Waistcoat'])
+        self.assertEqual(suggestion_index.suggest('blu'), ['Black Kurta', 'Black Shirt'])
+        suggestion_index.remove(product.pk)
+        self.assertEqual(suggestion_index.suggest('navy'), [])
+        self.assertEqual(suggestion_index.suggest('khaddar'), [])
+
+
+class FuzzyScoringParityTests(TestCase):
+    """The fuzzy tier matches and scores exactly what the per-product fuzzywuzzy loop did."""
+
+    QUERIES = [
+        'najy', 'bige', 'lnen', 'kurat', 'chifon', 'sherwni', 'wedidng', 'embroiderd shirt',
+        'slim fti', 'blok print', 'ofice', 'kameez', 'xyzzy',
+    ]
+
+    def test_score_column(self):
+        rng = random.Random(0)
+        choices = [''.join(rng.choice('abcdeilnorst ') for _ in range(rng.randint(0, 30))) for _ in range(500)]
+        # Both the extract and the cdist path
+        for parallel_threshold in (len(choices) + 1, 0):
+            with self.subTest(parallel_threshold=parallel_threshold), \
+                    mock.patch('products.scoring.PARALLEL_THRESHOLD', parallel_threshold):
+                for query in ('lnen', 'cotton', 'a', 'silk scarf'):
+                    expected = {index: fuzz.partial_ratio(query, choice) for index, choice in enumerate(choices)}
+                    self.assertEqual(score_column(query, choices), expected)
+                    self.assertEqual(
+                        score_column(query, choices, score_cutoff=FUZZY_THRESHOLD),
+                        {index: score for index, score in expected.items() if score >= FUZZY_THRESHOLD},
+                    )
+
+    def test_search(self):
+        generate_catalog(150)
+        product_index.build()
+        products = list(Products.objects.all())
+        for query in self.QUERIES:
+            expected = sorted(
+                (FUZZY, -score, product.pk)
+                for product in products
+                if query not in product.name.lower() and query not in product.description.lower()
+                for score in [old_fuzzy_score(query, product)]
+                if score >= FUZZY_THRESHOLD
+            )
+            hits = product_index.search(query, limit=len(products))
+            with self.subTest(query=query):
+                self.assertEqual([hit.sort_key for hit in hits if hit.tier == FUZZY], expected)
+
+    def test_pages(self):
+        generate_catalog(150)
+        product_index.build()
+        for query in self.QUERIES:
+            ranking = product_index.search(query, limit=1000)
+            with self.subTest(query=query):
+                for offset in (0, 7, 30):
+                    self.assertEqual(product_index.search(query, limit=5, offset=offset), ranking[offset:offset + 5])
+                walked, after = [], None
+                while True:
+                    page = product_index.search(query, limit=7, after=after)
+                    if not page:
+                        break
+                    walked += page
+                    after = page[-1]
+                self.assertEqual(walked, ranking)
+                # Exact without the fuzzy tier; with it, bounded by the screen
+                substring = [hit for hit in ranking if hit.tier != FUZZY]
+                self.assertEqual(product_index.count(query, fuzzy=False), len(substring))
+                self.assertGreaterEqual(product_index.count(query), len(ranking))
+
+    def test_ranked_candidates(self):
+        generate_catalog(150)
+        product_index.build()
+        pks = product_index._column_cache()[0]
+        for query in self.QUERIES:
+            with self.subTest(query=query):
+                bounds = product_index._fuzzy_bounds(query)
+                expected = sorted(
+                    (-int(bound), pks[index]) for index, bound in enumerate(bounds) if bound >= FUZZY_THRESHOLD)
+                # Small batches, so the walk goes through several of them
+                ranked = list(product_index._ranked_candidates(query, batch=3))
+                self.assertEqual([(-bound, pks[index]) for bound, index in ranked], expected)
+                self.assertEqual(product_index.count(query), len(expected))
+
+
+class SearchCacheInvalidationTests(TestCase):
+    """Cached search results and suggestions are dropped once a product change commits."""
+
+    def setUp(self):
+        product_index.clear()
+        suggestion_index.clear()
+        for cache in search_caches.values():
+            cache.clear()
+        default_cache.clear()
+        _, self.products = make_catalog(2)
+
+    def get(self, name, query):
+        return self.client.get(reverse(name), {'q': query}).json()
+
+    def test_rename(self):
+        self.assertEqual(self.get('enhanced-product-search', 'sherwani')['count'], 0)
+        self.assertEqual(self.get('product-search', 'sherwani')['results'], [])
+        self.assertEqual(self.get('search-suggestions', 'sherw')['suggestions'], [])
+        # Served from the caches now
+        with self.assertNumQueries(0):
+            self.get('enhanced-product-search', 'sherwani')
+            self.get('search-suggestions', 'sherw')
+
+        product = self.products[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            product.name = 'Maroon Sherwani'
+            product.save()
+
+        self.assertEqual([p['id'] for p in self.get('enhanced-product-search', 'sherwani')['results']], [product.pk])
+        self.assertEqual([p['id'] for p in self.get('product-search', 'sherwani')['results']], [product.pk])
+        self.assertEqual(self.get('search-suggestions', 'sherw')['suggestions'], ['Maroon Sherwani'])
+
+    def test_delete(self):
+        self.assertEqual(self.get('enhanced-product-search', 'kurta')['count'], 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.products[1].delete()
+        self.assertEqual(
+            [p['id'] for p in self.get('enhanced-product-search', 'kurta')['results']], [self.products[0].pk])
+
+
+class CatalogSyncTests(TestCase):
+    """The per-process search structures catch up with writes made by other processes."""
+
+    def setUp(self):
+        default_cache.clear()
+        _, self.products = make_catalog(3)
+        product_index.build()
+        suggestion_index.build()
+
+    def test_sync_on_version_change(self):
+        first, second, third = self.products
+        # on_commit never runs inside a TestCase, so like another process's
+        # writes, these don't reach this process's index through signals
+        first.name = 'Maroon Sherwani'
+        first.save()
+        second.delete()
+        with self.assertNumQueries(0):
+            self.assertEqual(product_index.search('sherwani'), [])
+
+        bump_catalog_version()
+        self.assertEqual([hit.pk for hit in product_index.search('sherwani')], [first.pk])
+        self.assertEqual([hit.pk for hit in product_index.search('black kurta', fuzzy=False)], [third.pk])
+        self.assertEqual(suggestion_index.suggest('sherw'), ['Maroon Sherwani'])
+        self.assertEqual(suggestion_index.suggest('black kurta'), ['Black Kurta 2'])
+        with self.assertNumQueries(0):
+            product_index.search('sherwani')
+
+    def test_shared_cache_required_with_several_workers(self):
+        locmem = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+        shared = {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'catalog_cache'}
+        for configured, workers, errors in [
+            ({'default': locmem}, 4, ['products.E001']),
+            ({'default': locmem}, 1, []),
+            ({'default': shared}, 4, []),
+        ]:
+            with self.subTest(caches=configured, workers=workers), \
+                    self.settings(CACHES=configured, WEB_CONCURRENCY=workers):
+                self.assertEqual([error.id for error in check_catalog_cache(None)], errors)
@@ -11,6 +11,8 @@ urlpatterns = [
     # Product URLs
     path('api/products/', ProductListAPIView.as_view(), name='product-list'),
     path('api/products/<int:pk>/', ProductDetailAPIView.as_view(), name='product-detail'),
+    path('api/products/facets/', views.FacetedProductListAPIView.as_view(), name='product-facets'),
+    path('api/products/batch/', views.ProductBatchAPIView.as_view(), name='product-batch'),
     
     # Category URLs
     path('api/categories/', CategoryListAPIView.as_view(), name='category-list'),
@@ -19,6 +21,7 @@ urlpatterns = [
     path('api/products/search/', views.product_search, name='product-search'),
     path('api/products/enhanced-search/', EnhancedProductSearch.as_view(), name='enhanced-product-search'),
     path('api/search/suggestions/', views.get_search_suggestions, name='search-suggestions'),
+    path('api/search/cache-stats/', views.SearchCacheStatsAPIView.as_view(), name='search-cache-stats'),
     path('api/categories/<int:category_id>/products/', CategoryProductsAPIView.as_view(), name='category-products'),
     
 ]
\ No newline at end of file
@@ -1,13 +1,40 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.permissions import IsAdminUser
 from django.http import JsonResponse
-from django.db.models import Q, F, Value, CharField
-from django.db.models.functions import Concat, Greatest, Coalesce
+from django.db.models import F
 from .models import Products, Category
-from .serializers import ProductSerializer, CategorySerializer
-from fuzzywuzzy import fuzz
-import re
+from .serializers import SparseProductSerializer, CARD_FIELDS
+from .search_index import MAX_RESULTS
+from .search_backends import get_search_backend, encode_cursor, decode_cursor
+from .suggestions import suggestion_index
+from .cache import search_caches, normalize_query, catalog_version
+from .facets import FacetedQuery
+from .categories import category_summaries
+from .conditional import catalog_conditional, product_conditional, product_entry
+from .documents import document_response, fill_missing, json_array
+from .lean import json_response, product_payloads
+from .pagination import DEFAULT_SORT, LISTING_SORTS, cursor_columns, keyset_page, sort_queryset
+import json
+
+# Search pagination bounds: a page never needs more than
+# MAX_SEARCH_OFFSET + MAX_PAGE_SIZE ranked hits in memory
+MAX_PAGE_SIZE = 100
+MAX_SEARCH_OFFSET = 1000
+# Facets with q are counted over at most this many search matches; past it
+# the response says truncated
+MAX_FACET_HITS = MAX_SEARCH_OFFSET + MAX_PAGE_SIZE
+
+# Sparse fieldsets for listings: fields= picks top-level fields, expand= adds
+# the nested colour/size trees. fields=card is the product-tile projection.
+LISTING_FIELDS = {
+    'id', 'name', 'currentprice', 'orignalprice', 'description',
+    'is_top_product', 'is_best_seller', 'image_url',
+}
+LISTING_EXPANDS = {'colors', 'sizes'}
+
+MAX_BATCH_SIZE = 50
 
 def product_search(request):
     query = request.GET.get('q', '').strip()
@@ -15,21 +42,18 @@ def product_search(request):
     if not query:
         return JsonResponse({'status': 'error', 'message': 'Empty search query'})
     
-    # Basic search with name and description
-    products = Products.objects.filter(
-        Q(name__icontains=query) | 
-        Q(description__icontains=query)
-    ).distinct()[:20]  # Limit to 20 results
+    normalized = normalize_query(query)
     
-    serializer = ProductSerializer(
-        products, 
-        many=True, 
-        context={'request': request}
-    )
+    def compute():
+        # Name/description matches from the configured search backend
+        hits = get_search_backend().search(normalized, limit=MAX_RESULTS, fuzzy=False)
+        return product_payloads([hit.pk for hit in hits], request)
     
-    return JsonResponse({
+    cache = search_caches['product_search']
+    key = cache.make_key(normalized, MAX_RESULTS, request.build_absolute_uri('/'))
+    return json_response({
         'status': 'success',
-        'results': serializer.data
+        'results': cache.get_or_set(key, compute)
     })
 
 class EnhancedProductSearch(APIView):
@@ -42,104 +66,173 @@ class EnhancedProductSearch(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Basic search with name and description
-        base_queryset = Products.objects.annotate(
-            search_text=Concat(
-                'name', Value(' '), 'description',
-                output_field=CharField()
+        try:
+            limit = int(request.GET.get('limit', MAX_RESULTS))
+            offset = int(request.GET.get('offset', 0))
+            cursor = request.GET.get('cursor')
+            after = decode_cursor(cursor) if cursor else None
+        except ValueError:
+            return Response(
+                {"status": "error", "message": "Invalid pagination parameters"},
+                status=status.HTTP_400_BAD_REQUEST
             )
-        )
-        
-        # Exact matches first
-        exact_matches = base_queryset.filter(
-            Q(name__iexact=query) | 
-            Q(description__iexact=query)
-        )
-        
-        # Partial matches
-        partial_matches = base_queryset.filter(
-            Q(name__icontains=query) | 
-            Q(description__icontains=query)
-        ).exclude(pk__in=exact_matches.values('pk'))
-        
-        # Fuzzy matches using fuzzywuzzy
-        all_products = list(base_queryset.all())
-        fuzzy_threshold = 70  # Adjust this based on your needs
-        
-        def calculate_score(product, query):
-            name_score = fuzz.partial_ratio(query.lower(), product.name.lower())
-            desc_score = fuzz.partial_ratio(query.lower(), product.description.lower()) if product.description else 0
-            return max(name_score, desc_score)
-        
-        fuzzy_matched = [
-            p for p in all_products 
-            if calculate_score(p, query) >= fuzzy_threshold and 
-               p.pk not in exact_matches.values_list('pk', flat=True) and
-               p.pk not in partial_matches.values_list('pk', flat=True)
-        ]
-        
-        # Combine results with priority: exact > partial > fuzzy
-        results = list(exact_matches) + list(partial_matches) + fuzzy_matched
+        if not 1 <= limit <= MAX_PAGE_SIZE or not 0 <= offset <= MAX_SEARCH_OFFSET:
+            return Response(
+                {"status": "error", "message": f"limit must be 1-{MAX_PAGE_SIZE} and offset 0-{MAX_SEARCH_OFFSET}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        with_total = request.GET.get('total') in ('1', 'true')
         
-        # Limit results and remove duplicates
-        seen_ids = set()
-        unique_results = []
-        for product in results:
-            if product.pk not in seen_ids:
-                seen_ids.add(product.pk)
-                unique_results.append(product)
-            if len(unique_results) >= 20:
-                break
+        normalized = normalize_query(query)
         
-        # Add relevance score to each product
-        for product in unique_results:
-            product.relevance_score = calculate_score(product, query)
+        def compute():
+            # One ranked page (exact > partial > fuzzy) from the search backend;
+            # only the products on it are loaded from the DB
+            backend = get_search_backend()
+            hits = backend.search(normalized, limit=limit, offset=offset, after=after)
+            return {
+                'results': product_payloads([hit.pk for hit in hits], request),
+                'next_cursor': encode_cursor(hits[-1]) if len(hits) == limit else None,
+                'total': backend.count(normalized) if with_total else None,
+            }
         
-        # Sort by relevance score (highest first)
-        unique_results.sort(key=lambda x: x.relevance_score, reverse=True)
+        cache = search_caches['enhanced_search']
+        key = cache.make_key(normalized, limit, offset, cursor, with_total, request.build_absolute_uri('/'))
+        page = cache.get_or_set(key, compute)
         
-        serializer = ProductSerializer(
-            unique_results,
-            many=True,
-            context={'request': request}
-        )
-        
-        return Response({
+        response = {
             'status': 'success',
-            'count': len(unique_results),
-            'results': serializer.data,
-            'query': query
-        })
+            'count': len(page['results']),
+            'results': page['results'],
+            'query': query,
+            'next_cursor': page['next_cursor'],
+        }
+        if with_total:
+            response['total'] = page['total']
+        return json_response(response)
     
 
-from fuzzywuzzy import fuzz
-from django.http import JsonResponse
-from django.db.models import Q
-
 def get_search_suggestions(request):
     query = request.GET.get('q', '').strip().lower()
     if not query or len(query) < 2:
         return JsonResponse({'suggestions': []})
     
-    # Get all product names and descriptions
-    products = Products.objects.all().values('name', 'description')
+    normalized = normalize_query(query)
+    limit = 5
     
-    suggestions = set()
-    
-    for product in products:
-        # Check name matches
-        if fuzz.partial_ratio(query, product['name'].lower()) > 70:
-            suggestions.add(product['name'])
-        
-        # Check description keywords
-        if product['description']:
-            for word in product['description'].split():
-                if fuzz.ratio(query, word.lower()) > 80:
-                    suggestions.add(word)
+    # Prefix / near-prefix lookup in the precomputed vocabulary trie
+    cache = search_caches['suggestions']
+    suggestions = cache.get_or_set(
+        cache.make_key(normalized, limit),
+        lambda: suggestion_index.suggest(normalized, limit=limit),
+    )
+    return JsonResponse({'suggestions': suggestions})
+
+
+class SearchCacheStatsAPIView(APIView):
+    """Hit ratios of the search result caches, for sizing SEARCH_CACHE_SIZE."""
+    permission_classes = [IsAdminUser]
     
-    return JsonResponse({'suggestions': list(suggestions)[:5]})
+    def get(self, request):
+        return Response({
+            'catalog_version': catalog_version(),
+            'caches': {name: cache.stats() for name, cache in search_caches.items()},
+        })
+
 
+def _split(value):
+    return [part.strip() for part in value.split(',') if part.strip()] if value else []
+
+def product_listing(request, queryset, context=None):
+    """
+    Response for a product listing, honouring fields/expand, sort
+    (LISTING_SORTS), min_price/max_price and, when limit or cursor is
+    given, keyset pagination.
+    
+    Without limit/cursor the whole listing is returned as a bare list, as
+    before; with them the response is a page plus ``next_cursor``.
+    """
+    params = request.query_params
+    context = context or {}
+    try:
+        fields = _split(params.get('fields'))
+        if fields == ['card']:
+            fields = CARD_FIELDS
+        expand = _split(params.get('expand'))
+        if set(fields) - LISTING_FIELDS or set(expand) - LISTING_EXPANDS:
+            raise ValueError('Unknown field')
+        sort = params.get('sort', DEFAULT_SORT)
+        if sort not in LISTING_SORTS:
+            raise ValueError('Unknown sort')
+        if 'min_price' in params:
+            queryset = queryset.filter(currentprice__gte=int(params['min_price']))
+        if 'max_price' in params:
+            queryset = queryset.filter(currentprice__lte=int(params['max_price']))
+        paginate = 'limit' in params or 'cursor' in params
+        limit = int(params.get('limit', MAX_RESULTS))
+    except ValueError:
+        return Response(
+            {"status": "error", "message": "Invalid fields, expand, sort, price or limit parameter"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        return Response(
+            {"status": "error", "message": f"limit must be 1-{MAX_PAGE_SIZE}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    # Full and card listings are spliced together from stored product
+    # documents; other projections go through SparseProductSerializer
+    variant = None
+    if not expand and (not fields or fields == CARD_FIELDS):
+        variant = 'card' if fields else 'detail'
+    
+    # Only load the columns and relations that will be used
+    sort_columns = cursor_columns(sort)
+    if variant:
+        queryset = queryset.only('id', *sort_columns).annotate(
+            stored_document=F(f'document__{variant}'))
+    else:
+        fields = fields or sorted(LISTING_FIELDS - {'image_url'})
+        columns = sort_columns | set(fields) - {'image_url'}
+        queryset = queryset.only('id', *columns).with_catalog(
+            colors='colors' in expand, sizes='sizes' in expand)
+        if 'image_url' in fields:
+            queryset = queryset.with_card_image()
+    
+    if not paginate:
+        if 'sort' in params:
+            queryset = sort_queryset(queryset, sort)
+        page, next_cursor = queryset, None
+    else:
+        try:
+            page, next_cursor = keyset_page(queryset, sort, limit, params.get('cursor'))
+        except ValueError:
+            return Response(
+                {"status": "error", "message": "Invalid cursor"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+    
+    if variant:
+        documents = fill_missing([(product.pk, product.stored_document) for product in page], variant)
+        body = json_array(documents)
+        if paginate:
+            body = '{"status":"success","count":%d,"results":%s,"next_cursor":%s}' % (
+                len(documents), body, json.dumps(next_cursor))
+        return document_response(body, context.get('request'))
+    
+    results = SparseProductSerializer(
+        page, many=True, fields=fields, expand=expand, context=context).data
+    if not paginate:
+        return Response(results)
+    return Response({
+        'status': 'success',
+        'count': len(results),
+        'results': results,
+        'next_cursor': next_cursor,
+    })
 
+@catalog_conditional
 class ProductListAPIView(APIView):
     def get(self, request):
         queryset = Products.objects.all()
@@ -151,34 +244,121 @@ class ProductListAPIView(APIView):
         if is_best:
             queryset = queryset.filter(is_best_seller=True)
         
-        serializer = ProductSerializer(queryset, many=True, context={'request': request})
-        return Response(serializer.data)
+        return product_listing(request, queryset, context={'request': request})
 
+class FacetedProductListAPIView(APIView):
+    """
+    Filtered product listing/search with counts for every facet value.
+    
+    Filters: q, category, size, color (comma-separated ids), price
+    (comma-separated PRICE_BANDS keys), is_top, is_best; paged with
+    limit/offset.
+    
+    With q, counts and total cover the best MAX_FACET_HITS search matches;
+    ``truncated`` is true when the query matched more than that.
+    """
+    def get(self, request):
+        params = request.query_params
+        query = params.get('q', '').strip()
+        try:
+            limit = int(params.get('limit', MAX_RESULTS))
+            offset = int(params.get('offset', 0))
+            pks = None
+            truncated = False
+            if query:
+                # Facets over the (bounded) set of search matches; one extra
+                # hit tells us whether anything was left out
+                hits = get_search_backend().search(normalize_query(query), limit=MAX_FACET_HITS + 1)
+                truncated = len(hits) > MAX_FACET_HITS
+                pks = [hit.pk for hit in hits[:MAX_FACET_HITS]]
+            faceted = FacetedQuery.from_params(params, pks=pks)
+        except ValueError:
+            return Response(
+                {"status": "error", "message": "Invalid filter or pagination parameters"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not 1 <= limit <= MAX_PAGE_SIZE or offset < 0:
+            return Response(
+                {"status": "error", "message": f"limit must be 1-{MAX_PAGE_SIZE} and offset >= 0"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        total, facets = faceted.facet_counts()
+        
+        if pks is None:
+            page_pks = list(faceted.queryset().order_by('pk').values_list('pk', flat=True)[offset:offset + limit])
+        else:
+            # Keep search ranking order
+            matching = set(faceted.queryset().values_list('pk', flat=True))
+            page_pks = [pk for pk in pks if pk in matching][offset:offset + limit]
+        page = product_payloads(page_pks, request)
+        
+        return json_response({
+            'status': 'success',
+            'total': total,
+            'truncated': truncated,
+            'count': len(page),
+            'results': page,
+            'facets': facets,
+        })
+
+@product_conditional
 class ProductDetailAPIView(APIView):
     def get(self, request, pk):
-        try:
-            product = Products.objects.get(pk=pk)
-            serializer = ProductSerializer(product, context={'request': request})
-            return Response(serializer.data)
-        except Products.DoesNotExist:
+        # Cached stored document, already looked up for the ETag
+        entry = product_entry(request, pk)
+        if entry is None:
             return Response(
                 {"error": "Product not found"},
                 status=status.HTTP_404_NOT_FOUND
             )
+        return document_response(entry.body, request)
+
+@catalog_conditional
+class ProductBatchAPIView(APIView):
+    """
+    Several products in one response: ``?ids=3,1,2`` (at most MAX_BATCH_SIZE),
+    optionally ``fields=card``.
+    
+    Results come back in the requested order from one query of stored
+    documents; ids that don't exist are listed under ``missing``.
+    """
+    def get(self, request):
+        params = request.query_params
+        try:
+            ids = list(dict.fromkeys(int(part) for part in _split(params.get('ids'))))
+        except ValueError:
+            ids = None
+        fields = params.get('fields')
+        if not ids or len(ids) > MAX_BATCH_SIZE or fields not in (None, 'card'):
+            return Response(
+                {"status": "error", "message": f"ids must be 1-{MAX_BATCH_SIZE} comma-separated product ids; fields may only be 'card'"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        variant = 'card' if fields else 'detail'
+        
+        stored = dict(Products.objects.filter(pk__in=ids).values_list('pk', f'document__{variant}'))
+        rows = [(pk, stored[pk]) for pk in ids if pk in stored]
+        documents = fill_missing(rows, variant)
+        found = {pk for pk, _ in rows}
+        missing = [pk for pk in ids if pk not in found]
+        
+        body = '{"status":"success","count":%d,"results":%s,"missing":%s}' % (
+            len(documents), json_array(documents), json.dumps(missing))
+        return document_response(body, request)
 
+@catalog_conditional
 class CategoryListAPIView(APIView):
     def get(self, request):
-        categories = Category.objects.all()
-        serializer = CategorySerializer(categories, many=True)
-        return Response(serializer.data)
+        return json_response(category_summaries())
 
+@catalog_conditional
 class CategoryProductsAPIView(APIView):
     def get(self, request, category_id):
         try:
             category = Category.objects.get(pk=category_id)
             products = Products.objects.filter(category=category)
-            serializer = ProductSerializer(products, many=True)
-            return Response(serializer.data)
+            return product_listing(request, products)
         except Category.DoesNotExist:
             return Response(
                 {"error": "Category not found"},